@@ -288,6 +288,25 @@ class UserPointsResponse(UserPointsBase):
     created_at: datetime
 
 
+class PointsAward(BaseModel):
+    user_id: int
+    source: str
+    source_id: Optional[int] = None
+    description: Optional[str] = None
+
+
+class BulkPointsRequest(BaseModel):
+    awards: List[PointsAward] = Field(..., min_length=1, max_length=5000, description="Awards to apply at once")
+
+
+class BulkPointsResponse(BaseModel):
+    requested: int
+    awarded: int
+    duplicates: int
+    users_updated: int
+    total_points: int
+
+
 class UserStatsResponse(BaseModel):
     user_id: int
     level: int
@@ -0,0 +1,190 @@
+import bisect
+import threading
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app.domain.models import LeaderboardChange, User, UserBadge, UserLevel
+
+PENDING_KEY = "leaderboard_pending"
+# Past this many changed users one rebuild is cheaper than re-reading each
+MAX_REFRESHED_USERS = 1000
+
+
+@dataclass
+class Standing:
+    user_id: int
+    total_points: int
+    level: int
+    badges_count: int
+
+
+class Leaderboard:
+    
+    # Keys are (-total_points, user_id) in a sorted list: bisect finds a
+    # user's rank in O(log n) and top-N / neighbors are slices around it
+    def __init__(self):
+        self._keys: List[Tuple[int, int]] = []
+        self._standings: Dict[int, Standing] = {}
+        self._lock = threading.RLock()
+        self.loaded = False
+        # Last database version read; see LeaderboardChange
+        self.version: Optional[int] = None
+    
+    @staticmethod
+    def _version(db: Session) -> int:
+        # The max of an indexed column, so checking it on every read is O(log n)
+        return db.scalar(select(func.max(LeaderboardChange.version))) or 0
+    
+    def rebuild(self, db: Session):
+        version = self._version(db)
+        badges = select(
+            UserBadge.user_id,
+            func.count(UserBadge.id).label("badges_count")
+        ).group_by(UserBadge.user_id).subquery()
+        rows = db.query(
+            UserLevel.user_id,
+            UserLevel.total_points,
+            UserLevel.level,
+            badges.c.badges_count
+        ).join(User, User.id == UserLevel.user_id)\
+         .outerjoin(badges, badges.c.user_id == UserLevel.user_id).all()
+        
+        standings = {
+            user_id: Standing(user_id, total_points or 0, level or 1, badges_count or 0)
+            for user_id, total_points, level, badges_count in rows
+        }
+        with self._lock:
+            self._standings = standings
+            self._keys = sorted((-standing.total_points, user_id) for user_id, standing in standings.items())
+            self.loaded = True
+            self.version = version
+    
+    def refresh(self, db: Session):
+        # Each API process has its own board and the outbox worker may run
+        # elsewhere: catch up with whatever changed since the last look
+        version = self._version(db)
+        with self._lock:
+            loaded, previous = self.loaded, self.version
+        if loaded and version == previous:
+            return
+        if not loaded:
+            self.rebuild(db)
+            return
+        
+        # Re-read only the users changed since, whoever changed them
+        changed = set(db.scalars(
+            select(LeaderboardChange.user_id).where(LeaderboardChange.version > previous)
+        ))
+        if len(changed) > MAX_REFRESHED_USERS:
+            self.rebuild(db)
+            return
+        badges_count = select(func.count(UserBadge.id)).where(
+            UserBadge.user_id == UserLevel.user_id
+        ).correlate(UserLevel).scalar_subquery()
+        rows = db.query(
+            UserLevel.user_id,
+            UserLevel.total_points,
+            UserLevel.level,
+            badges_count
+        ).join(User, User.id == UserLevel.user_id)\
+         .filter(UserLevel.user_id.in_(changed)).all()
+        with self._lock:
+            for user_id, total_points, level, badges in rows:
+                self._store(Standing(user_id, total_points or 0, level or 1, badges or 0))
+                changed.discard(user_id)
+            # Deleted users, or awards to ids with no user row: no rank
+            for user_id in changed:
+                self._discard(user_id)
+            self.version = version
+    
+    def reset(self):
+        with self._lock:
+            self._keys = []
+            self._standings = {}
+            self.loaded = False
+            self.version = None
+    
+    def _store(self, standing: Standing):
+        previous = self._standings.get(standing.user_id)
+        if previous is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-previous.total_points, standing.user_id))]
+        self._standings[standing.user_id] = standing
+        bisect.insort(self._keys, (-standing.total_points, standing.user_id))
+    
+    def _discard(self, user_id: int):
+        standing = self._standings.pop(user_id, None)
+        if standing is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-standing.total_points, user_id))]
+    
+    def apply(self, updates: Dict[int, Tuple[int, int, int]]):
+        # Totals and levels are absolute, badge counts are increments
+        with self._lock:
+            if not self.loaded:
+                # The next rebuild reads these from the database anyway
+                return
+            for user_id, (total_points, level, new_badges) in updates.items():
+                standing = self._standings.get(user_id)
+                if standing is None:
+                    self._store(Standing(user_id, total_points, level, new_badges))
+                else:
+                    self._store(Standing(
+                        user_id, total_points, max(standing.level, level), standing.badges_count + new_badges
+                    ))
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+    
+    def _page(self, start: int, stop: int) -> List[Tuple[int, Standing]]:
+        # Copies, the originals keep changing under the lock
+        start = max(0, start)
+        return [
+            (rank, replace(self._standings[user_id]))
+            for rank, (_, user_id) in enumerate(self._keys[start:stop], start + 1)
+        ]
+    
+    def top(self, limit: int) -> List[Tuple[int, Standing]]:
+        with self._lock:
+            return self._page(0, limit)
+    
+    def rank(self, user_id: int) -> Optional[int]:
+        with self._lock:
+            standing = self._standings.get(user_id)
+            if standing is None:
+                return None
+            return bisect.bisect_left(self._keys, (-standing.total_points, user_id)) + 1
+    
+    def neighbors(self, user_id: int, radius: int) -> List[Tuple[int, Standing]]:
+        with self._lock:
+            rank = self.rank(user_id)
+            if rank is None:
+                return []
+            return self._page(rank - 1 - radius, rank + radius)
+
+
+leaderboard = Leaderboard()
+
+
+def stage_update(db: Session, user_id: int, total_points: int, level: int, new_badges: int = 0):
+    # Published when the session commits, so the board never shows points
+    # from a transaction that rolled back
+    pending = db.info.setdefault(PENDING_KEY, {})
+    previous = pending.get(user_id)
+    if previous is not None:
+        new_badges += previous[2]
+        level = max(level, previous[1])
+    pending[user_id] = (total_points, level, new_badges)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_updates(session: Session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        leaderboard.apply(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_updates(session: Session):
+    session.info.pop(PENDING_KEY, None)
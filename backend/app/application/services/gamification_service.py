@@ -1,10 +1,14 @@
-from typing import List, Optional
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from app.domain.models import UserLevel, Badge, UserBadge, UserPoints, User
+from sqlalchemy import func, desc, case, insert, update, select, literal, Integer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.domain.models import UserLevel, Badge, UserBadge, UserPoints, User, GamificationEvent
+from app.application.services.gamification_leaderboard import leaderboard, stage_update, Standing
 from app.application.dto import (
     UserLevelResponse, BadgeResponse, UserBadgeResponse, 
-    UserPointsResponse, UserStatsResponse, LeaderboardEntry
+    UserPointsResponse, UserStatsResponse, LeaderboardEntry,
+    PointsAward, BulkPointsResponse
 )
 
 class GamificationService:
@@ -36,56 +40,256 @@ class GamificationService:
         12000,  # Level 10
     ]
     
+    # Outbox events failing this many times are left for inspection
+    MAX_EVENT_ATTEMPTS = 5
+    
+    # Users per set-based statement, well below SQLite's variable limit
+    BULK_CHUNK_SIZE = 500
+    
     def __init__(self, db: Session):
         self.db = db
     
-    def add_points(self, user_id: int, source: str, source_id: Optional[int] = None, 
-                   description: Optional[str] = None) -> UserPointsResponse:
-        points = self.POINTS_CONFIG.get(source, 0)
-        
-        user_points = UserPoints(
+    def enqueue_points(self, user_id: int, source: str, source_id: Optional[int] = None,
+                       description: Optional[str] = None) -> GamificationEvent:
+        # The outbox row commits with the caller's write; the worker awards
+        # the points later, so scoring never slows down or fails the request
+        event = GamificationEvent(
             user_id=user_id,
-            points=points,
             source=source,
             source_id=source_id,
-            description=description
+            description=description,
+            attempts=0
         )
-        self.db.add(user_points)
+        self.db.add(event)
+        return event
+    
+    def process_outbox(self, limit: Optional[int] = 100) -> int:
+        events = [tuple(row) for row in self.db.query(
+            GamificationEvent.id,
+            GamificationEvent.user_id,
+            GamificationEvent.source,
+            GamificationEvent.source_id,
+            GamificationEvent.description
+        ).filter(
+            GamificationEvent.processed_at.is_(None),
+            GamificationEvent.attempts < self.MAX_EVENT_ATTEMPTS
+        ).order_by(GamificationEvent.id).limit(limit).all()]
+        if not events:
+            return 0
+        
+        # The whole batch in one transaction; if any event fails, replay the
+        # batch one event per transaction to isolate it
+        try:
+            processed = self._apply_events(events)
+            self.db.commit()
+            return processed
+        except Exception:
+            self.db.rollback()
+        
+        processed = 0
+        for event in events:
+            try:
+                processed += self._apply_events([event])
+                self.db.commit()
+            except Exception as e:
+                self.db.rollback()
+                self.db.execute(
+                    update(GamificationEvent)
+                    .where(GamificationEvent.id == event[0])
+                    .values(
+                        attempts=func.coalesce(GamificationEvent.attempts, 0) + 1,
+                        last_error=str(e)[:500]
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                self.db.commit()
+        return processed
+    
+    def _apply_events(self, events: List[Tuple]) -> int:
+        applied = 0
+        for event_id, user_id, source, source_id, description in events:
+            # Claiming commits together with the award: delivery is at least
+            # once, but a row claimed by another worker is never applied twice
+            claimed = self.db.execute(
+                update(GamificationEvent)
+                .where(GamificationEvent.id == event_id, GamificationEvent.processed_at.is_(None))
+                .values(processed_at=func.now())
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if claimed:
+                self.add_points(user_id, source, source_id, description, commit=False)
+                applied += 1
+        return applied
+    
+    def add_points(self, user_id: int, source: str, source_id: Optional[int] = None, 
+                   description: Optional[str] = None, commit: bool = True,
+                   idempotency_key: Optional[str] = None) -> UserPointsResponse:
+        # Ledger row, level update and badge grants are three statements in
+        # one transaction; routes pass commit=False to commit with their write
+        points = self.POINTS_CONFIG.get(source, 0)
         
-        self._update_user_level(user_id, points)
+        # A repeated (user, source, source_id) or idempotency key hits a
+        # unique index and inserts nothing: the original award is returned
+        inserted = self.db.execute(
+            sqlite_insert(UserPoints).values(
+                user_id=user_id,
+                points=points,
+                source=source,
+                source_id=source_id,
+                description=description,
+                idempotency_key=idempotency_key
+            ).on_conflict_do_nothing().returning(UserPoints.id, UserPoints.created_at)
+        ).first()
+        if inserted is None:
+            return self._existing_award(user_id, source, source_id, idempotency_key)
+        point_id, created_at = inserted
+        
+        total_points, level = self._update_user_level(user_id, points)
         
-        self._check_badges(user_id)
+        new_badges = self._grant_badges(user_id, total_points)
+        stage_update(self.db, user_id, total_points, level, new_badges)
         
-        self.db.commit()
-        self.db.refresh(user_points)
+        if commit:
+            self.db.commit()
         
-        return UserPointsResponse.model_validate(user_points)
+        return UserPointsResponse(
+            id=point_id,
+            user_id=user_id,
+            points=points,
+            source=source,
+            source_id=source_id,
+            description=description,
+            created_at=created_at
+        )
     
-    def _update_user_level(self, user_id: int, points: int):
-        user_level = self.db.query(UserLevel).filter(UserLevel.user_id == user_id).first()
+    def add_points_bulk(self, awards: List[PointsAward], commit: bool = True) -> BulkPointsResponse:
+        # Ledger rows in one batched insert, then one level update and one
+        # badge pass per chunk of users, whatever the number of awards
+        rows = [
+            {
+                "user_id": award.user_id,
+                "points": self.POINTS_CONFIG.get(award.source, 0),
+                "source": award.source,
+                "source_id": award.source_id,
+                "description": award.description,
+                "idempotency_key": None
+            }
+            for award in awards
+        ]
         
-        if not user_level:
-            user_level = UserLevel(
-                user_id=user_id,
-                level=1,
-                experience_points=0,
-                total_points=0
-            )
-            self.db.add(user_level)
+        # Duplicates (in the batch or already awarded) are skipped by the
+        # unique index, only inserted rows come back
+        inserted = self.db.execute(
+            sqlite_insert(UserPoints).on_conflict_do_nothing().returning(UserPoints.user_id, UserPoints.points),
+            rows
+        ).all()
         
-        if user_level.total_points is None:
-            user_level.total_points = 0
-        if user_level.experience_points is None:
-            user_level.experience_points = 0
+        deltas: Dict[int, int] = Counter()
+        for user_id, points in inserted:
+            deltas[user_id] += points
         
-        user_level.total_points += points
-        user_level.experience_points += points
+        user_ids = list(deltas)
+        for start in range(0, len(user_ids), self.BULK_CHUNK_SIZE):
+            chunk = {user_id: deltas[user_id] for user_id in user_ids[start:start + self.BULK_CHUNK_SIZE]}
+            standings = self._update_user_levels(chunk)
+            new_badges = self._grant_badges_bulk(list(chunk))
+            for user_id, (total_points, level) in standings.items():
+                stage_update(self.db, user_id, total_points, level, new_badges[user_id])
         
-        new_level = self._calculate_level(user_level.total_points)
-        if new_level > user_level.level:
-            user_level.level = new_level
+        if commit:
+            self.db.commit()
         
-        self.db.commit()
+        return BulkPointsResponse(
+            requested=len(rows),
+            awarded=len(inserted),
+            duplicates=len(rows) - len(inserted),
+            users_updated=len(deltas),
+            total_points=sum(deltas.values())
+        )
+    
+    def _update_user_levels(self, deltas: Dict[int, int]) -> Dict[int, Tuple[int, int]]:
+        upserted = self.db.execute(
+            self._upsert_user_level().returning(UserLevel.user_id, UserLevel.total_points, UserLevel.level),
+            [
+                {
+                    "user_id": user_id,
+                    "level": self._calculate_level(points),
+                    "experience_points": points,
+                    "total_points": points
+                }
+                for user_id, points in deltas.items()
+            ]
+        ).all()
+        return {user_id: (total_points, level) for user_id, total_points, level in upserted}
+    
+    def _grant_badges_bulk(self, user_ids: List[int]) -> Dict[int, int]:
+        # Each user's badges evaluated once, against the final total
+        owned = select(UserBadge.id).where(
+            UserBadge.user_id == UserLevel.user_id,
+            UserBadge.badge_id == Badge.id
+        )
+        granted = self.db.execute(
+            insert(UserBadge).from_select(
+                ["user_id", "badge_id"],
+                select(UserLevel.user_id, Badge.id).join(
+                    Badge, Badge.points_required <= UserLevel.total_points
+                ).where(
+                    UserLevel.user_id.in_(user_ids),
+                    ~owned.exists()
+                )
+            ).returning(UserBadge.user_id)
+        ).scalars().all()
+        return Counter(granted)
+    
+    def _existing_award(self, user_id: int, source: str, source_id: Optional[int],
+                        idempotency_key: Optional[str]) -> UserPointsResponse:
+        query = self.db.query(UserPoints).filter(UserPoints.user_id == user_id)
+        existing = None
+        if idempotency_key:
+            existing = query.filter(UserPoints.idempotency_key == idempotency_key).first()
+            if existing and (existing.source, existing.source_id) != (source, source_id):
+                raise ValueError("Idempotency key already used for a different award")
+        if existing is None:
+            existing = query.filter(UserPoints.source == source, UserPoints.source_id == source_id).first()
+        return UserPointsResponse.model_validate(existing)
+    
+    def _level_expression(self, total_points):
+        return case(
+            *[
+                (total_points >= requirement, i + 1)
+                for i, requirement in reversed(list(enumerate(self.LEVEL_REQUIREMENTS)))
+            ],
+            else_=1
+        )
+    
+    def _upsert_user_level(self):
+        # One INSERT ... ON CONFLICT DO UPDATE: the row is created or
+        # incremented atomically, so concurrent awards never lose points;
+        # levels never go down
+        upsert = sqlite_insert(UserLevel)
+        new_total = func.coalesce(UserLevel.total_points, 0) + upsert.excluded.total_points
+        new_level = self._level_expression(new_total)
+        current_level = func.coalesce(UserLevel.level, 1)
+        return upsert.on_conflict_do_update(
+            index_elements=[UserLevel.user_id],
+            set_={
+                "total_points": new_total,
+                "experience_points": func.coalesce(UserLevel.experience_points, 0) + upsert.excluded.experience_points,
+                "level": case((new_level > current_level, new_level), else_=current_level),
+                "updated_at": func.now()
+            }
+        )
+    
+    def _update_user_level(self, user_id: int, points: int) -> Tuple[int, int]:
+        upserted = self.db.execute(
+            self._upsert_user_level().values(
+                user_id=user_id,
+                level=self._calculate_level(points),
+                experience_points=points,
+                total_points=points
+            ).returning(UserLevel.total_points, UserLevel.level)
+        ).one()
+        return upserted.total_points, upserted.level
     
     def _calculate_level(self, total_points: int) -> int:
         level = 1
@@ -96,25 +300,18 @@ class GamificationService:
                 break
         return min(level, len(self.LEVEL_REQUIREMENTS))
     
-    def _check_badges(self, user_id: int):
-        user_level = self.db.query(UserLevel).filter(UserLevel.user_id == user_id).first()
-        if not user_level:
-            return
-        
-        user_badges = self.db.query(UserBadge.badge_id).filter(UserBadge.user_id == user_id).all()
-        user_badge_ids = [ub.badge_id for ub in user_badges]
-        
-        eligible_badges = self.db.query(Badge).filter(
-            Badge.points_required <= user_level.total_points,
-            ~Badge.id.in_(user_badge_ids)
-        ).all()
-        
-        for badge in eligible_badges:
-            user_badge = UserBadge(
-                user_id=user_id,
-                badge_id=badge.id
+    def _grant_badges(self, user_id: int, total_points: int) -> int:
+        # Every newly reached badge in a single INSERT ... SELECT
+        owned = select(UserBadge.badge_id).where(UserBadge.user_id == user_id)
+        return self.db.execute(
+            insert(UserBadge).from_select(
+                ["user_id", "badge_id"],
+                select(literal(user_id, Integer), Badge.id).where(
+                    Badge.points_required <= total_points,
+                    Badge.id.not_in(owned)
+                )
             )
-            self.db.add(user_badge)
+        ).rowcount
     
     def get_user_stats(self, user_id: int) -> UserStatsResponse:
         user_level = self.db.query(UserLevel).filter(UserLevel.user_id == user_id).first()
@@ -145,31 +342,42 @@ class GamificationService:
             recent_points=[UserPointsResponse.model_validate(point) for point in recent_points]
         )
     
-    def get_leaderboard(self, limit: int = 10) -> List[LeaderboardEntry]:
-        leaderboard = self.db.query(
-            User.id,
-            User.name,
-            UserLevel.level,
-            UserLevel.total_points,
-            func.count(UserBadge.id).label('badges_count')
-        ).join(UserLevel, User.id == UserLevel.user_id)\
-         .outerjoin(UserBadge, User.id == UserBadge.user_id)\
-         .group_by(User.id, User.name, UserLevel.level, UserLevel.total_points)\
-         .order_by(desc(UserLevel.total_points))\
-         .limit(limit).all()
-        
-        result = []
-        for rank, (user_id, user_name, level, total_points, badges_count) in enumerate(leaderboard, 1):
-            result.append(LeaderboardEntry(
-                user_id=user_id,
-                user_name=user_name,
-                level=level,
-                total_points=total_points,
-                badges_count=badges_count or 0,
-                rank=rank
-            ))
+    def _entries(self, page: Callable[[], List[Tuple[int, Standing]]]) -> List[LeaderboardEntry]:
+        leaderboard.refresh(self.db)
+        for attempt in range(2):
+            ranked = page()
+            # Names can change at any time, so they are looked up per page
+            names = dict(self.db.query(User.id, User.name).filter(
+                User.id.in_([standing.user_id for _, standing in ranked])
+            ).all())
+            if len(names) == len(ranked) or attempt:
+                break
+            # A user was removed under the board: re-rank without them rather
+            # than leave a hole in the ranks
+            leaderboard.rebuild(self.db)
         
-        return result
+        return [
+            LeaderboardEntry(
+                user_id=standing.user_id,
+                user_name=names[standing.user_id],
+                level=standing.level,
+                total_points=standing.total_points,
+                badges_count=standing.badges_count,
+                rank=rank
+            )
+            for rank, standing in ranked
+            if standing.user_id in names
+        ]
+    
+    def get_leaderboard(self, limit: int = 10) -> List[LeaderboardEntry]:
+        return self._entries(lambda: leaderboard.top(limit))
+    
+    def get_user_rank(self, user_id: int) -> Optional[LeaderboardEntry]:
+        entries = self._entries(lambda: leaderboard.neighbors(user_id, 0))
+        return entries[0] if entries else None
+    
+    def get_leaderboard_neighbors(self, user_id: int, radius: int = 5) -> List[LeaderboardEntry]:
+        return self._entries(lambda: leaderboard.neighbors(user_id, radius))
     
     def get_user_badges(self, user_id: int) -> List[UserBadgeResponse]:
         user_badges = self.db.query(UserBadge).filter(
@@ -0,0 +1,69 @@
+import asyncio
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.application.services.gamification_service import GamificationService
+
+
+class GamificationOutboxWorker:
+    
+    def __init__(self, session_factory: Callable[[], Session], batch_size: int = 100,
+                 poll_interval: float = 1.0):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+        self.processed = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+    
+    def drain_once(self) -> int:
+        db = self.session_factory()
+        try:
+            processed = GamificationService(db).process_outbox(limit=self.batch_size)
+        finally:
+            db.close()
+        self.processed += processed
+        self.batches += processed > 0
+        return processed
+    
+    async def run(self):
+        while True:
+            try:
+                # SQLAlchemy is blocking, keep it off the event loop
+                processed = await asyncio.to_thread(self.drain_once)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                processed = 0
+            # A full batch means more is probably waiting
+            if processed < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+    
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+    
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "batch_size": self.batch_size,
+            "poll_interval": self.poll_interval,
+            "processed": self.processed,
+            "batches": self.batches,
+            "failures": self.failures,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,120 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from app.application.services.rag_tabular import Table, parse_csv
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t]*#*[ \t]*$", re.MULTILINE)
+PARAGRAPH_PATTERN = re.compile(r"\S(?:.*?\S)?(?=\n[ \t]*\n|\s*\Z)", re.DOTALL)
+LINE_PATTERN = re.compile(r"\S(?:.*\S)?")
+SENTENCE_PATTERN = re.compile(r"\S.*?(?:[.!?](?=\s)|\Z)", re.DOTALL)
+
+
+@dataclass
+class Chunk:
+    source: str
+    text: str
+    start: int
+    end: int
+    title: Optional[str] = None
+    
+    @property
+    def label(self) -> str:
+        if self.title:
+            return f"{self.source} - {self.title}"
+        return self.source
+
+
+class Chunker:
+    
+    def __init__(self, chunk_size: int = 800, overlap: int = 150):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+    
+    def chunk(self, source: str, content: str) -> List[Chunk]:
+        ext = os.path.splitext(source)[1].lower()
+        
+        if ext == '.md':
+            return self.chunk_markdown(source, content)
+        elif ext == '.csv':
+            return self.chunk_csv(source, content)
+        return self.chunk_text(source, content)
+    
+    def chunk_markdown(self, source: str, content: str) -> List[Chunk]:
+        headings = list(HEADING_PATTERN.finditer(content))
+        first_heading = headings[0].start() if headings else len(content)
+        chunks = self._window(source, content, 0, first_heading)
+        
+        path: List[Tuple[int, str]] = []
+        for i, heading in enumerate(headings):
+            depth = len(heading.group(1))
+            path = [(d, t) for d, t in path if d < depth] + [(depth, heading.group(2))]
+            title = " > ".join(t for _, t in path)
+            
+            section_end = headings[i + 1].start() if i + 1 < len(headings) else len(content)
+            if not content[heading.end():section_end].strip():
+                continue
+            chunks.extend(self._window(source, content, heading.start(), section_end, title))
+        
+        return chunks
+    
+    def chunk_text(self, source: str, content: str) -> List[Chunk]:
+        return self._window(source, content, 0, len(content))
+    
+    def chunk_csv(self, source: str, content: str) -> List[Chunk]:
+        return self.chunk_table(source, parse_csv(content))
+    
+    def chunk_table(self, source: str, table: Table) -> List[Chunk]:
+        # One chunk per row so a lookup retrieves the row, not the file
+        return [
+            Chunk(source, table.row_text(position), start, end)
+            for position, (start, end) in enumerate(table.spans)
+        ]
+    
+    def _units(self, content: str, start: int, end: int) -> List[Tuple[int, int]]:
+        # Paragraphs, falling back to lines, sentences and finally hard splits
+        # for anything that does not fit in a single chunk
+        units = []
+        for paragraph in PARAGRAPH_PATTERN.finditer(content, start, end):
+            if paragraph.end() - paragraph.start() <= self.chunk_size:
+                units.append(paragraph.span())
+                continue
+            
+            for line in LINE_PATTERN.finditer(content, paragraph.start(), paragraph.end()):
+                if line.end() - line.start() <= self.chunk_size:
+                    units.append(line.span())
+                    continue
+                
+                for sentence in SENTENCE_PATTERN.finditer(content, line.start(), line.end()):
+                    sentence_start, sentence_end = sentence.span()
+                    while sentence_end - sentence_start > self.chunk_size:
+                        units.append((sentence_start, sentence_start + self.chunk_size))
+                        sentence_start += self.chunk_size
+                    units.append((sentence_start, sentence_end))
+        return units
+    
+    def _window(self, source: str, content: str, start: int, end: int,
+                title: Optional[str] = None) -> List[Chunk]:
+        units = self._units(content, start, end)
+        chunks = []
+        first = 0
+        
+        while first < len(units):
+            last = first
+            while last + 1 < len(units) and units[last + 1][1] - units[first][0] <= self.chunk_size:
+                last += 1
+            
+            chunk_start, chunk_end = units[first][0], units[last][1]
+            chunks.append(Chunk(source, content[chunk_start:chunk_end], chunk_start, chunk_end, title))
+            
+            if last + 1 >= len(units):
+                break
+            
+            # Step back over trailing units that fit in the overlap window
+            next_first = last + 1
+            while next_first - 1 > first and chunk_end - units[next_first - 1][0] <= self.overlap:
+                next_first -= 1
+            first = next_first
+        
+        return chunks
@@ -0,0 +1,67 @@
+import heapq
+import math
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+
+class InvertedIndex:
+    
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self.total_length = 0
+    
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+    
+    def add(self, doc_id: int, tokens: Iterable[str]):
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id)
+        
+        frequencies = Counter(tokens)
+        length = sum(frequencies.values())
+        
+        for term, frequency in frequencies.items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+        
+        self.doc_lengths[doc_id] = length
+        self.doc_terms[doc_id] = tuple(frequencies)
+        self.total_length += length
+    
+    def remove(self, doc_id: int):
+        for term in self.doc_terms.pop(doc_id, ()):
+            postings = self.postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+        
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+    
+    def search(self, query_tokens: Iterable[str], k: int = 10) -> List[Tuple[int, float]]:
+        doc_count = len(self.doc_lengths)
+        if not doc_count:
+            return []
+        
+        avg_length = self.total_length / doc_count or 1.0
+        k1 = self.k1
+        length_weight = k1 * self.b / avg_length
+        base_weight = k1 * (1 - self.b)
+        doc_lengths = self.doc_lengths
+        
+        scores: Dict[int, float] = {}
+        for term in set(query_tokens):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            
+            df = len(postings)
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            
+            for doc_id, tf in postings.items():
+                norm = base_weight + length_weight * doc_lengths[doc_id]
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
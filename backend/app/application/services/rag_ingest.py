@@ -0,0 +1,117 @@
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from queue import Empty
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.application.services.rag_chunker import Chunk, Chunker
+from app.application.services.rag_parsers import parse_file
+from app.application.services.rag_tabular import Table
+from app.application.services.rag_text import tokenize
+from app.application.services.rag_vectors import DEFAULT_DIM, document_vector
+
+BATCH_CHUNKS = 256
+# Batches waiting for the indexer, per worker; a full queue blocks workers
+QUEUED_BATCHES_PER_WORKER = 2
+
+
+@dataclass
+class IngestedBatch:
+    filename: str
+    chunks: List[Chunk]
+    tokens: List[List[str]]
+    vectors: np.ndarray
+
+
+@dataclass
+class IngestedFile:
+    # Sent after the last batch of a file; content_hash is None on error
+    filename: str
+    content_hash: Optional[str] = None
+    table: Optional[Table] = None
+    error: Optional[str] = None
+
+
+IngestEvent = Union[IngestedBatch, IngestedFile]
+
+
+def ingest_file(filename: str, path: str, chunk_size: int = 800, overlap: int = 150,
+                dim: int = DEFAULT_DIM, batch_chunks: int = BATCH_CHUNKS) -> Iterator[IngestEvent]:
+    # Everything short of the index insert, so it can run in any process;
+    # at most batch_chunks chunks are in flight, whatever the file size
+    try:
+        document = parse_file(filename, path, Chunker(chunk_size, overlap))
+        chunks = iter(document)
+        while True:
+            batch = list(islice(chunks, batch_chunks))
+            if not batch:
+                break
+            tokens = [tokenize(f"{chunk.title or ''} {chunk.text}") for chunk in batch]
+            vectors = np.stack([document_vector(chunk_tokens, dim) for chunk_tokens in tokens])
+            yield IngestedBatch(filename, batch, tokens, vectors)
+    except Exception as e:
+        yield IngestedFile(filename, error=f"Error reading file: {e}")
+        return
+    yield IngestedFile(filename, document.content_hash, document.table)
+
+
+def _ingest(task: Tuple[str, str, int, int, int, int], events: Any):
+    # Runs in a pool worker: each batch is handed over as soon as it is cut,
+    # the worker never holds more than one
+    for event in ingest_file(*task):
+        events.put(event)
+
+
+def ingest_files(files: Sequence[Tuple[str, str]], chunker: Chunker, dim: int = DEFAULT_DIM,
+                 workers: int = 1, batch_chunks: int = BATCH_CHUNKS) -> Iterator[IngestEvent]:
+    tasks = [
+        (filename, path, chunker.chunk_size, chunker.overlap, dim, batch_chunks)
+        for filename, path in files
+    ]
+    if workers <= 1 or len(tasks) < 2:
+        for task in tasks:
+            yield from ingest_file(*task)
+        return
+    
+    # spawn, not fork: the API process runs watcher and server threads
+    workers = min(workers, len(tasks))
+    context = multiprocessing.get_context("spawn")
+    # A manager queue: put() returns once the event is queued, so a finished
+    # task has nothing left in flight
+    manager = context.Manager()
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    events = manager.Queue(maxsize=QUEUED_BATCHES_PER_WORKER * workers)
+    pending: Dict[str, Future] = {}
+    try:
+        pending = {task[0]: pool.submit(_ingest, task, events) for task in tasks}
+        while pending:
+            try:
+                event = events.get(timeout=0.1)
+            except Empty:
+                finished = [filename for filename, future in pending.items() if future.done()]
+                try:
+                    event = events.get_nowait()
+                except Empty:
+                    # Finished without reporting their file: the task died
+                    for filename in finished:
+                        future = pending.pop(filename)
+                        error = future.exception() if not future.cancelled() else None
+                        yield IngestedFile(filename, error=f"Error reading file: {error or 'worker stopped'}")
+                    continue
+            if isinstance(event, IngestedFile):
+                pending.pop(event.filename, None)
+            yield event
+    finally:
+        # Stopped early: tasks already running finish into the void, so none
+        # blocks on a full queue or dies on a closed one
+        pool.shutdown(wait=False, cancel_futures=True)
+        while any(not future.done() for future in pending.values()):
+            try:
+                events.get(timeout=0.1)
+            except Empty:
+                pass
+        pool.shutdown()
+        manager.shutdown()
@@ -0,0 +1,237 @@
+import asyncio
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+
+class LLMUnavailableError(Exception):
+    pass
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    
+    # openai raises APIConnectionError/APITimeoutError for transport problems
+    # and APIStatusError subclasses carrying the HTTP status otherwise
+    if any(cls.__name__ == "APIConnectionError" for cls in type(error).__mro__):
+        return True
+    
+    status_code = getattr(error, "status_code", None)
+    return status_code in (408, 409, 429) or (status_code or 0) >= 500
+
+
+class CircuitBreaker:
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+    
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+        
+        if self.state == self.HALF_OPEN:
+            # A single probe decides whether the upstream is back
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        
+        return True
+    
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+    
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+    
+    def release(self):
+        # The call ended without telling us anything about upstream health
+        self._probe_in_flight = False
+    
+    def stats(self) -> Dict[str, Any]:
+        retry_in = 0.0
+        if self.state == self.OPEN:
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "times_opened": self.times_opened,
+            "retry_in_seconds": round(retry_in, 3)
+        }
+
+
+class LLMGateway:
+    
+    def __init__(self, client: Any, max_concurrency: int = 8, timeout: float = 30.0,
+                 max_retries: int = 2, backoff_base: float = 0.25, backoff_max: float = 2.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.rejected = 0
+    
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps retrying callers from synchronizing
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+    
+    def _admit(self):
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise LLMUnavailableError("LLM circuit breaker is open")
+    
+    async def _acquire(self, deadline: float):
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise LLMUnavailableError("Timed out waiting for an LLM slot")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+    
+    def _release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+    
+    async def _attempts(self, call, deadline: float, keep_slot: bool = False):
+        # Runs call(deadline) under the concurrency limit, retrying transient
+        # failures with jittered backoff until the retry budget or the
+        # deadline is spent. With keep_slot the caller releases the slot.
+        self.calls += 1
+        self._admit()
+        attempt = 0
+        
+        while True:
+            try:
+                await self._acquire(deadline)
+            except BaseException:
+                self.breaker.release()
+                raise
+            holding = True
+            try:
+                result = await call(deadline)
+                self.breaker.record_success()
+                holding = not keep_slot
+                return result
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                timed_out = isinstance(e, asyncio.TimeoutError)
+                if timed_out:
+                    self.timeouts += 1
+                if not (timed_out or is_retryable(e)):
+                    self.breaker.release()
+                    raise
+                
+                self.failures += 1
+                self.breaker.record_failure()
+                delay = self._backoff(attempt)
+                if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    raise LLMUnavailableError(str(e) or type(e).__name__) from e
+                if not self.breaker.allow():
+                    self.rejected += 1
+                    raise LLMUnavailableError("LLM circuit breaker is open") from e
+            finally:
+                if holding:
+                    self._release()
+            
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+    
+    async def complete(self, **kwargs) -> Any:
+        async def call(deadline: float):
+            return await asyncio.wait_for(
+                self.client.chat.completions.create(**kwargs),
+                max(0.0, deadline - time.monotonic())
+            )
+        
+        return await self._attempts(call, time.monotonic() + self.timeout)
+    
+    async def stream(self, **kwargs) -> AsyncIterator[str]:
+        # Only opening the stream is retried; once tokens have been handed to
+        # the caller a failure surfaces as LLMUnavailableError
+        async def call(deadline: float):
+            return await asyncio.wait_for(
+                self.client.chat.completions.create(stream=True, **kwargs),
+                max(0.0, deadline - time.monotonic())
+            )
+        
+        deadline = time.monotonic() + self.timeout
+        stream = await self._attempts(call, deadline, keep_slot=True)
+        try:
+            iterator = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(
+                        iterator.__anext__(),
+                        max(0.0, deadline - time.monotonic())
+                    )
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError as e:
+                    self.timeouts += 1
+                    self.failures += 1
+                    self.breaker.record_failure()
+                    raise LLMUnavailableError("LLM stream timed out") from e
+                except Exception as e:
+                    if not is_retryable(e):
+                        raise
+                    self.failures += 1
+                    self.breaker.record_failure()
+                    raise LLMUnavailableError(str(e) or type(e).__name__) from e
+                
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            self._release()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "timeout_seconds": self.timeout,
+            "max_retries": self.max_retries,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "circuit_breaker": self.breaker.stats()
+        }
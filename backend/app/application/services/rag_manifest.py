@@ -0,0 +1,20 @@
+from dataclasses import dataclass, field
+from typing import List
+
+
+@dataclass
+class FileEntry:
+    path: str
+    size: int
+    mtime: float
+    content_hash: str
+    chunk_ids: List[int] = field(default_factory=list)
+
+
+@dataclass
+class FailedFile:
+    # Retried only once the file changes on disk
+    path: str
+    size: int
+    mtime: float
+    error: str
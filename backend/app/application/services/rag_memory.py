@@ -0,0 +1,154 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+from app.application.services.rag_packer import estimate_tokens
+
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s")
+SUMMARY_ANSWER_CHARS = 200
+
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+    tokens: int
+
+
+@dataclass
+class Session:
+    turns: Deque[Turn] = field(default_factory=deque)
+    turn_tokens: int = 0
+    summary: List[str] = field(default_factory=list)
+    summary_tokens: int = 0
+    last_seen: float = 0.0
+
+
+class ConversationMemory:
+    
+    def __init__(self, max_sessions: int = 1000, max_turns: int = 6, token_budget: int = 400,
+                 summary_token_budget: int = 150, idle_seconds: float = 1800):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+        self.idle_seconds = idle_seconds
+        # Least recently used first, which is also oldest last_seen first
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+        self.summarized_turns = 0
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    def _evict(self, now: float):
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_seen > self.idle_seconds:
+                self.evicted_idle += 1
+            elif len(self._sessions) > self.max_sessions:
+                self.evicted_lru += 1
+            else:
+                break
+            del self._sessions[session_id]
+    
+    def _touch(self, session_id: str, create: bool) -> Optional[Session]:
+        now = time.monotonic()
+        self._evict(now)
+        session = self._sessions.get(session_id)
+        if session is None:
+            if not create:
+                return None
+            session = self._sessions[session_id] = Session()
+        session.last_seen = now
+        self._sessions.move_to_end(session_id)
+        return session
+    
+    @staticmethod
+    def _summarize(turn: Turn) -> str:
+        # Extractive: the question and the first sentence of its answer
+        answer = SENTENCE_END_PATTERN.split(turn.answer.strip(), 1)[0][:SUMMARY_ANSWER_CHARS]
+        return f"- {turn.question.strip()} -> {answer}"
+    
+    def _fold_oldest(self, session: Session):
+        turn = session.turns.popleft()
+        session.turn_tokens -= turn.tokens
+        line = self._summarize(turn)
+        session.summary.append(line)
+        session.summary_tokens += estimate_tokens(line)
+        self.summarized_turns += 1
+        
+        # The summary rolls too: the oldest lines go first
+        while len(session.summary) > 1 and session.summary_tokens > self.summary_token_budget:
+            session.summary_tokens -= estimate_tokens(session.summary.pop(0))
+    
+    def append(self, session_id: str, question: str, answer: str):
+        if self.max_sessions <= 0:
+            return
+        
+        turn = Turn(question, answer, estimate_tokens(question) + estimate_tokens(answer))
+        with self._lock:
+            session = self._touch(session_id, create=True)
+            session.turns.append(turn)
+            session.turn_tokens += turn.tokens
+            # The latest turn always stays verbatim
+            while len(session.turns) > 1 and (
+                len(session.turns) > self.max_turns or session.turn_tokens > self.token_budget
+            ):
+                self._fold_oldest(session)
+            self._evict(time.monotonic())
+    
+    def messages(self, session_id: str) -> List[Dict[str, str]]:
+        with self._lock:
+            session = self._touch(session_id, create=False)
+            if session is None:
+                return []
+            summary = list(session.summary)
+            turns = list(session.turns)
+        
+        messages = []
+        if summary:
+            messages.append({
+                "role": "system",
+                "content": "Resumo da conversa até aqui:\n" + "\n".join(summary)
+            })
+        for turn in turns:
+            messages.append({"role": "user", "content": turn.question})
+            messages.append({"role": "assistant", "content": turn.answer})
+        return messages
+    
+    @staticmethod
+    def fingerprint(messages: List[Dict[str, str]]) -> str:
+        if not messages:
+            return ""
+        digest = hashlib.sha1()
+        for message in messages:
+            digest.update(message["role"].encode("utf-8") + b"\0" + message["content"].encode("utf-8") + b"\0")
+        return digest.hexdigest()
+    
+    def clear(self, session_id: Optional[str] = None):
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(session_id, None)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._evict(time.monotonic())
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "max_turns": self.max_turns,
+                "token_budget": self.token_budget,
+                "idle_seconds": self.idle_seconds,
+                "evicted_idle": self.evicted_idle,
+                "evicted_lru": self.evicted_lru,
+                "summarized_turns": self.summarized_turns
+            }
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+STAGES = ("reload_check", "retrieval", "packing", "llm_first_token", "llm", "total")
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+TOKEN_BUCKETS = (100, 200, 400, 800, 1600, 3200)
+
+
+@dataclass
+class RequestTrace:
+    started: float = field(default_factory=time.perf_counter)
+    stages: Dict[str, float] = field(default_factory=dict)
+    streamed: bool = False
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cache_hit: bool = False
+    degraded: bool = False
+    failed: bool = False
+    top_scores: List[float] = field(default_factory=list)
+    
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+
+def _histogram(values: Sequence[float], buckets: Optional[Sequence[float]] = None) -> Dict[str, Any]:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    
+    def pick(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+    
+    summary = {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": round(values[-1], 3)
+    }
+    if buckets:
+        # Per bucket (not cumulative), keyed by upper bound
+        counts = {f"<={bound}": 0 for bound in buckets}
+        counts["+Inf"] = 0
+        for value in values:
+            bound = next((bound for bound in buckets if value <= bound), None)
+            counts[f"<={bound}" if bound is not None else "+Inf"] += 1
+        summary["buckets"] = counts
+    return summary
+
+
+class MetricsRecorder:
+    
+    # Recording is an append to a bounded deque; aggregation only happens
+    # when someone asks for the summary
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._traces: Deque[RequestTrace] = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.recorded = 0
+    
+    def record(self, trace: RequestTrace):
+        trace.stages["total"] = time.perf_counter() - trace.started
+        with self._lock:
+            self._traces.append(trace)
+            self.recorded += 1
+    
+    def traces(self) -> List[RequestTrace]:
+        with self._lock:
+            return list(self._traces)
+    
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+    
+    def summary(self) -> Dict[str, Any]:
+        traces = self.traces()
+        stages_ms = {
+            stage: _histogram(
+                [trace.stages[stage] * 1000 for trace in traces if stage in trace.stages],
+                LATENCY_BUCKETS_MS
+            )
+            for stage in STAGES
+        }
+        totals = {
+            stage: stats["mean"] * stats["count"]
+            for stage, stats in stages_ms.items()
+            if stage != "total" and stats["count"]
+        }
+        answered = [trace for trace in traces if trace.prompt_tokens]
+        
+        return {
+            "window": len(traces),
+            "capacity": self.capacity,
+            "recorded": self.recorded,
+            "stages_ms": stages_ms,
+            # Where the time goes overall, weighted by how often a stage runs
+            "dominant_stage": max(totals, key=totals.get) if totals else None,
+            "prompt_tokens": _histogram([trace.prompt_tokens for trace in answered], TOKEN_BUCKETS),
+            "completion_tokens": _histogram(
+                [trace.completion_tokens for trace in answered if trace.completion_tokens], TOKEN_BUCKETS
+            ),
+            "cache_hit_ratio": round(sum(trace.cache_hit for trace in answered) / len(answered), 4) if answered else 0.0,
+            "degraded": sum(trace.degraded for trace in traces),
+            "failed": sum(trace.failed for trace in traces),
+            "streamed": sum(trace.streamed for trace in traces),
+            "top_score": _histogram([trace.top_scores[0] for trace in traces if trace.top_scores]),
+            "last_score": _histogram([trace.top_scores[-1] for trace in traces if trace.top_scores])
+        }
@@ -0,0 +1,84 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List
+
+from app.application.services.rag_chunker import Chunk
+from app.application.services.rag_text import tokenize
+
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    # BPE vocabularies split Portuguese words into roughly four-character
+    # pieces and punctuation into its own tokens; close enough to budget with
+    # and cheap enough to run per request
+    return sum(
+        (len(piece) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        for piece in WORD_PATTERN.findall(text)
+    )
+
+
+def _shingles(text: str, size: int = 3) -> FrozenSet[str]:
+    words = tokenize(text)
+    if len(words) <= size:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+@dataclass
+class PackedContext:
+    text: str = ""
+    chunks: List[Chunk] = field(default_factory=list)
+    sources: List[str] = field(default_factory=list)
+    tokens: int = 0
+    dropped_duplicates: int = 0
+
+
+class ContextPacker:
+
+    def __init__(self, token_budget: int = 800, duplicate_threshold: float = 0.8):
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+
+    @staticmethod
+    def format_chunk(chunk: Chunk) -> str:
+        return f"\n--- {chunk.label} ---\n{chunk.text}\n"
+
+    def _is_duplicate(self, shingles: FrozenSet[str], selected: List[FrozenSet[str]]) -> bool:
+        for other in selected:
+            overlap = len(shingles & other) / (len(shingles | other) or 1)
+            if overlap >= self.duplicate_threshold:
+                return True
+        return False
+
+    def pack(self, ranked_chunks: List[Chunk]) -> PackedContext:
+        packed = PackedContext()
+        selected: List[Chunk] = []
+        selected_shingles: List[FrozenSet[str]] = []
+
+        # Greedy by relevance: skip what does not fit and keep trying smaller
+        # chunks further down the ranking
+        for chunk in ranked_chunks:
+            tokens = estimate_tokens(self.format_chunk(chunk))
+            if packed.tokens + tokens > self.token_budget:
+                continue
+
+            shingles = _shingles(chunk.text)
+            if self._is_duplicate(shingles, selected_shingles):
+                packed.dropped_duplicates += 1
+                continue
+
+            selected.append(chunk)
+            selected_shingles.append(shingles)
+            packed.tokens += tokens
+
+        # Group chunks by source, sources ordered by their best chunk, and keep
+        # document order inside each source so neighbouring chunks read on
+        source_rank: Dict[str, int] = {}
+        for chunk in selected:
+            source_rank.setdefault(chunk.source, len(source_rank))
+        packed.chunks = sorted(selected, key=lambda c: (source_rank[c.source], c.start))
+        packed.sources = list(source_rank)
+        packed.text = "".join(self.format_chunk(chunk) for chunk in packed.chunks)
+        return packed
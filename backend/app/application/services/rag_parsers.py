@@ -0,0 +1,377 @@
+import hashlib
+import io
+import json
+import os
+import re
+from abc import ABC, abstractmethod
+from html.parser import HTMLParser
+from typing import Any, Dict, Generator, Iterator, List, Optional, TextIO, Tuple
+
+from app.application.services.rag_chunker import Chunk, Chunker
+from app.application.services.rag_tabular import Table, parse_csv
+
+BLOCK_CHARS = 256 * 1024
+SPACE_PATTERN = re.compile(r"[ \t\r\f\v]+")
+BLANK_LINES_PATTERN = re.compile(r"\n\s*\n\s*")
+
+
+# Parsers yield chunks as they read; tabular ones return their table
+ChunkStream = Generator[Chunk, None, Optional[Table]]
+
+
+class DocumentParser(ABC):
+    
+    extensions: Tuple[str, ...] = ()
+    # None decodes \r\n and \r to \n, which the chunker patterns expect
+    newline: Optional[str] = None
+    
+    @abstractmethod
+    def parse(self, source: str, stream: TextIO, chunker: Chunker) -> ChunkStream:
+        ...
+
+
+_PARSERS: Dict[str, DocumentParser] = {}
+
+
+def register_parser(parser: DocumentParser):
+    for extension in parser.extensions:
+        _PARSERS[extension.lower()] = parser
+
+
+def parser_for(filename: str) -> Optional[DocumentParser]:
+    return _PARSERS.get(os.path.splitext(filename)[1].lower())
+
+
+def supported_extensions() -> Tuple[str, ...]:
+    return tuple(sorted(_PARSERS))
+
+
+class _HashingReader(io.RawIOBase):
+    
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+    
+    def readable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        count = self.raw.readinto(buffer)
+        if count:
+            self.digest.update(memoryview(buffer)[:count])
+        return count
+
+
+class ParsedDocument:
+    
+    # Iterating reads the file and yields its chunks as they are cut;
+    # content_hash and table are set once the iteration is complete
+    def __init__(self, filename: str, path: str, chunker: Chunker):
+        self.parser = parser_for(filename)
+        if self.parser is None:
+            raise ValueError(f"Unsupported file type: {filename}")
+        self.filename = filename
+        self.path = path
+        self.chunker = chunker
+        self.content_hash: Optional[str] = None
+        self.table: Optional[Table] = None
+    
+    def __iter__(self) -> Iterator[Chunk]:
+        # The file is hashed while it is parsed, so it is read exactly once and
+        # never held in memory as a whole (except by parsers that need it so)
+        with open(self.path, "rb", buffering=0) as raw:
+            reader = _HashingReader(raw)
+            stream = io.TextIOWrapper(io.BufferedReader(reader), encoding="utf-8", newline=self.parser.newline)
+            self.table = yield from self.parser.parse(self.filename, stream, self.chunker)
+            for _ in iter(lambda: stream.read(BLOCK_CHARS), ""):
+                pass
+            self.content_hash = reader.digest.hexdigest()
+
+
+def parse_file(filename: str, path: str, chunker: Chunker) -> ParsedDocument:
+    return ParsedDocument(filename, path, chunker)
+
+
+def _shift(chunks: List[Chunk], offset: int, title: Optional[str] = None) -> List[Chunk]:
+    for chunk in chunks:
+        chunk.start += offset
+        chunk.end += offset
+        chunk.title = chunk.title or title
+    return chunks
+
+
+def _blocks(stream: TextIO, size: int = BLOCK_CHARS) -> Iterator[Tuple[int, str]]:
+    # Bounded blocks cut at the last paragraph (or line) break, the rest is
+    # carried over to the next block
+    offset = 0
+    carry = ""
+    while True:
+        data = stream.read(size)
+        block = carry + data
+        if not data:
+            if block.strip():
+                yield offset, block
+            return
+        
+        cut = block.rfind("\n\n")
+        if cut < 0:
+            cut = block.rfind("\n")
+        if cut < 0 or cut < len(block) // 4:
+            cut = len(block) - 1
+        yield offset, block[:cut + 1]
+        carry = block[cut + 1:]
+        offset += cut + 1
+
+
+class MarkdownParser(DocumentParser):
+    
+    # Heading paths need the whole document; markdown files are small
+    extensions = (".md", ".markdown")
+    
+    def parse(self, source: str, stream: TextIO, chunker: Chunker) -> ChunkStream:
+        yield from chunker.chunk_markdown(source, stream.read())
+
+
+class CsvParser(DocumentParser):
+    
+    extensions = (".csv",)
+    # The csv module handles line endings itself, including quoted ones
+    newline = ""
+    
+    def parse(self, source: str, stream: TextIO, chunker: Chunker) -> ChunkStream:
+        table = parse_csv(stream.read())
+        yield from chunker.chunk_table(source, table)
+        return table
+
+
+class TextParser(DocumentParser):
+    
+    extensions = (".txt",)
+    
+    def parse(self, source: str, stream: TextIO, chunker: Chunker) -> ChunkStream:
+        for offset, block in _blocks(stream):
+            yield from _shift(chunker.chunk_text(source, block), offset)
+
+
+class LogParser(DocumentParser):
+    
+    extensions = (".log",)
+    
+    def parse(self, source: str, stream: TextIO, chunker: Chunker) -> ChunkStream:
+        # Consecutive lines up to chunk_size, one chunk in memory at a time
+        lines: List[str] = []
+        start = offset = size = 0
+        
+        def flush() -> List[Chunk]:
+            text = "".join(lines).strip()
+            return [Chunk(source, text, start, offset)] if text else []
+        
+        for line in stream:
+            if size + len(line) > chunker.chunk_size and lines:
+                yield from flush()
+                lines, start, size = [], offset, 0
+            if len(line) > chunker.chunk_size:
+                yield from _shift(chunker.chunk_text(source, line), offset)
+                offset += len(line)
+                start = offset
+                continue
+            lines.append(line)
+            size += len(line)
+            offset += len(line)
+        yield from flush()
+
+
+class _HtmlSections(HTMLParser):
+    
+    SKIPPED = {"script", "style", "noscript", "template", "svg", "title"}
+    HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+    BREAKS = {"p", "div", "li", "tr", "br", "section", "article", "table", "ul", "ol", "blockquote", "pre"}
+    
+    def __init__(self, flush_chars: int):
+        super().__init__(convert_charrefs=True)
+        self.flush_chars = flush_chars
+        self.sections: List[Tuple[int, Optional[str], str]] = []
+        self.headings: List[Tuple[int, str]] = []
+        self.position = 0
+        self._skip_depth = 0
+        self._heading_level = 0
+        self._heading_text: List[str] = []
+        self._text: List[str] = []
+        self._size = 0
+        self._start = 0
+    
+    def title(self) -> Optional[str]:
+        return " > ".join(text for _, text in self.headings) or None
+    
+    def flush(self):
+        text = BLANK_LINES_PATTERN.sub("\n\n", SPACE_PATTERN.sub(" ", "".join(self._text))).strip()
+        if text:
+            self.sections.append((self._start, self.title(), text))
+        self._text, self._size, self._start = [], 0, self.position
+    
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self._skip_depth += 1
+        elif tag in self.HEADINGS:
+            self.flush()
+            self._heading_level = self.HEADINGS[tag]
+            self._heading_text = []
+        elif tag in self.BREAKS:
+            self._text.append("\n")
+    
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.HEADINGS and self._heading_level:
+            level = self._heading_level
+            text = SPACE_PATTERN.sub(" ", "".join(self._heading_text)).strip()
+            self.headings = [heading for heading in self.headings if heading[0] < level]
+            if text:
+                self.headings.append((level, text))
+            self._heading_level = 0
+        elif tag in self.BREAKS:
+            self._text.append("\n\n" if tag == "p" else "\n")
+    
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._heading_level:
+            self._heading_text.append(data)
+            return
+        self._text.append(data)
+        self._size += len(data)
+        if self._size >= self.flush_chars:
+            self.flush()
+
+
+class HtmlParser(DocumentParser):
+    
+    extensions = (".html", ".htm")
+    
+    def parse(self, source: str, stream: TextIO, chunker: Chunker) -> ChunkStream:
+        # HTMLParser is incremental: feed bounded blocks, chunk each section
+        # (text under one heading, capped in size) as soon as it is complete
+        parser = _HtmlSections(flush_chars=4 * chunker.chunk_size)
+        
+        def drain() -> Iterator[Chunk]:
+            sections, parser.sections = parser.sections, []
+            for start, title, text in sections:
+                yield from _shift(chunker.chunk_text(source, text), start, title)
+        
+        for data in iter(lambda: stream.read(BLOCK_CHARS), ""):
+            parser.feed(data)
+            parser.position += len(data)
+            yield from drain()
+        parser.close()
+        parser.flush()
+        yield from drain()
+
+
+def _flatten(value: Any, prefix: str = "") -> Iterator[str]:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, f"{prefix}.{key}" if prefix else str(key))
+    elif isinstance(value, list) and any(isinstance(item, (dict, list)) for item in value):
+        for i, item in enumerate(value):
+            yield from _flatten(item, f"{prefix}[{i}]")
+    elif isinstance(value, list):
+        yield f"{prefix}: {', '.join(str(item) for item in value)}"
+    elif value is not None and value != "":
+        yield f"{prefix}: {value}" if prefix else str(value)
+
+
+def _record_chunks(source: str, record: Any, start: int, end: int, chunker: Chunker) -> List[Chunk]:
+    # One chunk per record, "path: value" lines so each stands on its own
+    text = "\n".join(_flatten(record))
+    if not text:
+        return []
+    if len(text) <= chunker.chunk_size:
+        return [Chunk(source, text, start, end)]
+    return [Chunk(source, chunk.text, start, end, chunk.title) for chunk in chunker.chunk_text(source, text)]
+
+
+class NdjsonParser(DocumentParser):
+    
+    extensions = (".ndjson", ".jsonl")
+    
+    def parse(self, source: str, stream: TextIO, chunker: Chunker) -> ChunkStream:
+        offset = 0
+        for line in stream:
+            start, offset = offset, offset + len(line)
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            yield from _record_chunks(source, record, start, offset, chunker)
+
+
+class JsonParser(DocumentParser):
+    
+    extensions = (".json",)
+    
+    def parse(self, source: str, stream: TextIO, chunker: Chunker) -> ChunkStream:
+        for start, end, record in self._records(stream):
+            yield from _record_chunks(source, record, start, end, chunker)
+    
+    @staticmethod
+    def _records(stream: TextIO) -> Iterator[Tuple[int, int, Any]]:
+        # A top-level array is decoded one element at a time from a rolling
+        # buffer; any other document is small enough to load whole
+        decoder = json.JSONDecoder()
+        buffer = ""
+        base = position = 0
+        exhausted = False
+        
+        def fill() -> bool:
+            nonlocal buffer, base, position, exhausted
+            data = stream.read(BLOCK_CHARS)
+            if not data:
+                exhausted = True
+                return False
+            buffer = buffer[position:] + data
+            base += position
+            position = 0
+            return True
+        
+        def skip(characters: str):
+            nonlocal position
+            while True:
+                while position < len(buffer) and buffer[position] in characters:
+                    position += 1
+                if position < len(buffer) or not fill():
+                    return
+        
+        skip(" \t\r\n")
+        if position >= len(buffer):
+            return
+        if buffer[position] != "[":
+            while fill():
+                pass
+            document = json.loads(buffer[position:])
+            records = document if isinstance(document, list) else [document]
+            for record in records:
+                yield base, base + len(buffer), record
+            return
+        
+        position += 1
+        while True:
+            skip(" \t\r\n,")
+            if position >= len(buffer) or buffer[position] == "]":
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+                # A number cut at the block boundary still decodes
+                if end == len(buffer) and not exhausted and fill():
+                    continue
+            except json.JSONDecodeError:
+                if fill():
+                    continue
+                raise
+            yield base + position, base + end, record
+            position = end
+
+
+for _parser in (MarkdownParser(), CsvParser(), TextParser(), LogParser(), HtmlParser(), NdjsonParser(), JsonParser()):
+    register_parser(_parser)
@@ -1,22 +1,129 @@
 import os
 import glob
-from typing import List, Dict, Any
-from openai import OpenAI
+import asyncio
+import time
+import threading
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Set, Tuple, AsyncIterator, Optional
+
+from app.application.services.rag_cache import AnswerCache
+from app.application.services.rag_chunker import Chunk, Chunker
+from app.application.services.rag_index import InvertedIndex
+from app.application.services.rag_ingest import BATCH_CHUNKS, IngestedBatch, ingest_files
+from app.application.services.rag_llm import CircuitBreaker, LLMGateway, LLMUnavailableError
+from app.application.services.rag_manifest import FailedFile, FileEntry
+from app.application.services.rag_memory import ConversationMemory
+from app.application.services.rag_metrics import MetricsRecorder, RequestTrace
+from app.application.services.rag_packer import ContextPacker, estimate_tokens
+from app.application.services.rag_parsers import supported_extensions
+from app.application.services.rag_singleflight import SingleFlight
+from app.application.services.rag_store import MappedIndex, load_index, save_index
+from app.application.services.rag_tabular import Table
+from app.application.services.rag_text import tokenize
+from app.application.services.rag_vectors import VectorIndex, fuse_rankings
+from app.application.services.rag_watcher import DocumentWatcher
+
+@dataclass
+class PreparedChat:
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    sources: List[str] = field(default_factory=list)
+    response: Optional[str] = None
+    cache_key: Optional[Tuple] = None
+    context: str = ""
+    prompt_tokens: int = 0
+    question: str = ""
+    session_id: Optional[str] = None
+
 
 class RAGService:
     
+    RETRIEVAL_MODES = ("bm25", "vector", "hybrid")
+    FALLBACK_MESSAGE = (
+        "No momento não consigo gerar uma resposta completa. "
+        "Estes são os trechos mais relevantes que encontrei:"
+    )
+    
     def __init__(self):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError(
                 "OPENAI_API_KEY environment variable is required."
             )
-        self.client = OpenAI(api_key=api_key)
+        llm_timeout = float(os.getenv("RAG_LLM_TIMEOUT_SECONDS", "30"))
+        # openai is slow to import, so only services that are actually built
+        # pay for it
+        from openai import AsyncOpenAI
+        # Retries and deadlines are owned by the LLMGateway
+        # OPENAI_BASE_URL points chat at any OpenAI-compatible server, e.g.
+        # fake_llm_server.py for offline load tests
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            timeout=llm_timeout,
+            max_retries=0
+        )
+        self.llm = LLMGateway(
+            self.client,
+            max_concurrency=int(os.getenv("RAG_LLM_MAX_CONCURRENCY", "8")),
+            timeout=llm_timeout,
+            max_retries=int(os.getenv("RAG_LLM_MAX_RETRIES", "2")),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("RAG_BREAKER_FAILURE_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv("RAG_BREAKER_RESET_SECONDS", "30"))
+            )
+        )
         self.model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
         self.temperature = float(os.getenv("OPENAI_TEMPERATURE", "0.7"))
-        self.knowledge_base = {}
+        self.manifest: Dict[str, FileEntry] = {}
+        self.failed_files: Dict[str, FailedFile] = {}
+        self.chunker = Chunker()
+        self.chunks: Dict[int, Chunk] = {}
+        self.tables: Dict[str, Table] = {}
+        self.index = InvertedIndex()
+        self.vectors = VectorIndex()
+        self.index_version = 0
+        self._next_chunk_id = 0
+        self.max_chunks = 8
+        self.retrieval_mode = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+        if self.retrieval_mode not in self.RETRIEVAL_MODES:
+            raise ValueError(
+                f"RAG_RETRIEVAL_MODE must be one of: {', '.join(self.RETRIEVAL_MODES)}."
+            )
+        self.vector_min_score = 0.1
+        # Folded, stemmed trigrams give every word some overlap with its
+        # neighbours; hits far below the best one are that noise
+        self.vector_relative_min_score = 0.25
+        self.packer = ContextPacker(
+            token_budget=int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "800"))
+        )
         self.data_folder = "data/documents"
-        self.files_timestamp = 0
+        # Cold builds fan out over processes; small rebuilds stay in-process,
+        # where they are cheaper than starting a pool
+        self.ingest_workers = int(os.getenv("RAG_INGEST_WORKERS", "0")) or os.cpu_count() or 1
+        self.ingest_parallel_min_files = int(os.getenv("RAG_INGEST_PARALLEL_MIN_FILES", "32"))
+        self.ingest_batch_chunks = int(os.getenv("RAG_INGEST_BATCH_CHUNKS", str(BATCH_CHUNKS)))
+        # Chunks of files still being read: indexed, but not retrievable yet
+        self._staged: Set[int] = set()
+        self.index_path = os.getenv("RAG_INDEX_PATH", "data/rag_index.bin")
+        self._index_stat = None
+        # _lock guards what chat reads; _write_lock serializes rebuilds, which
+        # only take _lock to apply already read and chunked changes
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.watcher: Optional[DocumentWatcher] = None
+        self.answer_cache = AnswerCache(
+            max_entries=int(os.getenv("RAG_CACHE_MAX_ENTRIES", "1000")),
+            max_bytes=int(os.getenv("RAG_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("RAG_CACHE_TTL_SECONDS", "3600"))
+        )
+        self.single_flight = SingleFlight()
+        self.metrics = MetricsRecorder(capacity=int(os.getenv("RAG_METRICS_WINDOW", "1024")))
+        self.memory = ConversationMemory(
+            max_sessions=int(os.getenv("RAG_MEMORY_MAX_SESSIONS", "1000")),
+            max_turns=int(os.getenv("RAG_MEMORY_MAX_TURNS", "6")),
+            token_budget=int(os.getenv("RAG_MEMORY_TOKEN_BUDGET", "400")),
+            idle_seconds=float(os.getenv("RAG_MEMORY_IDLE_SECONDS", "1800"))
+        )
         
         system_prompt = os.getenv("RAG_SYSTEM_PROMPT")
         if not system_prompt:
@@ -24,26 +131,81 @@ class RAGService:
                 "RAG_SYSTEM_PROMPT environment variable is required. "
             )
         self.system_prompt = system_prompt
-
-    def _has_new_files(self) -> bool:
-        if not os.path.exists(self.data_folder):
+        
+        self._load_persisted_index()
+    
+    def _load_persisted_index(self) -> bool:
+        mapped = load_index(self.index_path)
+        if not mapped:
             return False
-            
-        patterns = [
-            f"{self.data_folder}/*.md",
-            f"{self.data_folder}/*.txt", 
-            f"{self.data_folder}/*.csv"
-        ]
         
-        current_max_time = 0
+        with self._lock:
+            self.index = mapped
+            self.vectors = mapped.vectors
+            self.chunks = mapped.chunks
+            self.manifest = mapped.manifest
+            self.tables = mapped.tables
+            self.index_version = mapped.meta["index_version"]
+            self._next_chunk_id = mapped.meta["next_chunk_id"]
+            self.answer_cache.clear()
+        self._index_stat = self._stat_index_file()
+        return True
+    
+    def _stat_index_file(self):
+        try:
+            stat = os.stat(self.index_path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    
+    def _ensure_mutable(self):
+        if isinstance(self.index, MappedIndex):
+            self.index, self.vectors, self.chunks = self.index.to_memory()
+    
+    def _save_index(self):
+        save_index(
+            self.index_path,
+            self.index,
+            self.vectors,
+            self.chunks,
+            self.manifest,
+            self.index_version,
+            self._next_chunk_id,
+            self.tables
+        )
+        self._index_stat = self._stat_index_file()
+    
+    def _list_files(self) -> Dict[str, str]:
+        patterns = [f"{self.data_folder}/*{extension}" for extension in supported_extensions()]
+        
+        files = {}
         for pattern in patterns:
             for file_path in glob.glob(pattern):
-                file_time = os.path.getmtime(file_path)
-                current_max_time = max(current_max_time, file_time)
+                files[os.path.basename(file_path)] = file_path
+        return files
+    
+    def _has_new_files(self) -> bool:
+        if not os.path.exists(self.data_folder):
+            return False
+        
+        files = self._list_files()
+        if files.keys() != self.manifest.keys() | self.failed_files.keys():
+            return True
         
-        return current_max_time > self.files_timestamp
+        for filename, file_path in files.items():
+            stat = os.stat(file_path)
+            # A file that broke keeps serving its last good version
+            entry = self.failed_files.get(filename) or self.manifest[filename]
+            if stat.st_size != entry.size or stat.st_mtime != entry.mtime:
+                return True
+        
+        return False
     
     def process_files(self) -> Dict[str, Any]:
+        with self._write_lock:
+            return self._process_files()
+    
+    def _process_files(self) -> Dict[str, Any]:
         processed_files = []
         errors = []
         
@@ -57,140 +219,476 @@ class RAGService:
                 "errors": []
             }
         
-        patterns = [
-            f"{self.data_folder}/*.md",
-            f"{self.data_folder}/*.txt", 
-            f"{self.data_folder}/*.csv"
-        ]
+        # Another worker may already have indexed the changes
+        if self._stat_index_file() != self._index_stat:
+            self._load_persisted_index()
         
-        files = []
-        for pattern in patterns:
-            files.extend(glob.glob(pattern))
+        files = self._list_files()
+        manifest_changed = False
+        removed_files = [filename for filename in self.manifest if filename not in files]
+        self.failed_files = {
+            filename: failed for filename, failed in self.failed_files.items() if filename in files
+        }
+        changed: Dict[str, Tuple[str, os.stat_result]] = {}
         
-        if not files:
+        for filename, file_path in files.items():
+            try:
+                stat = os.stat(file_path)
+                entry = self.failed_files.get(filename) or self.manifest.get(filename)
+                if entry and stat.st_size == entry.size and stat.st_mtime == entry.mtime:
+                    if isinstance(entry, FailedFile):
+                        errors.append(f"{filename}: {entry.error}")
+                    continue
+                changed[filename] = (file_path, stat)
+            
+            except Exception as e:
+                errors.append(f"{filename}: {str(e)}")
+        
+        # One version per run, however many files it publishes
+        version = self.index_version + 1
+        if removed_files:
+            with self._lock:
+                for filename in removed_files:
+                    self._remove_file(filename)
+                self.index_version = version
+                self.answer_cache.clear()
+        
+        # Batches go into the index as they arrive, staged; a file's chunks
+        # replace its old ones only once it has been read to the end, so
+        # readers see either version of a file, never a mix. Parsed while
+        # hashed, so a touched but unchanged file costs one read and its
+        # staged chunks are simply dropped
+        staging: Dict[str, List[Tuple[int, Chunk]]] = {}
+        try:
+            for event in self._ingest_files(
+                [(filename, file_path) for filename, (file_path, _) in changed.items()]
+            ):
+                if isinstance(event, IngestedBatch):
+                    with self._lock:
+                        staging.setdefault(event.filename, []).extend(self._stage_chunks(event))
+                    continue
+                
+                filename = event.filename
+                staged = staging.pop(filename, [])
+                file_path, stat = changed[filename]
+                entry = self.manifest.get(filename)
+                if event.error or (entry and event.content_hash == entry.content_hash):
+                    with self._lock:
+                        self._drop_staged(staged)
+                    if event.error:
+                        errors.append(f"{filename}: {event.error}")
+                        self.failed_files[filename] = FailedFile(
+                            path=file_path,
+                            size=stat.st_size,
+                            mtime=stat.st_mtime,
+                            error=event.error
+                        )
+                    else:
+                        self.failed_files.pop(filename, None)
+                        entry.size, entry.mtime = stat.st_size, stat.st_mtime
+                        manifest_changed = True
+                    continue
+                
+                self.failed_files.pop(filename, None)
+                entry = FileEntry(
+                    path=file_path,
+                    size=stat.st_size,
+                    mtime=stat.st_mtime,
+                    content_hash=event.content_hash
+                )
+                with self._lock:
+                    self._remove_file(filename)
+                    entry.chunk_ids = self._publish_staged(staged)
+                    self.manifest[filename] = entry
+                    if event.table is not None:
+                        event.table.chunk_ids = entry.chunk_ids
+                        self.tables[filename] = event.table
+                    self.index_version = version
+                    self.answer_cache.clear()
+                processed_files.append(filename)
+        finally:
+            # Whatever a failed run left half-read never becomes visible
+            with self._lock:
+                for staged in staging.values():
+                    self._drop_staged(staged)
+        
+        if processed_files or removed_files or manifest_changed:
+            try:
+                self._save_index()
+            except OSError as e:
+                errors.append(f"{self.index_path}: {str(e)}")
+        
+        if not self.manifest:
             return {
                 "message": "No supported files found in data/documents/ folder.",
                 "processed_files": [],
+                "removed_files": removed_files,
                 "total_files": 0,
                 "knowledge_base_ready": False,
-                "errors": []
+                "errors": errors
             }
         
-        self.knowledge_base = {}
-        
-        for file_path in files:
-            try:
-                filename = os.path.basename(file_path)
-                content = self._read_file(file_path)
-                
-                if content:
-                    self.knowledge_base[filename] = content
-                    processed_files.append(filename)
-                
-            except Exception as e:
-                errors.append(f"{filename}: {str(e)}")
-        
-        import time
-        self.files_timestamp = time.time()
-        
         return {
             "message": f"Processed {len(processed_files)} file(s) successfully.",
             "processed_files": processed_files,
-            "total_files": len(processed_files),
+            "removed_files": removed_files,
+            "total_files": len(self.manifest),
             "errors": errors,
-            "knowledge_base_ready": len(processed_files) > 0
+            "knowledge_base_ready": len(self.manifest) > 0
         }
     
-    def _read_file(self, file_path: str) -> str:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                ext = os.path.splitext(file_path)[1].lower()
-                
-                if ext in ['.md', '.txt']:
-                    return file.read()
-                
-                elif ext == '.csv':
-                    content = []
-                    lines = file.readlines()
-                    for i, line in enumerate(lines):
-                        if i == 0:
-                            content.append(f"Cabeçalho: {line.strip()}")
-                        else:
-                            content.append(line.strip())
-                    return "\n".join(content)
-                
-        except Exception as e:
-            raise Exception(f"Error reading file: {e}")
+    def _stage_chunks(self, batch: IngestedBatch) -> List[Tuple[int, Chunk]]:
+        # Tokens and vectors come precomputed by ingestion
+        self._ensure_mutable()
+        staged = []
+        for chunk, tokens, vector in zip(batch.chunks, batch.tokens, batch.vectors):
+            chunk_id = self._next_chunk_id
+            self._next_chunk_id += 1
+            self.index.add(chunk_id, tokens)
+            self.vectors.add_vector(chunk_id, vector)
+            self._staged.add(chunk_id)
+            staged.append((chunk_id, chunk))
+        return staged
     
-    def chat(self, message: str) -> Dict[str, Any]:
-        # Auto-load or reload files if needed
-        if not self.knowledge_base or self._has_new_files():
-            files_result = self.process_files()
-            if not files_result.get("processed_files"):
-                return {
-                    "response": "Nenhum arquivo encontrado em data/documents/",
-                    "sources": []
-                }
+    def _publish_staged(self, staged: List[Tuple[int, Chunk]]) -> List[int]:
+        self._ensure_mutable()
+        for chunk_id, chunk in staged:
+            self.chunks[chunk_id] = chunk
+            self._staged.discard(chunk_id)
+        return [chunk_id for chunk_id, _ in staged]
+    
+    def _drop_staged(self, staged: List[Tuple[int, Chunk]]):
+        for chunk_id, _ in staged:
+            self.index.remove(chunk_id)
+            self.vectors.remove(chunk_id)
+            self._staged.discard(chunk_id)
+    
+    def _remove_file(self, filename: str):
+        self.tables.pop(filename, None)
+        entry = self.manifest.pop(filename, None)
+        if not entry:
+            return
         
-        relevant_docs = []
-        message_lower = message.lower()
+        self._ensure_mutable()
+        for chunk_id in entry.chunk_ids:
+            self.index.remove(chunk_id)
+            self.vectors.remove(chunk_id)
+            del self.chunks[chunk_id]
+    
+    def _ingest_files(self, files: List[Tuple[str, str]]):
+        workers = self.ingest_workers if len(files) >= self.ingest_parallel_min_files else 1
+        return ingest_files(files, self.chunker, self.vectors.dim, workers, self.ingest_batch_chunks)
+    
+    def warm_up(self) -> Dict[str, Any]:
+        return self.process_files()
+    
+    def start_watching(self) -> DocumentWatcher:
+        if self.watcher is None:
+            self.watcher = DocumentWatcher(
+                self.data_folder,
+                self.process_files,
+                extensions=supported_extensions(),
+                debounce_seconds=float(os.getenv("RAG_WATCH_DEBOUNCE_SECONDS", "0.5")),
+                poll_interval=float(os.getenv("RAG_WATCH_POLL_SECONDS", "2")),
+                backend=os.getenv("RAG_WATCH_BACKEND", "auto")
+            )
+            self.watcher.start()
+        return self.watcher
+    
+    def stop_watching(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+    
+    def _prepare(self, message: str, filters: Optional[Dict[str, Any]] = None,
+                 session_id: Optional[str] = None, trace: Optional[RequestTrace] = None) -> PreparedChat:
+        trace = trace or RequestTrace()
+        with trace.stage("reload_check"):
+            if self.watcher is not None:
+                # The watcher keeps the index current; chat never touches the disk
+                self.watcher.wait_ready(self.llm.timeout)
+            elif not (self.manifest or self.failed_files) or self._has_new_files():
+                self.process_files()
         
-        for filename, content in self.knowledge_base.items():
-            content_lower = content.lower()
-            if any(word in content_lower for word in message_lower.split() if len(word) > 3):
-                relevant_docs.append((filename, content))
+        with self._lock:
+            if not self.manifest:
+                return PreparedChat(response="Nenhum arquivo encontrado em data/documents/")
+            
+            with trace.stage("retrieval"):
+                ranking = self._retrieve(message)
+                chunk_ids = [chunk_id for chunk_id, _score in ranking]
+                chunk_ids = self._focus_tables(chunk_ids, frozenset(tokenize(message)), filters)
+            trace.top_scores = [round(score, 4) for _chunk_id, score in ranking]
+            
+            if not chunk_ids:
+                chunk_ids = [
+                    chunk_id
+                    for entry in self.manifest.values()
+                    for chunk_id in entry.chunk_ids
+                ]
+            
+            with trace.stage("packing"):
+                packed = self.packer.pack([self.chunks[i] for i in chunk_ids])
+            index_version = self.index_version
         
-        if not relevant_docs:
-            relevant_docs = list(self.knowledge_base.items())
+        with trace.stage("packing"):
+            # Earlier turns change the answer, so they are part of the cache key
+            history = self.memory.messages(session_id) if session_id else []
+            cache_key = (
+                " ".join(tokenize(message)),
+                tuple(chunk_ids),
+                index_version,
+                self.memory.fingerprint(history)
+            )
+            
+            messages = [
+                {
+                    "role": "system", 
+                    "content": self.system_prompt
+                },
+                *history,
+                {
+                    "role": "user",
+                    "content": f"Contexto:\n{packed.text}\n\nPergunta: {message}"
+                }
+            ]
+            prompt_tokens = self._count_prompt_tokens(messages)
+        trace.prompt_tokens = prompt_tokens
         
-        context = ""
-        used_sources = []
-        max_context_length = 3000
+        return PreparedChat(
+            messages=messages,
+            sources=packed.sources,
+            cache_key=cache_key,
+            context=packed.text,
+            prompt_tokens=prompt_tokens,
+            question=message,
+            session_id=session_id
+        )
+    
+    def _remember(self, prepared: PreparedChat, answer: str):
+        if prepared.session_id:
+            self.memory.append(prepared.session_id, prepared.question, answer)
+    
+    def _focus_tables(self, chunk_ids: List[int], query_tokens: frozenset,
+                      filters: Optional[Dict[str, Any]]) -> List[int]:
+        # A question about specific rows (or explicit column filters) gets
+        # exactly those rows instead of whichever rows happened to rank
+        for table in self.tables.values():
+            rows = table.select(filters) if filters else table.match(query_tokens)
+            if rows is None or (not filters and not rows):
+                continue
+            
+            table_ids = set(table.chunk_ids)
+            kept = [chunk_id for chunk_id in chunk_ids if chunk_id not in table_ids]
+            position = next(
+                (i for i, chunk_id in enumerate(chunk_ids) if chunk_id in table_ids),
+                0
+            )
+            selected = [table.chunk_ids[row] for row in rows[:self.max_chunks]]
+            chunk_ids = kept[:position] + selected + kept[position:]
         
-        for filename, content in relevant_docs[:3]:  # Max 3 documents
-            if len(context) + len(content) < max_context_length:
-                context += f"\n--- {filename} ---\n{content}\n"
-                used_sources.append(filename)
-            else:
-                remaining_space = max_context_length - len(context)
-                if remaining_space > 100:
-                    context += f"\n--- {filename} (parcial) ---\n{content[:remaining_space]}\n"
-                    used_sources.append(f"{filename} (parcial)")
-                break
+        return chunk_ids
+    
+    @staticmethod
+    def _count_prompt_tokens(messages: List[Dict[str, str]]) -> int:
+        # Chat formatting adds a few tokens per message
+        return sum(estimate_tokens(message["content"]) + 4 for message in messages) + 3
+    
+    async def chat(self, message: str, filters: Optional[Dict[str, Any]] = None,
+                   session_id: Optional[str] = None) -> Dict[str, Any]:
+        trace = RequestTrace()
+        try:
+            # Index refreshes touch the filesystem, keep them off the event loop
+            prepared = await asyncio.to_thread(self._prepare, message, filters, session_id, trace)
+            if prepared.response is not None:
+                return {
+                    "response": prepared.response,
+                    "sources": prepared.sources,
+                    "prompt_tokens": 0
+                }
+            
+            cached = self.answer_cache.get(prepared.cache_key)
+            trace.cache_hit = cached is not None
+            if cached is None:
+                # Concurrent identical questions share one upstream completion
+                with trace.stage("llm"):
+                    cached = await self.single_flight.do(prepared.cache_key, lambda: self._complete(prepared))
+                trace.completion_tokens = estimate_tokens(cached["response"])
+            trace.degraded = bool(cached.get("degraded"))
+            if not trace.degraded:
+                self._remember(prepared, cached["response"])
+            return {**cached, "prompt_tokens": prepared.prompt_tokens}
         
+        except Exception:
+            trace.failed = True
+            raise
+        
+        finally:
+            self.metrics.record(trace)
+    
+    def _fallback_response(self, prepared: PreparedChat) -> str:
+        return f"{self.FALLBACK_MESSAGE}\n{prepared.context}"
+    
+    async def _complete(self, prepared: PreparedChat) -> Dict[str, Any]:
         try:
-            response = self.client.chat.completions.create(
+            response = await self.llm.complete(
                 model=self.model,
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": self.system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Contexto:\n{context}\n\nPergunta: {message}"
-                    }
-                ],
+                messages=prepared.messages,
                 max_tokens=500,
                 temperature=self.temperature
             )
             
-            return {
+            result = {
                 "response": response.choices[0].message.content,
-                "sources": used_sources
+                "sources": prepared.sources
             }
-            
+            self.answer_cache.set(prepared.cache_key, result)
+            return result
+        
+        except LLMUnavailableError:
+            return {
+                "response": self._fallback_response(prepared),
+                "sources": prepared.sources,
+                "degraded": True
+            }
+        
         except Exception as e:
             return {
                 "response": f"Erro ao gerar resposta: {str(e)}.",
-                "sources": used_sources
+                "sources": prepared.sources,
+                "degraded": True
             }
     
+    async def chat_stream(self, message: str, filters: Optional[Dict[str, Any]] = None,
+                          session_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        trace = RequestTrace(streamed=True)
+        try:
+            async for event in self._chat_stream(message, filters, session_id, trace):
+                yield event
+        finally:
+            # Also when the client goes away mid-stream
+            self.metrics.record(trace)
+    
+    async def _chat_stream(self, message: str, filters: Optional[Dict[str, Any]], session_id: Optional[str],
+                           trace: RequestTrace) -> AsyncIterator[Dict[str, Any]]:
+        try:
+            prepared = await asyncio.to_thread(self._prepare, message, filters, session_id, trace)
+        except ValueError as e:
+            trace.failed = True
+            yield {"event": "error", "data": str(e)}
+            return
+        yield {"event": "sources", "data": prepared.sources}
+        
+        if prepared.response is not None:
+            yield {"event": "token", "data": prepared.response}
+            yield {"event": "done", "data": {"prompt_tokens": 0}}
+            return
+        
+        cached = self.answer_cache.get(prepared.cache_key)
+        trace.cache_hit = cached is not None
+        if cached is not None:
+            self._remember(prepared, cached["response"])
+            yield {"event": "token", "data": cached["response"]}
+            yield {"event": "done", "data": {"prompt_tokens": prepared.prompt_tokens}}
+            return
+        
+        tokens = []
+        started = time.perf_counter()
+        flight = self.single_flight.stream(prepared.cache_key, lambda: self._stream_completion(prepared))
+        async for event in flight:
+            if event["event"] == "token":
+                if not tokens:
+                    trace.stages["llm_first_token"] = time.perf_counter() - started
+                tokens.append(event["data"])
+            elif event["event"] == "done":
+                trace.stages["llm"] = time.perf_counter() - started
+                trace.completion_tokens = estimate_tokens("".join(tokens))
+                trace.degraded = bool(event["data"].get("degraded"))
+                if not trace.degraded:
+                    self._remember(prepared, "".join(tokens))
+            elif event["event"] == "error":
+                trace.failed = True
+            yield event
+    
+    async def _stream_completion(self, prepared: PreparedChat) -> AsyncIterator[Dict[str, Any]]:
+        tokens = []
+        try:
+            stream = self.llm.stream(
+                model=self.model,
+                messages=prepared.messages,
+                max_tokens=500,
+                temperature=self.temperature
+            )
+            
+            async for token in stream:
+                tokens.append(token)
+                yield {"event": "token", "data": token}
+            
+            self.answer_cache.set(prepared.cache_key, {
+                "response": "".join(tokens),
+                "sources": prepared.sources
+            })
+            yield {"event": "done", "data": {"prompt_tokens": prepared.prompt_tokens}}
+        
+        except LLMUnavailableError as e:
+            if tokens:
+                yield {"event": "error", "data": f"Erro ao gerar resposta: {str(e)}."}
+            else:
+                yield {"event": "token", "data": self._fallback_response(prepared)}
+                yield {"event": "done", "data": {"prompt_tokens": prepared.prompt_tokens, "degraded": True}}
+        
+        except Exception as e:
+            yield {"event": "error", "data": f"Erro ao gerar resposta: {str(e)}."}
+    
+    def _retrieve(self, message: str) -> List[Tuple[int, float]]:
+        query_tokens = tokenize(message)
+        k = self.max_chunks
+        
+        if self.retrieval_mode == "bm25":
+            return self._published(self.index.search(query_tokens, k=k))
+        if self.retrieval_mode == "vector":
+            return self._vector_search(query_tokens, k)
+        
+        return fuse_rankings([
+            self._published(self.index.search(query_tokens, k=2 * k)),
+            self._vector_search(query_tokens, 2 * k)
+        ], k=k)
+    
+    def _published(self, hits: List[Tuple[int, float]]) -> List[Tuple[int, float]]:
+        if not self._staged:
+            return hits
+        return [(chunk_id, score) for chunk_id, score in hits if chunk_id not in self._staged]
+    
+    def _vector_search(self, query_tokens: List[str], k: int) -> List[Tuple[int, float]]:
+        hits = self._published(self.vectors.search(query_tokens, k=k, min_score=self.vector_min_score))
+        if not hits:
+            return hits
+        cutoff = hits[0][1] * self.vector_relative_min_score
+        return [(chunk_id, score) for chunk_id, score in hits if score >= cutoff]
+    
     def get_status(self) -> Dict[str, Any]:
         return {
-            "knowledge_base_loaded": len(self.knowledge_base) > 0,
-            "files_count": len(self.knowledge_base),
-            "loaded_files": list(self.knowledge_base.keys()),
+            "knowledge_base_loaded": len(self.manifest) > 0,
+            "files_count": len(self.manifest),
+            "loaded_files": list(self.manifest.keys()),
+            "chunks_count": len(self.chunks),
+            "tables": {
+                filename: {"rows": len(table), "columns": table.types}
+                for filename, table in self.tables.items()
+            },
+            "index_version": self.index_version,
+            "index_path": self.index_path,
+            "index_memory_mapped": isinstance(self.index, MappedIndex),
+            "ingest_workers": self.ingest_workers,
+            "retrieval_mode": self.retrieval_mode,
+            "context_token_budget": self.packer.token_budget,
+            "answer_cache": self.answer_cache.stats(),
+            "single_flight": self.single_flight.stats(),
+            "memory": self.memory.stats(),
+            "metrics": self.metrics.summary(),
+            "llm": self.llm.stats(),
+            "llm_base_url": str(getattr(self.client, "base_url", "")),
+            "watcher": self.watcher.stats() if self.watcher else None,
             "data_folder": self.data_folder,
-            "supported_formats": [".md", ".txt", ".csv"]
+            "supported_formats": list(supported_extensions())
         }
@@ -0,0 +1,91 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class StreamFlight:
+    
+    def __init__(self, source: AsyncIterator[Any]):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Condition()
+        self.task = asyncio.ensure_future(self._produce(source))
+    
+    async def _produce(self, source: AsyncIterator[Any]):
+        try:
+            async for item in source:
+                async with self._changed:
+                    self.items.append(item)
+                    self._changed.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+    
+    async def subscribe(self) -> AsyncIterator[Any]:
+        # Late subscribers replay what was already produced, then follow along
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: position < len(self.items) or self.done)
+                items = self.items[position:]
+                finished = self.done
+            
+            for item in items:
+                yield item
+            position += len(items)
+            
+            if finished and position >= len(self.items):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._streams: Dict[Hashable, StreamFlight] = {}
+        self.leaders = 0
+        self.shared = 0
+    
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            # The upstream call runs as its own task so a cancelled caller
+            # does not cancel it for everybody else waiting on it
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._release(self._calls, key, task))
+        else:
+            self.shared += 1
+        
+        return await asyncio.shield(task)
+    
+    async def stream(self, key: Hashable, fn: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        flight = self._streams.get(key)
+        if flight is None:
+            self.leaders += 1
+            flight = StreamFlight(fn())
+            self._streams[key] = flight
+            flight.task.add_done_callback(lambda _: self._release(self._streams, key, flight))
+        else:
+            self.shared += 1
+        
+        async for item in flight.subscribe():
+            yield item
+    
+    @staticmethod
+    def _release(flights: Dict[Hashable, Any], key: Hashable, flight: Any):
+        if flights.get(key) is flight:
+            del flights[key]
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "leaders": self.leaders,
+            "shared": self.shared
+        }
@@ -0,0 +1,356 @@
+import heapq
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from dataclasses import asdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.application.services.rag_chunker import Chunk
+from app.application.services.rag_index import InvertedIndex
+from app.application.services.rag_manifest import FileEntry
+from app.application.services.rag_tabular import Table
+from app.application.services.rag_text import TOKENIZER_VERSION
+from app.application.services.rag_vectors import VectorIndex
+
+MAGIC = b"RAGIDX01"
+FORMAT_VERSION = 3
+
+# Sections are written in this order, each aligned to 8 bytes
+SECTIONS = (
+    "meta",              # JSON: manifest, sources, counters, BM25 params, CSV tables
+    "term_offsets",      # Q[V + 1] offsets into term_blob
+    "term_blob",         # sorted utf-8 terms
+    "posting_offsets",   # Q[V + 1] offsets into posting_docs/posting_tfs
+    "posting_docs",      # I[P] chunk positions
+    "posting_tfs",       # I[P] term frequencies
+    "chunk_ids",         # Q[N] ascending chunk ids
+    "doc_lengths",       # I[N]
+    "chunk_sources",     # I[N] index into meta["sources"]
+    "chunk_spans",       # Q[2N] start/end offsets in the source file
+    "text_offsets",      # Q[N + 1] offsets into text_blob
+    "text_blob",
+    "title_offsets",     # Q[N + 1] offsets into title_blob
+    "title_blob",
+    "vectors",           # f[N * dim] L2-normalized chunk vectors, row per position
+    "vector_df",         # q[dim] per-bucket document frequency
+)
+SECTION_FORMATS = {
+    "term_offsets": "Q",
+    "posting_offsets": "Q",
+    "posting_docs": "I",
+    "posting_tfs": "I",
+    "chunk_ids": "Q",
+    "doc_lengths": "I",
+    "chunk_sources": "I",
+    "chunk_spans": "Q",
+    "text_offsets": "Q",
+    "title_offsets": "Q",
+    "vectors": "f",
+    "vector_df": "q",
+}
+HEADER = struct.Struct(f"<8sII{len(SECTIONS) * 2}Q")
+
+
+def _offsets(items: Iterable[bytes]) -> Tuple[array, bytes]:
+    offsets = array("Q", [0])
+    blob = bytearray()
+    for item in items:
+        blob += item
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+
+def save_index(path: str, index: InvertedIndex, vectors: VectorIndex, chunks: Dict[int, Chunk],
+               manifest: Dict[str, FileEntry], index_version: int, next_chunk_id: int,
+               tables: Optional[Dict[str, Table]] = None):
+    chunk_ids = sorted(chunks)
+    positions = {chunk_id: position for position, chunk_id in enumerate(chunk_ids)}
+    sources = sorted({chunk.source for chunk in chunks.values()})
+    source_ids = {source: i for i, source in enumerate(sources)}
+    terms = sorted(index.postings)
+    
+    posting_offsets = array("Q", [0])
+    posting_docs = array("I")
+    posting_tfs = array("I")
+    for term in terms:
+        for chunk_id, tf in sorted(index.postings[term].items()):
+            posting_docs.append(positions[chunk_id])
+            posting_tfs.append(tf)
+        posting_offsets.append(len(posting_docs))
+    
+    term_offsets, term_blob = _offsets(term.encode("utf-8") for term in terms)
+    text_offsets, text_blob = _offsets(chunks[i].text.encode("utf-8") for i in chunk_ids)
+    title_offsets, title_blob = _offsets((chunks[i].title or "").encode("utf-8") for i in chunk_ids)
+    
+    meta = {
+        "byteorder": sys.byteorder,
+        "tokenizer": TOKENIZER_VERSION,
+        "index_version": index_version,
+        "next_chunk_id": next_chunk_id,
+        "total_length": index.total_length,
+        "k1": index.k1,
+        "b": index.b,
+        "vector_dim": vectors.dim,
+        "sources": sources,
+        "manifest": {filename: asdict(entry) for filename, entry in manifest.items()},
+        "tables": {filename: table.to_dict() for filename, table in (tables or {}).items()},
+    }
+    
+    sections = {
+        "meta": json.dumps(meta).encode("utf-8"),
+        "term_offsets": term_offsets,
+        "term_blob": term_blob,
+        "posting_offsets": posting_offsets,
+        "posting_docs": posting_docs,
+        "posting_tfs": posting_tfs,
+        "chunk_ids": array("Q", chunk_ids),
+        "doc_lengths": array("I", (index.doc_lengths[i] for i in chunk_ids)),
+        "chunk_sources": array("I", (source_ids[chunks[i].source] for i in chunk_ids)),
+        "chunk_spans": array("Q", (value for i in chunk_ids for value in (chunks[i].start, chunks[i].end))),
+        "text_offsets": text_offsets,
+        "text_blob": text_blob,
+        "title_offsets": title_offsets,
+        "title_blob": title_blob,
+        "vectors": np.ascontiguousarray(
+            vectors.matrix[[vectors.rows[i] for i in chunk_ids]], dtype=np.float32
+        ).reshape(len(chunk_ids), vectors.dim).tobytes(),
+        "vector_df": np.ascontiguousarray(vectors.df, dtype=np.int64).tobytes(),
+    }
+    
+    table = []
+    offset = HEADER.size
+    payloads = []
+    for name in SECTIONS:
+        payload = sections[name]
+        data = payload.tobytes() if isinstance(payload, array) else payload
+        padding = -offset % 8
+        offset += padding
+        table.extend((offset, len(data)))
+        payloads.append(b"\0" * padding + data)
+        offset += len(data)
+    
+    # Write next to the target and swap it in, so processes that still map
+    # the previous file keep a valid view of it
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(tmp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(SECTIONS), *table))
+        for payload in payloads:
+            file.write(payload)
+        # On disk before the rename, or a crash could leave a truncated file
+        # under the final name
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    _fsync_directory(os.path.dirname(path) or ".")
+
+
+def _fsync_directory(path: str):
+    # Makes the rename itself durable; not every platform can open a directory
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def load_index(path: str) -> Optional["MappedIndex"]:
+    try:
+        with open(path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    
+    if len(buffer) < HEADER.size:
+        return None
+    
+    magic, version, count, *table = HEADER.unpack_from(buffer)
+    if magic != MAGIC or version != FORMAT_VERSION or count != len(SECTIONS):
+        return None
+    # A short or corrupt file is rebuilt like any other unusable index
+    if any(offset + length > len(buffer) for offset, length in zip(table[::2], table[1::2])):
+        return None
+    try:
+        index = MappedIndex(buffer, table)
+    except (ValueError, TypeError, KeyError, IndexError):
+        return None
+    
+    # Terms produced by another tokenizer would never match today's queries
+    if index.meta.get("byteorder") != sys.byteorder or index.meta.get("tokenizer") != TOKENIZER_VERSION:
+        return None
+    return index
+
+
+class MappedIndex:
+    
+    def __init__(self, buffer: mmap.mmap, table: List[int]):
+        self.buffer = buffer
+        view = memoryview(buffer)
+        self.sections: Dict[str, Any] = {}
+        for i, name in enumerate(SECTIONS):
+            offset, length = table[2 * i], table[2 * i + 1]
+            section = view[offset:offset + length]
+            if name in SECTION_FORMATS:
+                section = section.cast(SECTION_FORMATS[name])
+            self.sections[name] = section
+        
+        self.meta = json.loads(bytes(self.sections["meta"]))
+        self.k1 = self.meta["k1"]
+        self.b = self.meta["b"]
+        self.total_length = self.meta["total_length"]
+        self.chunks = MappedChunks(self)
+        self.vectors = VectorIndex.from_arrays(
+            np.frombuffer(self.sections["vectors"], dtype=np.float32).reshape(len(self), self.meta["vector_dim"]),
+            self.sections["chunk_ids"],
+            np.frombuffer(self.sections["vector_df"], dtype=np.int64)
+        )
+    
+    def __len__(self) -> int:
+        return len(self.sections["chunk_ids"])
+    
+    @property
+    def manifest(self) -> Dict[str, FileEntry]:
+        return {
+            filename: FileEntry(**entry)
+            for filename, entry in self.meta["manifest"].items()
+        }
+    
+    @property
+    def tables(self) -> Dict[str, Table]:
+        return {
+            filename: Table.from_dict(table)
+            for filename, table in self.meta["tables"].items()
+        }
+    
+    def _term_position(self, term: str) -> int:
+        offsets = self.sections["term_offsets"]
+        blob = self.sections["term_blob"]
+        target = term.encode("utf-8")
+        
+        lo, hi = 0, len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if blob[offsets[mid]:offsets[mid + 1]].tobytes() < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(offsets) - 1 and blob[offsets[lo]:offsets[lo + 1]].tobytes() == target:
+            return lo
+        return -1
+    
+    def search(self, query_tokens: Iterable[str], k: int = 10) -> List[Tuple[int, float]]:
+        doc_count = len(self)
+        if not doc_count:
+            return []
+        
+        posting_offsets = self.sections["posting_offsets"]
+        posting_docs = self.sections["posting_docs"]
+        posting_tfs = self.sections["posting_tfs"]
+        doc_lengths = self.sections["doc_lengths"]
+        chunk_ids = self.sections["chunk_ids"]
+        
+        avg_length = self.total_length / doc_count or 1.0
+        k1 = self.k1
+        length_weight = k1 * self.b / avg_length
+        base_weight = k1 * (1 - self.b)
+        
+        scores: Dict[int, float] = {}
+        for term in set(query_tokens):
+            position = self._term_position(term)
+            if position < 0:
+                continue
+            
+            start, end = posting_offsets[position], posting_offsets[position + 1]
+            df = end - start
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            
+            for doc, tf in zip(posting_docs[start:end], posting_tfs[start:end]):
+                norm = base_weight + length_weight * doc_lengths[doc]
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(chunk_ids[doc], score) for doc, score in top]
+    
+    def to_memory(self) -> Tuple[InvertedIndex, VectorIndex, Dict[int, Chunk]]:
+        index = InvertedIndex(k1=self.k1, b=self.b)
+        term_offsets = self.sections["term_offsets"]
+        term_blob = self.sections["term_blob"]
+        posting_offsets = self.sections["posting_offsets"]
+        posting_docs = self.sections["posting_docs"]
+        posting_tfs = self.sections["posting_tfs"]
+        chunk_ids = self.sections["chunk_ids"]
+        
+        doc_terms: Dict[int, List[str]] = {chunk_id: [] for chunk_id in chunk_ids}
+        for position in range(len(term_offsets) - 1):
+            term = term_blob[term_offsets[position]:term_offsets[position + 1]].tobytes().decode("utf-8")
+            start, end = posting_offsets[position], posting_offsets[position + 1]
+            postings = {}
+            for doc, tf in zip(posting_docs[start:end], posting_tfs[start:end]):
+                chunk_id = chunk_ids[doc]
+                postings[chunk_id] = tf
+                doc_terms[chunk_id].append(term)
+            index.postings[term] = postings
+        
+        for position, chunk_id in enumerate(chunk_ids):
+            index.doc_lengths[chunk_id] = self.sections["doc_lengths"][position]
+            index.doc_terms[chunk_id] = tuple(doc_terms[chunk_id])
+        index.total_length = self.total_length
+        
+        vectors = VectorIndex.from_arrays(
+            np.array(self.vectors.matrix),
+            self.sections["chunk_ids"],
+            np.array(self.vectors.df)
+        )
+        
+        return index, vectors, dict(self.chunks.items())
+
+
+class MappedChunks(Mapping):
+    
+    def __init__(self, index: MappedIndex):
+        self.index = index
+        self.sections = index.sections
+        self.sources = index.meta["sources"]
+    
+    def __len__(self) -> int:
+        return len(self.sections["chunk_ids"])
+    
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.sections["chunk_ids"])
+    
+    def _position(self, chunk_id: int) -> int:
+        chunk_ids = self.sections["chunk_ids"]
+        position = bisect_left(chunk_ids, chunk_id)
+        if position == len(chunk_ids) or chunk_ids[position] != chunk_id:
+            raise KeyError(chunk_id)
+        return position
+    
+    def __getitem__(self, chunk_id: int) -> Chunk:
+        position = self._position(chunk_id)
+        sections = self.sections
+        text_offsets = sections["text_offsets"]
+        title_offsets = sections["title_offsets"]
+        
+        text = sections["text_blob"][text_offsets[position]:text_offsets[position + 1]]
+        title = sections["title_blob"][title_offsets[position]:title_offsets[position + 1]]
+        
+        return Chunk(
+            source=self.sources[sections["chunk_sources"][position]],
+            text=text.tobytes().decode("utf-8"),
+            start=sections["chunk_spans"][2 * position],
+            end=sections["chunk_spans"][2 * position + 1],
+            title=title.tobytes().decode("utf-8") or None
+        )
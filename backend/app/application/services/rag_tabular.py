@@ -0,0 +1,191 @@
+import csv
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+from app.application.services.rag_text import tokenize
+
+# "8.90", "1,99" and "1.234,56"; a comma makes dots thousands separators
+NUMBER_PATTERN = re.compile(r"^[-+]?(?:\d{1,3}(?:\.\d{3})+|\d+)(?:[.,]\d+)?$")
+FILTER_OPERATORS = {
+    "eq": lambda value, target: value == target,
+    "ne": lambda value, target: value != target,
+    "lt": lambda value, target: value is not None and value < target,
+    "lte": lambda value, target: value is not None and value <= target,
+    "gt": lambda value, target: value is not None and value > target,
+    "gte": lambda value, target: value is not None and value >= target,
+    "contains": lambda value, target: value is not None and target in value,
+}
+MIN_MATCH_SCORE = 0.5
+
+
+def parse_number(value: str) -> Optional[float]:
+    text = value.strip()
+    if text.startswith("R$"):
+        text = text[2:].strip()
+    if text.endswith("%"):
+        text = text[:-1].strip()
+    if not NUMBER_PATTERN.match(text):
+        return None
+    if "," in text:
+        text = text.replace(".", "").replace(",", ".")
+    return float(text)
+
+
+def _normalize(value: Any) -> Any:
+    return value.strip().casefold() if isinstance(value, str) else value
+
+
+@dataclass
+class Table:
+    columns: List[str]
+    types: Dict[str, str] = field(default_factory=dict)
+    values: Dict[str, List[Any]] = field(default_factory=dict)
+    raw: Dict[str, List[str]] = field(default_factory=dict)
+    spans: List[Tuple[int, int]] = field(default_factory=list)
+    chunk_ids: List[int] = field(default_factory=list)
+    _row_tokens: Optional[List[Dict[str, FrozenSet[str]]]] = field(default=None, init=False, repr=False, compare=False)
+    
+    def __len__(self) -> int:
+        return len(self.spans)
+    
+    def row(self, position: int) -> Dict[str, Any]:
+        return {column: self.values[column][position] for column in self.columns}
+    
+    def row_text(self, position: int) -> str:
+        # Every row names its columns, so a single row makes sense on its own
+        return " | ".join(
+            f"{column}: {self.raw[column][position]}"
+            for column in self.columns
+            if self.raw[column][position]
+        )
+    
+    def column(self, name: str) -> Optional[str]:
+        folded = name.strip().casefold()
+        for column in self.columns:
+            if column.casefold() == folded:
+                return column
+        return None
+    
+    def select(self, filters: Dict[str, Any]) -> Optional[List[int]]:
+        # Filters look like {"Produto": "PIX", "Taxa_Mensal": {"lte": 2}}.
+        # None means the filters do not apply to this table at all.
+        conditions = []
+        for name, condition in filters.items():
+            column = self.column(name)
+            if column is None:
+                return None
+            
+            if not isinstance(condition, dict):
+                condition = {"eq": condition}
+            for operator, target in condition.items():
+                if operator not in FILTER_OPERATORS:
+                    raise ValueError(
+                        f"Unknown filter operator '{operator}', use one of: {', '.join(FILTER_OPERATORS)}."
+                    )
+                if self.types[column] == "number" and isinstance(target, str):
+                    parsed = parse_number(target)
+                    target = parsed if parsed is not None else target
+                conditions.append((column, FILTER_OPERATORS[operator], _normalize(target)))
+        
+        rows = []
+        for position in range(len(self)):
+            try:
+                if all(test(_normalize(self.values[column][position]), target)
+                       for column, test, target in conditions):
+                    rows.append(position)
+            except TypeError:
+                continue
+        return rows
+    
+    def _tokens(self) -> List[Dict[str, FrozenSet[str]]]:
+        if self._row_tokens is None:
+            text_columns = [column for column in self.columns if self.types[column] == "text"]
+            self._row_tokens = [
+                {column: frozenset(tokenize(self.raw[column][position])) for column in text_columns}
+                for position in range(len(self))
+            ]
+        return self._row_tokens
+    
+    def match(self, query_tokens: FrozenSet[str]) -> List[int]:
+        # Rows whose cell values are (mostly) spelled out in the question; only
+        # the best scoring rows are kept so "cartão de crédito" does not pull
+        # in the debit card
+        best, rows = MIN_MATCH_SCORE, []
+        for position, cells in enumerate(self._tokens()):
+            score = max(
+                (len(tokens & query_tokens) / len(tokens) for tokens in cells.values() if tokens),
+                default=0.0
+            )
+            if score > best:
+                best, rows = score, [position]
+            elif score == best and rows:
+                rows.append(position)
+        return rows
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "columns": self.columns,
+            "types": self.types,
+            "values": self.values,
+            "raw": self.raw,
+            "spans": self.spans,
+            "chunk_ids": self.chunk_ids,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Table":
+        return cls(
+            columns=data["columns"],
+            types=data["types"],
+            values=data["values"],
+            raw=data["raw"],
+            spans=[tuple(span) for span in data["spans"]],
+            chunk_ids=data["chunk_ids"]
+        )
+
+
+def _lines_with_offsets(content: str, offsets: List[int]) -> Iterator[str]:
+    # csv pulls exactly the lines of one record at a time, so the offset
+    # after each record is where the last pulled line ended
+    offset = 0
+    for line in content.splitlines(keepends=True):
+        offset += len(line)
+        offsets.append(offset)
+        yield line
+
+
+def parse_csv(content: str) -> Table:
+    first_line = content.split("\n", 1)[0]
+    delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
+    offsets: List[int] = []
+    reader = csv.reader(_lines_with_offsets(content, offsets), delimiter=delimiter)
+    
+    header = next(reader, None)
+    if not header:
+        return Table(columns=[])
+    columns = [name.strip() or f"coluna_{i + 1}" for i, name in enumerate(header)]
+    raw: Dict[str, List[str]] = {column: [] for column in columns}
+    spans = []
+    
+    start = offsets[-1]
+    for record in reader:
+        end = offsets[-1]
+        if any(cell.strip() for cell in record):
+            for i, column in enumerate(columns):
+                raw[column].append(record[i].strip() if i < len(record) else "")
+            spans.append((start, end))
+        start = end
+    
+    types = {}
+    values = {}
+    for column in columns:
+        numbers = [parse_number(cell) if cell else None for cell in raw[column]]
+        if any(raw[column]) and all(number is not None for number, cell in zip(numbers, raw[column]) if cell):
+            types[column] = "number"
+            values[column] = numbers
+        else:
+            types[column] = "text"
+            values[column] = list(raw[column])
+    
+    return Table(columns=columns, types=types, values=values, raw=raw, spans=spans)
@@ -0,0 +1,72 @@
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List
+
+# Bump whenever tokens change so persisted indexes are rebuilt
+TOKENIZER_VERSION = "pt-br-1"
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Accented Latin letters to their base letter ("crédito" -> "credito"),
+# built once so folding is a single str.translate call
+FOLD_TABLE = {
+    code: unicodedata.normalize("NFD", chr(code))[0]
+    for code in range(0xC0, 0x250)
+    if len(unicodedata.normalize("NFD", chr(code))) > 1
+}
+
+STOPWORDS = frozenset("""
+    a o as os ao aos um uma uns umas de da do das dos em no na nos nas num numa
+    e ou mas nem que se ja so ate sobre entre apos desde para pra por pelo pela
+    pelos pelas com sem como qual quais quando onde quanto quanta quantos quantas
+    quem porque eu voce voces ele ela eles elas meu minha meus minhas seu sua
+    seus suas este esta estes estas isto esse essa esses essas isso aquele aquela
+    aquilo ser sao foi era sera estar estao tem ter ha pode posso nao sim mais
+    muito muita tambem me lhe la aqui ai tipo
+""".split())
+
+# Plural endings, longest first, checked against folded words
+PLURAL_SUFFIXES = (
+    ("oes", "ao"),
+    ("aes", "ao"),
+    ("ais", "al"),
+    ("eis", "el"),
+    ("ois", "ol"),
+    ("res", "r"),
+    ("zes", "z"),
+    ("ses", "s"),
+    ("ns", "m"),
+    ("s", ""),
+)
+FINAL_VOWELS = ("a", "e", "o")
+
+
+def fold(text: str) -> str:
+    return text.casefold().translate(FOLD_TABLE)
+
+
+def stem(word: str) -> str:
+    # Light stemming: singular, then drop the final vowel so gender and
+    # number variants meet ("gratuitas"/"gratuito" -> "gratuit")
+    if len(word) > 3:
+        for suffix, replacement in PLURAL_SUFFIXES:
+            if word.endswith(suffix):
+                word = word[:-len(suffix)] + replacement
+                break
+    if len(word) > 3 and word.endswith(FINAL_VOWELS):
+        word = word[:-1]
+    return word
+
+
+@lru_cache(maxsize=100_000)
+def normalize_token(token: str) -> str:
+    folded = fold(token)
+    if len(folded) < 2 or folded in STOPWORDS:
+        return ""
+    return stem(folded)
+
+
+def tokenize(text: str) -> List[str]:
+    # Shared by indexing and queries, so both sides always agree
+    return [term for term in map(normalize_token, TOKEN_PATTERN.findall(text)) if term]
@@ -0,0 +1,152 @@
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_DIM = 512
+NGRAM_SIZE = 3
+
+
+@lru_cache(maxsize=100_000)
+def _token_features(token: str, dim: int) -> Tuple[Tuple[int, float], ...]:
+    # Whole word plus boundary-marked character trigrams, so inflected forms
+    # ("taxa"/"taxas") still land on shared buckets. crc32 keeps the hashing
+    # stable across processes, unlike the salted builtin hash().
+    marked = f"<{token}>"
+    grams = [token] + [marked[i:i + NGRAM_SIZE] for i in range(len(marked) - NGRAM_SIZE + 1)]
+    
+    features = []
+    for gram in grams:
+        digest = zlib.crc32(gram.encode("utf-8"))
+        features.append((digest % dim, 1.0 if digest & 0x80000000 else -1.0))
+    return tuple(features)
+
+
+def embed(tokens: Iterable[str], dim: int = DEFAULT_DIM) -> np.ndarray:
+    vector = np.zeros(dim, dtype=np.float32)
+    for token, count in Counter(tokens).items():
+        weight = 1.0 + np.log(count)
+        for bucket, sign in _token_features(token, dim):
+            vector[bucket] += sign * weight
+    return vector
+
+
+def document_vector(tokens: Iterable[str], dim: int = DEFAULT_DIM) -> np.ndarray:
+    # Unit length; pure, so ingestion workers can compute it off-process
+    vector = embed(tokens, dim)
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+class VectorIndex:
+    
+    def __init__(self, dim: int = DEFAULT_DIM, capacity: int = 256):
+        self.dim = dim
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.row_chunk_ids = np.full(capacity, -1, dtype=np.int64)
+        self.df = np.zeros(dim, dtype=np.int64)
+        self.rows: Dict[int, int] = {}
+        self.free_rows: List[int] = []
+        self.size = 0
+    
+    @classmethod
+    def from_arrays(cls, matrix: np.ndarray, chunk_ids: Sequence[int], df: np.ndarray) -> "VectorIndex":
+        index = cls.__new__(cls)
+        index.dim = matrix.shape[1]
+        index.matrix = matrix
+        index.row_chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        index.df = df
+        index.rows = {int(chunk_id): row for row, chunk_id in enumerate(index.row_chunk_ids)}
+        index.free_rows = []
+        index.size = len(index.rows)
+        return index
+    
+    def __len__(self) -> int:
+        return len(self.rows)
+    
+    def embed(self, tokens: Iterable[str]) -> np.ndarray:
+        return embed(tokens, self.dim)
+    
+    def add(self, chunk_id: int, tokens: Iterable[str]):
+        self.add_vector(chunk_id, document_vector(tokens, self.dim))
+    
+    def add_vector(self, chunk_id: int, vector: np.ndarray):
+        if chunk_id in self.rows:
+            self.remove(chunk_id)
+        
+        row = self.free_rows.pop() if self.free_rows else self._append_row()
+        self.matrix[row] = vector
+        self.row_chunk_ids[row] = chunk_id
+        self.rows[chunk_id] = row
+        self.df += vector != 0
+    
+    def remove(self, chunk_id: int):
+        row = self.rows.pop(chunk_id, None)
+        if row is None:
+            return
+        
+        self.df -= self.matrix[row] != 0
+        self.matrix[row] = 0.0
+        self.row_chunk_ids[row] = -1
+        self.free_rows.append(row)
+    
+    def _append_row(self) -> int:
+        if self.size == len(self.matrix):
+            capacity = max(2 * len(self.matrix), 256)
+            matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+            matrix[:self.size] = self.matrix[:self.size]
+            chunk_ids = np.full(capacity, -1, dtype=np.int64)
+            chunk_ids[:self.size] = self.row_chunk_ids[:self.size]
+            self.matrix, self.row_chunk_ids = matrix, chunk_ids
+        
+        self.size += 1
+        return self.size - 1
+    
+    def _query_matrix(self, queries: Sequence[Iterable[str]]) -> np.ndarray:
+        doc_count = len(self.rows)
+        idf = np.log((doc_count + 1) / (self.df + 1), dtype=np.float32) + 1.0
+        matrix = np.stack([self.embed(tokens) for tokens in queries]) * idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+    
+    def search_batch(self, queries: Sequence[Iterable[str]], k: int = 10,
+                     min_score: float = 0.0) -> List[List[Tuple[int, float]]]:
+        if not queries:
+            return []
+        if not self.rows:
+            return [[] for _ in queries]
+        
+        scores = self.matrix[:self.size] @ self._query_matrix(queries).T
+        k = min(k, self.size)
+        
+        results = []
+        for column in scores.T:
+            top = np.argpartition(-column, k - 1)[:k] if k < self.size else np.arange(self.size)
+            top = top[np.argsort(-column[top])]
+            results.append([
+                (int(self.row_chunk_ids[row]), float(column[row]))
+                for row in top
+                if column[row] > min_score and self.row_chunk_ids[row] >= 0
+            ])
+        return results
+    
+    def search(self, query_tokens: Iterable[str], k: int = 10,
+               min_score: float = 0.0) -> List[Tuple[int, float]]:
+        return self.search_batch([list(query_tokens)], k, min_score)[0]
+
+
+def fuse_rankings(rankings: Sequence[List[Tuple[int, float]]], k: int = 10,
+                  constant: int = 60, weights: Optional[Sequence[float]] = None) -> List[Tuple[int, float]]:
+    # Reciprocal rank fusion: BM25 and cosine scores live on different
+    # scales, ranks do not
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[int, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, (doc_id, _score) in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (constant + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
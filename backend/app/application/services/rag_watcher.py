@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+WATCH_BACKENDS = ("auto", "native", "polling")
+
+
+class DocumentWatcher:
+    
+    def __init__(self, folder: str, on_change: Callable[[], Any],
+                 extensions: Tuple[str, ...] = (".md", ".txt", ".csv"),
+                 debounce_seconds: float = 0.5, poll_interval: float = 2.0,
+                 backend: str = "auto"):
+        if backend not in WATCH_BACKENDS:
+            raise ValueError(f"Watch backend must be one of: {', '.join(WATCH_BACKENDS)}.")
+        self.folder = folder
+        self.on_change = on_change
+        self.extensions = extensions
+        self.debounce_seconds = debounce_seconds
+        self.poll_interval = poll_interval
+        self.backend = backend
+        self.ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.rebuilds = 0
+        self.last_rebuild_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rag-watcher", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+    
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self.ready.wait(timeout)
+    
+    def _rebuild(self):
+        try:
+            self.on_change()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+        self.rebuilds += 1
+        self.last_rebuild_at = time.time()
+    
+    def _run(self):
+        # The initial sync picks up anything that changed while we were down
+        self._rebuild()
+        self.ready.set()
+        os.makedirs(self.folder, exist_ok=True)
+        
+        if self.backend != "polling":
+            try:
+                import watchfiles
+            except ImportError:
+                if self.backend == "native":
+                    self.last_error = "watchfiles is not installed; falling back to polling"
+            else:
+                self.backend = "native"
+                self._watch_native(watchfiles)
+                return
+        
+        self.backend = "polling"
+        self._watch_polling()
+    
+    def _is_document(self, path: str) -> bool:
+        return os.path.splitext(path)[1].lower() in self.extensions
+    
+    def _watch_native(self, watchfiles):
+        # inotify/FSEvents; watchfiles batches a burst of events into one
+        # yield after debounce milliseconds of quiet
+        for _changes in watchfiles.watch(
+            self.folder,
+            watch_filter=lambda _change, path: self._is_document(path),
+            debounce=int(self.debounce_seconds * 1000),
+            stop_event=self._stop,
+            recursive=False,
+            raise_interrupt=False
+        ):
+            self._rebuild()
+    
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and self._is_document(entry.name):
+                        stat = entry.stat()
+                        snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            pass
+        return snapshot
+    
+    def _watch_polling(self):
+        previous = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            if current == previous:
+                continue
+            
+            # Wait for the folder to settle so a copy of many files costs
+            # one rebuild instead of one per file
+            while not self._stop.wait(self.debounce_seconds):
+                settled = self._snapshot()
+                if settled == current:
+                    break
+                current = settled
+            if self._stop.is_set():
+                break
+            
+            previous = current
+            self._rebuild()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "backend": self.backend,
+            "ready": self.ready.is_set(),
+            "rebuilds": self.rebuilds,
+            "last_rebuild_at": self.last_rebuild_at,
+            "last_error": self.last_error
+        }
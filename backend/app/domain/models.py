@@ -1,7 +1,7 @@
 from datetime import datetime
 from enum import Enum
 from typing import Optional
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Index, DDL, Enum as SQLEnum, event
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.sql import func
 
@@ -143,6 +143,10 @@ class CommunityMembership(Base):
 
 class UserLevel(Base):
     __tablename__ = "user_levels"
+    __table_args__ = (
+        # One row per user, so awards can upsert it
+        Index("ix_user_levels_user_id", "user_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=False)  # FK to User
@@ -177,6 +181,11 @@ class UserBadge(Base):
 
 class UserPoints(Base):
     __tablename__ = "user_points"
+    __table_args__ = (
+        # One award per (user, source, source_id); NULL source_ids never collide
+        Index("ix_user_points_award", "user_id", "source", "source_id", unique=True),
+        Index("ix_user_points_idempotency_key", "user_id", "idempotency_key", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=False)  # FK to User
@@ -184,9 +193,57 @@ class UserPoints(Base):
     source = Column(String(50), nullable=False)  # forum_post, forum_comment, event_attendance, etc.
     source_id = Column(Integer, nullable=True)  # post_id, event_id, etc
     description = Column(String(200), nullable=True)
+    idempotency_key = Column(String(100), nullable=True)  # client supplied, optional
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
+class GamificationEvent(Base):
+    __tablename__ = "gamification_outbox"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False, index=True)  # FK to User
+    source = Column(String(50), nullable=False)
+    source_id = Column(Integer, nullable=True)
+    description = Column(String(200), nullable=True)
+    attempts = Column(Integer, default=0)
+    last_error = Column(String(500), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True, index=True)  # NULL while pending
+
+
+class LeaderboardChange(Base):
+    __tablename__ = "leaderboard_changes"
+    
+    # One row per user, stamped with a database-wide version on every change
+    # to their level, badges or user row; filled by the triggers below
+    user_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, index=True)
+
+
+# Fire for every writer, whichever process or hand-run SQL it is, so the
+# in-memory leaderboards can tell what changed with one indexed lookup
+LEADERBOARD_TRIGGERS = {
+    f"leaderboard_{table}_{action.lower()}": (table, (
+        f"CREATE TRIGGER leaderboard_{table}_{action.lower()} AFTER {action} ON {table} BEGIN "
+        f"INSERT INTO leaderboard_changes (user_id, version) VALUES ({user_id}, "
+        "(SELECT COALESCE(MAX(version), 0) + 1 FROM leaderboard_changes)) "
+        "ON CONFLICT (user_id) DO UPDATE SET version = excluded.version; END"
+    ))
+    for table, action, user_id in [
+        ("users", "INSERT", "NEW.id"),
+        ("users", "DELETE", "OLD.id"),
+        ("user_levels", "INSERT", "NEW.user_id"),
+        ("user_levels", "UPDATE", "NEW.user_id"),
+        ("user_levels", "DELETE", "OLD.user_id"),
+        ("user_badges", "INSERT", "NEW.user_id"),
+        ("user_badges", "DELETE", "OLD.user_id"),
+    ]
+}
+
+for table, statement in LEADERBOARD_TRIGGERS.values():
+    event.listen(Base.metadata.tables[table], "after_create", DDL(statement))
+
+
 class CourseCategory(str, Enum):
     FINANCIAL_EDUCATION = "financial_education"
     COOPERATIVISM = "cooperativism"
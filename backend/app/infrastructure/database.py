@@ -1,6 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
-from app.domain.models import Base
+from app.domain.models import Base, LEADERBOARD_TRIGGERS, UserLevel, UserPoints
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./data/db/sicoob_dev.db"
 
@@ -13,6 +13,55 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    migrate_tables(engine)
+
+def migrate_tables(bind):
+    # create_all skips tables that already exist, so columns and indexes
+    # added to them since have to be brought in here
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        columns = {column["name"] for column in inspector.get_columns("user_points")}
+        if "idempotency_key" not in columns:
+            conn.execute(text("ALTER TABLE user_points ADD COLUMN idempotency_key VARCHAR(100)"))
+        
+        # Each dedupe runs once, before its unique index exists; every later
+        # start finds the index and writes nothing
+        if not _has_index(inspector, "user_points", "ix_user_points_award"):
+            # Repeated awards: keep the first, and take their points back out of the level
+            duplicates = (
+                "SELECT id FROM user_points WHERE source_id IS NOT NULL AND id NOT IN "
+                "(SELECT MIN(id) FROM user_points WHERE source_id IS NOT NULL GROUP BY user_id, source, source_id)"
+            )
+            points = (
+                "(SELECT COALESCE(SUM(points), 0) FROM user_points "
+                f"WHERE user_points.user_id = user_levels.user_id AND id IN ({duplicates}))"
+            )
+            conn.execute(text(
+                f"UPDATE user_levels SET total_points = total_points - {points}, "
+                f"experience_points = experience_points - {points} "
+                f"WHERE user_id IN (SELECT user_id FROM user_points WHERE id IN ({duplicates}))"
+            ))
+            conn.execute(text(f"DELETE FROM user_points WHERE id IN ({duplicates})"))
+        
+        if not _has_index(inspector, "user_levels", "ix_user_levels_user_id"):
+            # Racing inserts could leave several level rows per user; keep the highest
+            conn.execute(text(
+                "DELETE FROM user_levels WHERE id NOT IN (SELECT id FROM ("
+                "SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY total_points DESC, id) AS position "
+                "FROM user_levels) WHERE position = 1)"
+            ))
+        
+        for table in (UserPoints.__table__, UserLevel.__table__):
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        
+        triggers = set(conn.scalars(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")))
+        for name, (_, statement) in LEADERBOARD_TRIGGERS.items():
+            if name not in triggers:
+                conn.execute(text(statement))
+
+def _has_index(inspector, table: str, name: str) -> bool:
+    return any(index["name"] == name for index in inspector.get_indexes(table))
 
 def get_db():
     db = SessionLocal()
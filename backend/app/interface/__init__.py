@@ -1,4 +1,5 @@
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -13,17 +14,47 @@ from app.interface.routes import (
     gamification_router,
     course_router
 )
-from app.interface.routes.rag import rag_router
-from app.infrastructure.database import create_tables
+from app.interface.routes.rag import rag_router, start_rag_warm_up, stop_rag_service
+from app.application.services.gamification_worker import GamificationOutboxWorker
+from app.application.services.gamification_leaderboard import leaderboard
+from app.infrastructure.database import SessionLocal, create_tables
 
 create_tables()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if os.getenv("RAG_WARM_UP", "true").lower() == "true":
+        start_rag_warm_up()
+    # Ranks are served from memory; loaded before the worker starts awarding
+    if os.getenv("GAMIFICATION_LEADERBOARD_WARM_UP", "true").lower() == "true":
+        db = SessionLocal()
+        try:
+            leaderboard.rebuild(db)
+        finally:
+            db.close()
+    # Applies the point awards routes leave in the gamification outbox
+    worker = None
+    if os.getenv("GAMIFICATION_WORKER", "true").lower() == "true":
+        worker = GamificationOutboxWorker(
+            SessionLocal,
+            batch_size=int(os.getenv("GAMIFICATION_BATCH_SIZE", "100")),
+            poll_interval=float(os.getenv("GAMIFICATION_POLL_SECONDS", "1"))
+        )
+        worker.start()
+    app.state.gamification_worker = worker
+    yield
+    if worker is not None:
+        await worker.stop()
+    leaderboard.reset()
+    stop_rag_service()
+
 app = FastAPI(
     title="Sicoob API",
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    lifespan=lifespan
 )
 
 # CORS middleware
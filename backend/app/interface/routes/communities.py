@@ -29,8 +29,7 @@ def create_community(community: CommunityCreate, db: Session = Depends(get_db)):
     
     db_community = Community(**community.model_dump())
     db.add(db_community)
-    db.commit()
-    db.refresh(db_community)
+    db.flush()
     
     # Add owner as member with OWNER role
     membership = CommunityMembership(
@@ -42,17 +41,17 @@ def create_community(community: CommunityCreate, db: Session = Depends(get_db)):
     
     # Update member count
     db_community.member_count = 1
-    db.commit()
-    db.refresh(db_community)
     
     gamification_service = GamificationService(db)
-    gamification_service.add_points(
+    gamification_service.enqueue_points(
         user_id=community.owner_id,
         source="community_create",
         source_id=db_community.id,
         description=f"Criou comunidade: {db_community.name}"
     )
     
+    db.commit()
+    db.refresh(db_community)
     return db_community
 
 @community_router.get(
@@ -240,17 +239,16 @@ def join_community(
         CommunityMembership.active == True
     ).count() + 1
     
-    db.commit()
-    db.refresh(membership)
-    
     gamification_service = GamificationService(db)
-    gamification_service.add_points(
+    gamification_service.enqueue_points(
         user_id=user_id,
         source="community_join",
         source_id=community_id,
         description=f"Entrou na comunidade: {community.name}"
     )
     
+    db.commit()
+    db.refresh(membership)
     return membership
 
 @community_router.get(
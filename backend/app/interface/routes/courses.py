@@ -157,17 +157,17 @@ def enroll_in_course(
     
     enrollment = CourseEnrollment(course_id=course_id, user_id=user_id)
     db.add(enrollment)
-    db.commit()
-    db.refresh(enrollment)
     
     gamification_service = GamificationService(db)
-    gamification_service.add_points(
+    gamification_service.enqueue_points(
         user_id=user_id,
         source="course_enrollment",
         source_id=course_id,
         description=f"Inscrito no curso: {course.title}"
     )
     
+    db.commit()
+    db.refresh(enrollment)
     return enrollment
 
 
@@ -223,20 +223,19 @@ def complete_course(enrollment_id: int, db: Session = Depends(get_db)):
     enrollment.is_completed = True
     enrollment.completed_at = datetime.now()
     
-    db.commit()
-    db.refresh(enrollment)
-    
     course = db.query(Course).filter(Course.id == enrollment.course_id).first()
     course_title = course.title if course else "Curso"
     
     gamification_service = GamificationService(db)
-    gamification_service.add_points(
+    gamification_service.enqueue_points(
         user_id=enrollment.user_id,
         source="course_completion",
         source_id=enrollment.course_id,
         description=f"Concluiu curso: {course_title}"
     )
     
+    db.commit()
+    db.refresh(enrollment)
     return enrollment
 
 
@@ -279,17 +279,17 @@ def register_for_event(
     
     db_registration = EventRegistration(**registration_data)
     db.add(db_registration)
-    db.commit()
-    db.refresh(db_registration)
     
     gamification_service = GamificationService(db)
-    gamification_service.add_points(
+    gamification_service.enqueue_points(
         user_id=user_id,
         source="event_registration",
         source_id=event_id,
         description=f"Inscreveu-se no evento: {event.title}"
     )
     
+    db.commit()
+    db.refresh(db_registration)
     return db_registration
 
 @event_router.get(
@@ -110,7 +110,7 @@ def like_post(post_id: int, db: Session = Depends(get_db)):
     else:
         post.likes_count += 1
         post.liked_by_user_1 = True
-
+    
     db.commit()
     db.refresh(post)
     
@@ -152,17 +152,18 @@ def create_comment(post_id: int, comment: CommentCreate, db: Session = Depends(g
     comment_data['post_id'] = post_id
     db_comment = Comment(**comment_data)
     db.add(db_comment)
-    db.commit()
-    db.refresh(db_comment)
+    db.flush()
     
     gamification_service = GamificationService(db)
-    gamification_service.add_points(
+    gamification_service.enqueue_points(
         user_id=comment.author_id,
         source="forum_comment",
         source_id=db_comment.id,
         description=f"Comentou no post ID: {post_id}"
     )
     
+    db.commit()
+    db.refresh(db_comment)
     return db_comment
 
 @router.get(
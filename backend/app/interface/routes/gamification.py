@@ -1,11 +1,11 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from app.infrastructure.database import get_db
 from app.application.services.gamification_service import GamificationService
 from app.application.dto import (
     UserStatsResponse, LeaderboardEntry, UserBadgeResponse, 
-    BadgeResponse, UserPointsResponse
+    BadgeResponse, UserPointsResponse, BulkPointsRequest, BulkPointsResponse
 )
 
 gamification_router = APIRouter(
@@ -40,6 +40,36 @@ def get_leaderboard(
     service = GamificationService(db)
     return service.get_leaderboard(limit)
 
+@gamification_router.get(
+    "/users/{user_id}/rank",
+    response_model=LeaderboardEntry,
+    summary="Get user rank",
+    description="Get the user's position in the leaderboard"
+)
+def get_user_rank(user_id: int, db: Session = Depends(get_db)):
+    service = GamificationService(db)
+    entry = service.get_user_rank(user_id)
+    if not entry:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User has no points yet"
+        )
+    return entry
+
+@gamification_router.get(
+    "/users/{user_id}/neighbors",
+    response_model=List[LeaderboardEntry],
+    summary="Get leaderboard around user",
+    description="Get the users ranked right above and below the user"
+)
+def get_leaderboard_neighbors(
+    user_id: int,
+    radius: int = Query(5, ge=1, le=25, description="Number of users on each side"),
+    db: Session = Depends(get_db)
+):
+    service = GamificationService(db)
+    return service.get_leaderboard_neighbors(user_id, radius)
+
 @gamification_router.get(
     "/users/{user_id}/badges",
     response_model=List[UserBadgeResponse],
@@ -65,17 +95,37 @@ def get_all_badges(db: Session = Depends(get_db)):
     response_model=UserPointsResponse,
     status_code=status.HTTP_201_CREATED,
     summary="Add points to user",
-    description="Add points to user for specific action (admin only)"
+    description="Add points to user for specific action (admin only). Retries with the same "
+                "source/source_id or Idempotency-Key return the original award"
 )
 def add_points_to_user(
     user_id: int,
     source: str = Query(..., description="Source of points (forum_post, event_attendance, etc.)"),
     source_id: int = Query(None, description="ID of the source object"),
     description: str = Query(None, description="Description of the points"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=100),
     db: Session = Depends(get_db)
 ):
     service = GamificationService(db)
-    return service.add_points(user_id, source, source_id, description)
+    try:
+        return service.add_points(user_id, source, source_id, description, idempotency_key=idempotency_key)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+
+@gamification_router.post(
+    "/points/bulk",
+    response_model=BulkPointsResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary="Add points to many users",
+    description="Award points for mass events (attendance, campaigns) in one request (admin only). "
+                "Awards already given for the same user/source/source_id are skipped"
+)
+def add_points_bulk(request: BulkPointsRequest, db: Session = Depends(get_db)):
+    service = GamificationService(db)
+    return service.add_points_bulk(request.awards)
 
 @gamification_router.get(
     "/users/{user_id}/points",
@@ -1,33 +1,89 @@
-from typing import List
-from fastapi import APIRouter, HTTPException, status
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from app.application.services.rag_service import RAGService
 
+logger = logging.getLogger(__name__)
+
 rag_router = APIRouter(prefix="/rag", tags=["AI RAG Chat"])
 
 class ChatMessage(BaseModel):
     message: str
-    session_id: str = "default"
+    session_id: Optional[str] = None
+    filters: Optional[Dict[str, Any]] = None
 
 class ChatResponse(BaseModel):
     response: str
     sources: List[str] = []
+    prompt_tokens: int = 0
+
+_rag_service: Optional[RAGService] = None
+_rag_service_lock = threading.Lock()
+
+def get_rag_service() -> RAGService:
+    global _rag_service
+    if _rag_service is None:
+        with _rag_service_lock:
+            if _rag_service is None:
+                try:
+                    _rag_service = RAGService()
+                except ValueError as e:
+                    raise HTTPException(
+                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        detail=f"RAG service unavailable: {str(e)}"
+                    )
+    return _rag_service
+
+def _warm_up():
+    try:
+        service = get_rag_service()
+        if os.getenv("RAG_WATCH", "true").lower() == "true":
+            service.start_watching()
+        else:
+            service.warm_up()
+    except HTTPException as e:
+        logger.warning("RAG warm-up skipped: %s", e.detail)
+    except Exception:
+        logger.exception("RAG warm-up failed")
+
+def start_rag_warm_up() -> threading.Thread:
+    # Builds the service and the index off the request path so non-RAG
+    # routes are served while documents are still being indexed
+    thread = threading.Thread(target=_warm_up, name="rag-warm-up", daemon=True)
+    thread.start()
+    return thread
 
-rag_service = RAGService()
+def stop_rag_service():
+    if _rag_service is not None:
+        _rag_service.stop_watching()
 
 @rag_router.post(
     "/chat",
     response_model=ChatResponse,
     summary="Chat with AI",
-    description="Chat with AI - automatically processes documents from data/documents/ folder"
+    description="Chat with AI - automatically processes documents from data/documents/ folder. "
+                "Messages sharing a `session_id` keep the recent conversation as context. "
+                "Optional `filters` restrict CSV rows by column, e.g. "
+                "`{\"Produto\": \"PIX\", \"Taxa_Mensal\": {\"lte\": 2}}`"
 )
-def chat(chat_message: ChatMessage):
+async def chat(chat_message: ChatMessage, rag_service: RAGService = Depends(get_rag_service)):
     try:
-        result = rag_service.chat(chat_message.message)
+        result = await rag_service.chat(chat_message.message, chat_message.filters, chat_message.session_id)
         return ChatResponse(
             response=result["response"],
-            sources=result["sources"]
+            sources=result["sources"],
+            prompt_tokens=result.get("prompt_tokens", 0)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
     except Exception as e:
         raise HTTPException(
@@ -35,12 +91,33 @@ def chat(chat_message: ChatMessage):
             detail=f"Error in chat: {str(e)}"
         )
 
+@rag_router.post(
+    "/chat/stream",
+    summary="Chat with AI (streaming)",
+    description="Chat with AI streaming the answer as server-sent events: "
+                "`sources` first, then `token` events and a final `done` carrying "
+                "the prompt token count (or `error`)"
+)
+async def chat_stream(chat_message: ChatMessage, rag_service: RAGService = Depends(get_rag_service)):
+    async def event_stream():
+        async for event in rag_service.chat_stream(
+            chat_message.message, chat_message.filters, chat_message.session_id
+        ):
+            data = json.dumps(event["data"], ensure_ascii=False)
+            yield f"event: {event['event']}\ndata: {data}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @rag_router.get(
     "/status",
     summary="Get RAG status",
-    description="Check RAG system status and loaded files"
+    description="Check RAG system status, loaded files and per-stage latency histograms"
 )
-def get_status():
+def get_status(rag_service: RAGService = Depends(get_rag_service)):
     try:
         return rag_service.get_status()
     except Exception as e:
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("RAG_SYSTEM_PROMPT", "Você é um assistente de benchmark.")
+
+from app.application.services.rag_service import RAGService
+
+SEED_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "documents")
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Questions about the seed documents and the files that answer them
+LABELED_QUESTIONS = [
+    ("O que é uma cooperativa de crédito?", ["cooperativismo_basico.md"]),
+    ("Quais são os princípios do cooperativismo?", ["cooperativismo_basico.md"]),
+    ("Quais as vantagens de ser cooperado do Sicoob?", ["cooperativismo_basico.md"]),
+    ("Qual a taxa mensal do cartão de crédito internacional?", ["taxas_sicoob.csv"]),
+    ("Quanto custa um TED para outros bancos?", ["taxas_sicoob.csv"]),
+    ("Qual a taxa do empréstimo pessoal?", ["taxas_sicoob.csv"]),
+    ("Saque em outros bancos tem tarifa?", ["taxas_sicoob.csv"]),
+    ("Quais seguros o Sicoob oferece?", ["produtos_sicoob.txt", "educacao_financeira_basica.md"]),
+    ("A conta corrente é gratuita para jovens?", ["produtos_sicoob.txt", "taxas_sicoob.csv"]),
+    ("Existe cartão pré-pago para controle de gastos?", ["produtos_sicoob.txt"]),
+    ("Como montar um orçamento familiar?", ["educacao_financeira_basica.md"]),
+    ("Quais métodos ajudam a quitar dívidas?", ["educacao_financeira_basica.md"]),
+    ("Quanto devo guardar no fundo de emergência?", ["educacao_financeira_basica.md"]),
+    ("O que são metas SMART?", ["educacao_financeira_basica.md"]),
+    ("Como usar o décimo terceiro salário?", ["educacao_financeira_basica.md", "produtos_sicoob.txt"]),
+]
+
+
+class StubCompletions:
+    
+    def __init__(self, latency: float):
+        self.latency = latency
+    
+    async def create(self, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        message = SimpleNamespace(content="Resposta gerada pelo stub de benchmark.")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def build_corpus(folder: str, documents: int, seed: int) -> int:
+    # The seed documents keep their labels; the rest are distractors drawn
+    # from the same vocabulary so they compete for the same terms
+    os.makedirs(folder, exist_ok=True)
+    words = []
+    for filename in sorted(os.listdir(SEED_FOLDER)):
+        shutil.copy(os.path.join(SEED_FOLDER, filename), folder)
+        with open(os.path.join(SEED_FOLDER, filename), encoding="utf-8") as file:
+            words.extend(WORD_PATTERN.findall(file.read()))
+    
+    vocabulary = Counter(words)
+    population = list(vocabulary)
+    weights = [vocabulary[word] for word in population]
+    rng = random.Random(seed)
+    
+    total_bytes = 0
+    for i in range(documents):
+        paragraphs = []
+        for _ in range(rng.randint(3, 8)):
+            sentence_words = rng.choices(population, weights, k=rng.randint(30, 90))
+            paragraphs.append(" ".join(sentence_words).capitalize() + ".")
+        content = f"Documento sintético {i}\n\n" + "\n\n".join(paragraphs) + "\n"
+        with open(os.path.join(folder, f"sintetico_{i:06d}.txt"), "w", encoding="utf-8") as file:
+            file.write(content)
+        total_bytes += len(content.encode("utf-8"))
+    return total_bytes
+
+
+def make_service(folder: str, index_path: str, mode: str, llm_latency: float) -> RAGService:
+    os.environ["RAG_INDEX_PATH"] = index_path
+    os.environ["RAG_RETRIEVAL_MODE"] = mode
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    
+    service = RAGService()
+    service.data_folder = folder
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions(llm_latency)))
+    service.llm.client = service.client
+    return service
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    
+    def pick(q):
+        return samples[min(len(samples) - 1, int(round(q * (len(samples) - 1))))]
+    
+    return {
+        "count": len(samples),
+        "mean": round(statistics.fmean(samples), 4),
+        "p50": round(pick(0.50), 4),
+        "p90": round(pick(0.90), 4),
+        "p99": round(pick(0.99), 4),
+        "max": round(samples[-1], 4)
+    }
+
+
+def measure_build(folder: str, index_path: str, mode: str, args) -> dict:
+    service = make_service(folder, index_path, mode, args.llm_latency)
+    started = time.perf_counter()
+    result = service.process_files()
+    build_seconds = time.perf_counter() - started
+    
+    memory = {}
+    if not args.skip_memory:
+        # Separate pass: tracemalloc slows the build down noticeably
+        del service
+        gc.collect()
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        service = make_service(folder, index_path, mode, args.llm_latency)
+        service.process_files()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory = {
+            "memory_retained_bytes": retained - baseline,
+            "memory_peak_bytes": peak - baseline
+        }
+    
+    return {
+        "service": service,
+        "files": result.get("total_files", 0),
+        "chunks": len(service.chunks),
+        "errors": result.get("errors", []),
+        "build_seconds": round(build_seconds, 4),
+        "index_file_bytes": os.path.getsize(index_path) if os.path.exists(index_path) else 0,
+        **memory
+    }
+
+
+def measure_queries(service: RAGService, args) -> dict:
+    retrieval_ms = []
+    chat_ms = []
+    hits = 0
+    reciprocal_ranks = []
+    
+    for _ in range(args.repeat):
+        for question, expected in LABELED_QUESTIONS:
+            started = time.perf_counter()
+            ranking = service._retrieve(question)
+            retrieval_ms.append((time.perf_counter() - started) * 1000)
+            
+            sources = [service.chunks[chunk_id].source for chunk_id, _score in ranking[:args.k]]
+            rank = next((i + 1 for i, source in enumerate(sources) if source in expected), None)
+            hits += rank is not None
+            reciprocal_ranks.append(1 / rank if rank else 0.0)
+            
+            # End to end with the stub LLM; a cold answer cache every time
+            service.answer_cache.clear()
+            started = time.perf_counter()
+            asyncio.run(service.chat(question))
+            chat_ms.append((time.perf_counter() - started) * 1000)
+    
+    total = args.repeat * len(LABELED_QUESTIONS)
+    return {
+        f"recall_at_{args.k}": round(hits / total, 4),
+        "mrr": round(sum(reciprocal_ranks) / total, 4),
+        "retrieval_latency_ms": percentiles(retrieval_ms),
+        "chat_latency_ms": percentiles(chat_ms)
+    }
+
+
+def run(args) -> dict:
+    results = []
+    workdir = tempfile.mkdtemp(prefix="rag-benchmark-")
+    try:
+        for documents in args.documents:
+            folder = os.path.join(workdir, f"corpus_{documents}")
+            synthetic_bytes = build_corpus(folder, documents, args.seed)
+            
+            for mode in args.modes:
+                print(f"Benchmarking {documents} synthetic document(s), mode={mode}...", file=sys.stderr)
+                build = measure_build(folder, os.path.join(workdir, f"index_{documents}_{mode}.bin"), mode, args)
+                service = build.pop("service")
+                results.append({
+                    "synthetic_documents": documents,
+                    "synthetic_bytes": synthetic_bytes,
+                    "retrieval_mode": mode,
+                    **build,
+                    **measure_queries(service, args)
+                })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    return {
+        "benchmark": "rag_retrieval",
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "documents": args.documents,
+            "modes": args.modes,
+            "k": args.k,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "llm_latency_seconds": args.llm_latency,
+            "labeled_questions": len(LABELED_QUESTIONS)
+        },
+        "results": results
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark RAG indexing and retrieval on synthetic corpora")
+    parser.add_argument("--documents", default="0,100,1000",
+                        help="comma separated numbers of synthetic documents added to data/documents")
+    parser.add_argument("--modes", default="bm25,vector,hybrid", help="comma separated retrieval modes")
+    parser.add_argument("--k", type=int, default=5, help="cutoff for recall@k")
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the labeled questions")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="stub LLM latency in seconds")
+    parser.add_argument("--skip-memory", action="store_true", help="skip the tracemalloc build pass")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    
+    args.documents = [int(value) for value in args.documents.split(",") if value.strip()]
+    args.modes = [value.strip() for value in args.modes.split(",") if value.strip()]
+    for mode in args.modes:
+        if mode not in RAGService.RETRIEVAL_MODES:
+            parser.error(f"unknown retrieval mode: {mode}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+        print(f"Benchmark report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
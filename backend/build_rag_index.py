@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "app"))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Building the index never calls the LLM
+os.environ.setdefault("OPENAI_API_KEY", "index-build")
+os.environ.setdefault("RAG_SYSTEM_PROMPT", "Índice construído offline.")
+
+from app.application.services.rag_service import RAGService
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Prebuild the RAG index offline so the API starts warm")
+    parser.add_argument("--data-folder", default="data/documents", help="folder with the documents to index")
+    parser.add_argument("--index-path", default=os.getenv("RAG_INDEX_PATH", "data/rag_index.bin"),
+                        help="where the index file is written")
+    parser.add_argument("--workers", type=int, default=0, help="ingestion processes (default: one per CPU)")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the existing index and index everything")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    os.environ["RAG_INDEX_PATH"] = args.index_path
+    if args.rebuild and os.path.exists(args.index_path):
+        os.remove(args.index_path)
+    
+    service = RAGService()
+    service.data_folder = args.data_folder
+    service.ingest_workers = args.workers or os.cpu_count() or 1
+    # Offline there is nothing to protect from the pool start-up cost
+    service.ingest_parallel_min_files = 2
+    
+    started = time.perf_counter()
+    result = service.process_files()
+    elapsed = time.perf_counter() - started
+    
+    print(json.dumps({
+        "index_path": args.index_path,
+        "processed_files": len(result.get("processed_files", [])),
+        "removed_files": len(result.get("removed_files", [])),
+        "total_files": result.get("total_files", 0),
+        "chunks": len(service.chunks),
+        "workers": service.ingest_workers,
+        "seconds": round(elapsed, 3),
+        "errors": result.get("errors", [])
+    }, indent=2, ensure_ascii=False))
+    return 1 if result.get("errors") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+ANSWER_WORDS = (
+    "De acordo com os documentos da cooperativa, o serviço consultado possui "
+    "condições especiais para cooperados. Consulte sempre as taxas vigentes e "
+    "fale com seu gerente para avaliar a melhor opção para o seu perfil."
+).split()
+
+
+def parse_latency(spec: str) -> Tuple[str, List[float]]:
+    # "fixed:0.2", "uniform:0.1,0.5", "normal:0.3,0.05", "lognormal:-1.5,0.5",
+    # "exponential:0.2" (mean); all in seconds
+    name, _, params = spec.partition(":")
+    if name not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Latency distribution must be one of: {', '.join(LATENCY_DISTRIBUTIONS)}.")
+    values = [float(value) for value in params.split(",") if value.strip()] or [0.0]
+    expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exponential": 1}[name]
+    if len(values) != expected:
+        raise ValueError(f"Latency '{name}' takes {expected} parameter(s), got '{spec}'.")
+    return name, values
+
+
+@dataclass
+class FakeLLMConfig:
+    latency: str = "fixed:0"
+    token_latency: str = "fixed:0.02"
+    error_rate: float = 0.0
+    error_statuses: Tuple[int, ...] = (500, 503, 429)
+    hang_rate: float = 0.0
+    hang_seconds: float = 300.0
+    stream_error_rate: float = 0.0
+    response_tokens: int = 40
+    seed: int = 0
+    _latency: Tuple[str, List[float]] = field(default=None, init=False, repr=False)
+    _token_latency: Tuple[str, List[float]] = field(default=None, init=False, repr=False)
+    
+    def __post_init__(self):
+        self._latency = parse_latency(self.latency)
+        self._token_latency = parse_latency(self.token_latency)
+
+
+class FakeLLM:
+    
+    def __init__(self, config: FakeLLMConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.requests = 0
+        self.streams = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.errors: Dict[int, int] = {}
+        self.hangs = 0
+        self.stream_errors = 0
+    
+    def sample(self, distribution: Tuple[str, List[float]]) -> float:
+        name, params = distribution
+        if name == "fixed":
+            value = params[0]
+        elif name == "uniform":
+            value = self.rng.uniform(*params)
+        elif name == "normal":
+            value = self.rng.gauss(*params)
+        elif name == "lognormal":
+            value = self.rng.lognormvariate(*params)
+        else:
+            value = self.rng.expovariate(1 / params[0]) if params[0] > 0 else 0.0
+        return max(0.0, value)
+    
+    def answer_tokens(self) -> List[str]:
+        words = [ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(self.config.response_tokens)]
+        return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "streams": self.streams,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "errors": self.errors,
+            "hangs": self.hangs,
+            "stream_errors": self.stream_errors
+        }
+
+
+def _error(status_code: int, message: str) -> JSONResponse:
+    # Same body shape as the real API so SDK clients raise the right error
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": "fake_llm_error", "code": str(status_code)}}
+    )
+
+
+def create_app(config: FakeLLMConfig) -> FastAPI:
+    fake = FakeLLM(config)
+    app = FastAPI(title="Fake OpenAI-compatible LLM")
+    app.state.fake = fake
+    
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "fake-model", "object": "model", "owned_by": "local"}]}
+    
+    @app.get("/stats")
+    async def stats():
+        return fake.stats()
+    
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        fake.requests += 1
+        fake.in_flight += 1
+        fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+        streaming = False
+        try:
+            await asyncio.sleep(fake.sample(config._latency))
+            
+            roll = fake.rng.random()
+            if roll < config.hang_rate:
+                fake.hangs += 1
+                await asyncio.sleep(config.hang_seconds)
+            elif roll < config.hang_rate + config.error_rate:
+                status_code = fake.rng.choice(config.error_statuses)
+                fake.errors[status_code] = fake.errors.get(status_code, 0) + 1
+                return _error(status_code, f"Injected failure ({status_code})")
+            
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+            created = int(time.time())
+            model = body.get("model", "fake-model")
+            tokens = fake.answer_tokens()
+            prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in body.get("messages", []))
+            
+            if body.get("stream"):
+                fake.streams += 1
+                streaming = True
+                return StreamingResponse(
+                    _stream(fake, completion_id, created, model, tokens),
+                    media_type="text/event-stream"
+                )
+            
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(tokens),
+                    "total_tokens": prompt_tokens + len(tokens)
+                }
+            }
+        finally:
+            if not streaming:
+                fake.in_flight -= 1
+    
+    return app
+
+
+async def _stream(fake: FakeLLM, completion_id: str, created: int, model: str, tokens: List[str]):
+    def chunk(delta: Dict[str, str], finish_reason=None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    # Decide up front whether (and where) this stream breaks off
+    break_at = None
+    if fake.rng.random() < fake.config.stream_error_rate:
+        break_at = fake.rng.randrange(1, max(2, len(tokens)))
+    
+    try:
+        yield chunk({"role": "assistant"})
+        for i, token in enumerate(tokens):
+            if i == break_at:
+                fake.stream_errors += 1
+                raise ConnectionResetError("Injected stream failure")
+            await asyncio.sleep(fake.sample(fake.config._token_latency))
+            yield chunk({"content": token})
+        yield chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+    finally:
+        fake.in_flight -= 1
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible chat completions server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="fixed:0",
+                        help="time to first byte, e.g. fixed:0.2, uniform:0.1,0.5, normal:0.3,0.05, "
+                             "lognormal:-1.5,0.5, exponential:0.2")
+    parser.add_argument("--token-latency", default="fixed:0.02", help="delay between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with an HTTP error")
+    parser.add_argument("--error-statuses", default="500,503,429", help="comma separated statuses to fail with")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="fraction of requests that never answer")
+    parser.add_argument("--hang-seconds", type=float, default=300.0)
+    parser.add_argument("--stream-error-rate", type=float, default=0.0,
+                        help="fraction of streams cut off partway through")
+    parser.add_argument("--response-tokens", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = FakeLLMConfig(
+        latency=args.latency,
+        token_latency=args.token_latency,
+        error_rate=args.error_rate,
+        error_statuses=tuple(int(value) for value in args.error_statuses.split(",") if value.strip()),
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+        stream_error_rate=args.stream_error_rate,
+        response_tokens=args.response_tokens,
+        seed=args.seed
+    )
+    print(f"Fake LLM listening on http://{args.host}:{args.port}/v1")
+    print(f"Point the API at it with OPENAI_BASE_URL=http://{args.host}:{args.port}/v1")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
+import os
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+# Tests build their own RAG services; skip indexing data/documents on startup
+os.environ.setdefault("RAG_WARM_UP", "false")
+# The outbox worker would poll the dev database; requests drain the test one
+os.environ.setdefault("GAMIFICATION_WORKER", "false")
+# Same for the leaderboard, it is loaded from the test database on first read
+os.environ.setdefault("GAMIFICATION_LEADERBOARD_WARM_UP", "false")
+
 from app.interface import app
 from app.infrastructure.database import get_db
 from app.domain.models import Base
+from app.application.services.gamification_worker import GamificationOutboxWorker
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./data/db/test.db"
 
@@ -15,12 +24,18 @@ engine = create_engine(
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Stands in for the background worker: it catches up after every request,
+# so tests read their own awards deterministically
+outbox_worker = GamificationOutboxWorker(TestingSessionLocal)
+
 def override_get_db():
     try:
         db = TestingSessionLocal()
         yield db
     finally:
         db.close()
+        while outbox_worker.drain_once() == outbox_worker.batch_size:
+            pass
 
 app.dependency_overrides[get_db] = override_get_db
 
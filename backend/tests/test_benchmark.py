@@ -0,0 +1,26 @@
+import json
+
+import benchmark_rag
+
+
+def test_benchmark_reports_build_latency_and_recall(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_INDEX_PATH", str(tmp_path / "unused.bin"))
+    monkeypatch.setenv("RAG_RETRIEVAL_MODE", "hybrid")
+    output = tmp_path / "report.json"
+    
+    benchmark_rag.main([
+        "--documents", "0,20",
+        "--modes", "bm25",
+        "--repeat", "1",
+        "--skip-memory",
+        "--output", str(output)
+    ])
+    
+    report = json.loads(output.read_text(encoding="utf-8"))
+    assert [result["synthetic_documents"] for result in report["results"]] == [0, 20]
+    for result in report["results"]:
+        assert result["chunks"] > 0
+        assert result["build_seconds"] >= 0
+        assert result["retrieval_latency_ms"]["count"] == len(benchmark_rag.LABELED_QUESTIONS)
+        assert 0.0 <= result["recall_at_5"] <= 1.0
+    assert report["results"][0]["recall_at_5"] >= 0.8
@@ -0,0 +1,21 @@
+import json
+
+import build_rag_index
+from app.application.services.rag_store import load_index
+
+
+def test_build_rag_index_writes_a_loadable_index(tmp_path, monkeypatch, capsys):
+    folder = tmp_path / "documents"
+    folder.mkdir()
+    for i in range(3):
+        (folder / f"doc_{i}.txt").write_text(f"Documento {i} sobre crédito rural.", encoding="utf-8")
+    index_path = tmp_path / "rag_index.bin"
+    monkeypatch.setenv("RAG_INDEX_PATH", str(index_path))
+    
+    code = build_rag_index.main(["--data-folder", str(folder), "--index-path", str(index_path), "--workers", "2"])
+    
+    report = json.loads(capsys.readouterr().out)
+    assert code == 0
+    assert report["processed_files"] == 3
+    assert report["chunks"] == 3
+    assert load_index(str(index_path)) is not None
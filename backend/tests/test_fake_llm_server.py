@@ -0,0 +1,76 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from openai import AsyncOpenAI
+
+from app.application.services.rag_llm import CircuitBreaker, LLMGateway, LLMUnavailableError
+from fake_llm_server import FakeLLMConfig, create_app, parse_latency
+
+
+def make_client(app):
+    return AsyncOpenAI(
+        api_key="fake",
+        base_url="http://fake-llm/v1",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://fake-llm/v1")
+    )
+
+
+def test_parse_latency_validates_distributions():
+    assert parse_latency("uniform:0.1,0.5") == ("uniform", [0.1, 0.5])
+    with pytest.raises(ValueError):
+        parse_latency("gamma:1")
+    with pytest.raises(ValueError):
+        parse_latency("normal:0.3")
+
+
+def test_fake_server_speaks_the_chat_completions_protocol():
+    client = TestClient(create_app(FakeLLMConfig(response_tokens=5)))
+    
+    response = client.post("/v1/chat/completions", json={
+        "model": "gpt-4o-mini",
+        "messages": [{"role": "user", "content": "Olá"}]
+    })
+    
+    assert response.status_code == 200
+    body = response.json()
+    assert body["object"] == "chat.completion"
+    assert body["usage"]["completion_tokens"] == 5
+    assert client.get("/stats").json()["in_flight"] == 0
+
+
+def test_openai_sdk_streams_from_the_fake_server():
+    app = create_app(FakeLLMConfig(token_latency="fixed:0", response_tokens=6))
+    gateway = LLMGateway(make_client(app))
+    
+    async def collect():
+        return [token async for token in gateway.stream(model="m", messages=[{"role": "user", "content": "Oi"}])]
+    
+    tokens = asyncio.run(collect())
+    
+    assert len(tokens) == 6
+    assert "".join(tokens).startswith("De acordo com")
+    assert app.state.fake.stats()["streams"] == 1
+
+
+def test_injected_errors_trip_the_circuit_breaker():
+    app = create_app(FakeLLMConfig(error_rate=1.0, error_statuses=(503,)))
+    gateway = LLMGateway(
+        make_client(app),
+        max_retries=1,
+        backoff_base=0.001,
+        breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    )
+    
+    async def call():
+        return await gateway.complete(model="m", messages=[{"role": "user", "content": "Oi"}])
+    
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(call())
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(call())
+    
+    assert app.state.fake.stats()["errors"] == {503: 2}
+    assert gateway.stats()["circuit_breaker"]["state"] == "open"
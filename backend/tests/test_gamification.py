@@ -1,5 +1,15 @@
+import asyncio
+
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from app.infrastructure.database import migrate_tables
+from app.domain.models import Base, Badge, GamificationEvent, LeaderboardChange, User, UserBadge, UserLevel, UserPoints
+from app.application.services.gamification_service import GamificationService
+from app.application.services.gamification_worker import GamificationOutboxWorker
+from app.application.services.gamification_leaderboard import Leaderboard, leaderboard
+from app.application.dto import PointsAward
 
 def test_gamification_basic_flow(client: TestClient):
     # Create a user
@@ -178,3 +188,408 @@ def test_gamification_leaderboard(client: TestClient):
     user2_entry = next(u for u in leaderboard if u["user_id"] == user_ids[1])
     assert user1_entry["total_points"] == 60
     assert user2_entry["total_points"] == 10
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'points.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine, autoflush=False)
+    leaderboard.reset()
+    engine.dispose()
+
+def test_add_points_is_one_transaction(session_factory):
+    engine = session_factory.kw["bind"]
+    db = session_factory()
+    db.add_all([
+        Badge(name="Iniciante", description="5 pontos", points_required=5, category="forum"),
+        Badge(name="Veterano", description="100 pontos", points_required=100, category="forum")
+    ])
+    db.commit()
+    
+    statements = []
+    commits = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    event.listen(engine, "commit", lambda conn: commits.append(conn))
+    
+    service = GamificationService(db)
+    first = service.add_points(1, "forum_comment", source_id=7)
+    second = service.add_points(1, "course_completion", source_id=3)
+    
+    assert first.points == 5 and first.id and first.created_at
+    assert second.points == 50
+    # Ledger insert, level upsert, badge grants
+    assert len(statements) == 6
+    assert not [sql for sql in statements if sql.startswith("UPDATE")]
+    assert len(commits) == 2
+    level = db.query(UserLevel).filter(UserLevel.user_id == 1).one()
+    assert (level.total_points, level.experience_points, level.level) == (55, 55, 1)
+    assert db.query(UserBadge).filter(UserBadge.user_id == 1).count() == 1
+    
+    service.add_points(1, "course_completion", source_id=4, commit=False)
+    db.commit()
+    assert db.query(UserLevel).filter(UserLevel.user_id == 1).one().level == 2
+    assert db.query(UserBadge).filter(UserBadge.user_id == 1).count() == 2
+
+def test_outbox_applies_enqueued_awards_in_batches(session_factory):
+    db = session_factory()
+    service = GamificationService(db)
+    for user_id, source in [(1, "forum_comment"), (1, "community_join"), (2, "course_enrollment")]:
+        service.enqueue_points(user_id, source, source_id=10)
+    db.commit()
+    assert db.query(UserPoints).count() == 0
+    
+    worker = GamificationOutboxWorker(session_factory, batch_size=2)
+    assert [worker.drain_once() for _ in range(3)] == [2, 1, 0]
+    
+    totals = dict(db.query(UserLevel.user_id, UserLevel.total_points).all())
+    assert totals == {1: 13, 2: 10}
+    assert db.query(GamificationEvent).filter(GamificationEvent.processed_at.is_(None)).count() == 0
+    
+    # A redelivered (already claimed) event is not applied again
+    first = db.query(GamificationEvent).order_by(GamificationEvent.id).first()
+    assert service._apply_events([(first.id, 1, "forum_comment", 10, None)]) == 0
+    db.commit()
+    assert db.query(UserPoints).count() == 3
+    db.close()
+
+def test_gamification_reads_never_drain_the_outbox(session_factory):
+    engine = session_factory.kw["bind"]
+    db = session_factory()
+    db.add(User(name="Leitor", email="leitor@example.com", phone="11222222222", user_type="general"))
+    db.commit()
+    service = GamificationService(db)
+    service.add_points(1, "forum_post", source_id=1)
+    service.enqueue_points(1, "forum_comment", source_id=2)
+    db.commit()
+    
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    stats = service.get_user_stats(1)
+    service.get_user_badges(1)
+    service.get_leaderboard()
+    service.get_user_rank(1)
+    
+    assert stats.total_points == 10
+    assert all(sql.lstrip().startswith("SELECT") for sql in statements)
+    assert db.query(GamificationEvent).filter(GamificationEvent.processed_at.is_(None)).count() == 1
+    db.close()
+
+def test_outbox_isolates_failing_events(session_factory, monkeypatch):
+    add_points = GamificationService.add_points
+    
+    def flaky_add_points(self, user_id, source, *args, **kwargs):
+        if source == "broken":
+            raise RuntimeError("scoring failed")
+        return add_points(self, user_id, source, *args, **kwargs)
+    
+    monkeypatch.setattr(GamificationService, "add_points", flaky_add_points)
+    db = session_factory()
+    service = GamificationService(db)
+    service.enqueue_points(1, "forum_comment")
+    service.enqueue_points(1, "broken")
+    service.enqueue_points(1, "forum_like")
+    db.commit()
+    
+    assert service.process_outbox() == 2
+    broken = db.query(GamificationEvent).filter(GamificationEvent.source == "broken").one()
+    assert (broken.attempts, broken.last_error, broken.processed_at) == (1, "scoring failed", None)
+    assert db.query(UserLevel).filter(UserLevel.user_id == 1).one().total_points == 7
+    
+    for _ in range(GamificationService.MAX_EVENT_ATTEMPTS):
+        service.process_outbox()
+    db.refresh(broken)
+    assert broken.attempts == GamificationService.MAX_EVENT_ATTEMPTS
+    db.close()
+
+def test_outbox_worker_runs_in_the_background(session_factory):
+    db = session_factory()
+    GamificationService(db).enqueue_points(3, "event_registration")
+    db.commit()
+    
+    async def run_worker():
+        worker = GamificationOutboxWorker(session_factory, poll_interval=0.01)
+        worker.start()
+        for _ in range(200):
+            if worker.processed:
+                break
+            await asyncio.sleep(0.01)
+        await worker.stop()
+        return worker.stats()
+    
+    stats = asyncio.run(run_worker())
+    assert stats["processed"] == 1
+    assert stats["running"] is False
+    assert db.query(UserPoints).filter(UserPoints.user_id == 3).count() == 1
+    db.close()
+
+def test_point_awards_are_idempotent(client: TestClient):
+    user_id = client.post("/api/v1/users/", json={
+        "name": "Retry User",
+        "email": "retry@example.com",
+        "phone": "11777777777",
+        "user_type": "general"
+    }).json()["id"]
+    url = f"/api/v1/gamification/users/{user_id}/points"
+    
+    first = client.post(url, params={"source": "event_attendance", "source_id": 5})
+    retry = client.post(url, params={"source": "event_attendance", "source_id": 5})
+    assert first.status_code == retry.status_code == 201
+    assert retry.json()["id"] == first.json()["id"]
+    
+    headers = {"Idempotency-Key": "bonus-2024-01"}
+    bonus = client.post(url, params={"source": "active_member"}, headers=headers)
+    bonus_retry = client.post(url, params={"source": "active_member"}, headers=headers)
+    assert bonus_retry.json()["id"] == bonus.json()["id"]
+    # Without a key, awards with no source_id are all distinct
+    assert client.post(url, params={"source": "active_member"}).json()["id"] != bonus.json()["id"]
+    
+    conflict = client.post(url, params={"source": "forum_like"}, headers=headers)
+    assert conflict.status_code == 409
+    
+    stats = client.get(f"/api/v1/gamification/users/{user_id}/stats").json()
+    assert stats["total_points"] == 15 + 30 + 30
+
+def test_migration_upgrades_databases_created_before_idempotent_awards(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE user_points (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+            "points INTEGER NOT NULL, source VARCHAR(50) NOT NULL, source_id INTEGER, "
+            "description VARCHAR(200), created_at DATETIME DEFAULT (CURRENT_TIMESTAMP))"
+        ))
+        conn.execute(text(
+            "CREATE TABLE user_levels (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, level INTEGER, "
+            "experience_points INTEGER, total_points INTEGER, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME)"
+        ))
+        conn.execute(text(
+            "INSERT INTO user_points (user_id, points, source, source_id) VALUES "
+            "(1, 30, 'event_attendance', 5), (1, 30, 'event_attendance', 5), (1, 10, 'forum_post', NULL), "
+            "(1, 10, 'forum_post', NULL), (2, 30, 'event_attendance', 5)"
+        ))
+        conn.execute(text(
+            "INSERT INTO user_levels (user_id, level, experience_points, total_points) VALUES "
+            "(1, 1, 80, 80), (2, 1, 0, 0), (2, 1, 30, 30)"
+        ))
+    Base.metadata.create_all(bind=engine)
+    migrate_tables(engine)
+    
+    # Already migrated: the next start only looks
+    executed = []
+    def record(conn, cursor, statement, *args):
+        executed.append((statement, cursor.rowcount))
+    event.listen(engine, "after_cursor_execute", record)
+    migrate_tables(engine)
+    event.remove(engine, "after_cursor_execute", record)
+    assert executed
+    assert all(sql.lstrip().upper().startswith(("SELECT", "PRAGMA")) for sql, _ in executed)
+    assert all(rowcount <= 0 for _, rowcount in executed)
+    
+    db = sessionmaker(bind=engine)()
+    assert db.query(UserPoints).filter(UserPoints.user_id == 1).count() == 3
+    assert {(level.user_id, level.total_points) for level in db.query(UserLevel)} == {(1, 50), (2, 30)}
+    
+    service = GamificationService(db)
+    first = service.add_points(1, "forum_comment", source_id=7, idempotency_key="comment-7")
+    assert service.add_points(1, "forum_comment", source_id=7).id == first.id
+    assert service.add_points(2, "forum_like", idempotency_key="comment-7").id != first.id
+    assert service.get_user_stats(1).total_points == 55
+    # Old databases get the leaderboard change triggers too
+    assert db.query(LeaderboardChange).filter(LeaderboardChange.user_id.in_([1, 2])).count() == 2
+    db.close()
+    engine.dispose()
+
+def test_bulk_awards_use_set_based_statements(session_factory):
+    engine = session_factory.kw["bind"]
+    db = session_factory()
+    db.add(Badge(name="Participante", description="15 pontos", points_required=15, category="events"))
+    db.commit()
+    GamificationService(db).add_points(1, "forum_comment", source_id=1)
+    
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    awards = [PointsAward(user_id=user_id, source="event_attendance", source_id=42) for user_id in range(1, 1201)]
+    awards.append(PointsAward(user_id=1, source="event_attendance", source_id=42))
+    awards.append(PointsAward(user_id=1, source="forum_comment", source_id=1))
+    
+    result = GamificationService(db).add_points_bulk(awards)
+    
+    assert (result.requested, result.awarded, result.duplicates) == (1202, 1200, 2)
+    assert (result.users_updated, result.total_points) == (1200, 1200 * 15)
+    # Batched ledger insert; per 500 users: level upsert, badges
+    assert len([sql for sql in statements if sql.startswith("INSERT INTO user_points")]) <= 3
+    assert len([sql for sql in statements if sql.startswith("INSERT INTO user_levels")]) == 3
+    assert not [sql for sql in statements if sql.startswith("UPDATE")]
+    assert db.query(UserPoints).count() == 1201
+    totals = dict(db.query(UserLevel.user_id, UserLevel.total_points).all())
+    assert totals[1] == 20 and totals[1200] == 15
+    assert db.query(UserBadge).count() == 1200
+    db.close()
+
+def test_bulk_points_endpoint(client: TestClient):
+    user_ids = [
+        client.post("/api/v1/users/", json={
+            "name": f"Fair User {i}",
+            "email": f"fair{i}@example.com",
+            "phone": f"1166666666{i}",
+            "user_type": "general"
+        }).json()["id"]
+        for i in range(3)
+    ]
+    payload = {"awards": [
+        {"user_id": user_id, "source": "event_attendance", "source_id": 7, "description": "Feira cooperativa"}
+        for user_id in user_ids
+    ]}
+    
+    response = client.post("/api/v1/gamification/points/bulk", json=payload)
+    assert response.status_code == 201
+    assert response.json() == {"requested": 3, "awarded": 3, "duplicates": 0, "users_updated": 3, "total_points": 45}
+    
+    retry = client.post("/api/v1/gamification/points/bulk", json=payload)
+    assert retry.json()["duplicates"] == 3
+    assert client.post("/api/v1/gamification/points/bulk", json={"awards": []}).status_code == 422
+    
+    leaderboard = client.get("/api/v1/gamification/leaderboard").json()
+    assert {entry["user_id"]: entry["total_points"] for entry in leaderboard} == dict.fromkeys(user_ids, 15)
+
+def test_leaderboard_ranks_with_bisect():
+    board = Leaderboard()
+    board.apply({1: (10, 1, 0)})
+    assert len(board) == 0
+    
+    board.loaded = True
+    board.apply({user_id: (points, 1, 0) for user_id, points in [(1, 10), (2, 50), (3, 30), (4, 30), (5, 0)]})
+    assert [standing.user_id for _, standing in board.top(3)] == [2, 3, 4]
+    assert board.rank(4) == 3
+    assert board.rank(99) is None
+    
+    board.apply({5: (60, 2, 1)})
+    assert board.rank(5) == 1
+    assert [(rank, standing.user_id) for rank, standing in board.neighbors(3, 1)] == [(2, 2), (3, 3), (4, 4)]
+    assert [rank for rank, _ in board.neighbors(5, 2)] == [1, 2, 3]
+    assert board.top(1)[0][1].badges_count == 1
+
+def test_leaderboard_follows_committed_awards(session_factory):
+    engine = session_factory.kw["bind"]
+    db = session_factory()
+    db.add_all([
+        User(name=f"Ranked {i}", email=f"ranked{i}@example.com", phone=f"1155555555{i}", user_type="general")
+        for i in range(3)
+    ])
+    db.add(Badge(name="Comentarista", description="5 pontos", points_required=5, category="forum"))
+    db.commit()
+    service = GamificationService(db)
+    service.add_points(1, "forum_comment")
+    assert leaderboard.loaded is False
+    
+    assert [entry.user_id for entry in service.get_leaderboard()] == [1]
+    service.add_points_bulk([PointsAward(user_id=user_id, source="course_enrollment", source_id=1) for user_id in (2, 3)])
+    service.add_points(3, "forum_post", commit=False)
+    db.rollback()
+    
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    board = service.get_leaderboard()
+    assert [(entry.user_id, entry.total_points, entry.rank) for entry in board] == [(2, 10, 1), (3, 10, 2), (1, 5, 3)]
+    assert board[0].badges_count == 1
+    assert not [sql for sql in statements if "GROUP BY" in sql]
+    
+    assert service.get_user_rank(3).rank == 2
+    assert service.get_user_rank(99) is None
+    assert [entry.user_id for entry in service.get_leaderboard_neighbors(1, radius=1)] == [3, 1]
+    db.close()
+
+def test_leaderboard_catches_up_with_other_processes(session_factory):
+    engine = session_factory.kw["bind"]
+    db = session_factory()
+    db.add_all([
+        User(name=f"Shared {i}", email=f"shared{i}@example.com", phone=f"1166666666{i}", user_type="general")
+        for i in range(4)
+    ])
+    db.commit()
+    service = GamificationService(db)
+    service.add_points(1, "forum_comment")
+    assert [entry.user_id for entry in service.get_leaderboard()] == [1]
+    
+    # Written by another API process or an outbox worker running elsewhere
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO user_points (user_id, points, source) VALUES (2, 30, 'event_attendance')"))
+        conn.execute(text("INSERT INTO user_levels (user_id, level, experience_points, total_points) VALUES (2, 1, 30, 30)"))
+        conn.execute(text("INSERT INTO user_points (user_id, points, source) VALUES (1, 10, 'forum_post')"))
+        conn.execute(text("UPDATE user_levels SET total_points = 15, experience_points = 15 WHERE user_id = 1"))
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert [(entry.user_id, entry.total_points) for entry in service.get_leaderboard()] == [(2, 30), (1, 15)]
+    assert not [sql for sql in statements if "GROUP BY" in sql]
+    
+    # A level row with no points yet still ranks, last
+    service.get_user_stats(3)
+    assert [(entry.user_id, entry.total_points, entry.rank) for entry in service.get_leaderboard()] == [
+        (2, 30, 1), (1, 15, 2), (3, 0, 3)
+    ]
+    
+    # Nothing changed since: no table is counted or aggregated
+    statements.clear()
+    service.get_leaderboard()
+    assert not [sql for sql in statements if "count(" in sql.lower()]
+    db.close()
+
+def test_leaderboard_ranks_have_no_gaps_for_missing_users(session_factory):
+    engine = session_factory.kw["bind"]
+    db = session_factory()
+    db.add_all([
+        User(name=f"Gap {i}", email=f"gap{i}@example.com", phone=f"1177777777{i}", user_type="general")
+        for i in range(3)
+    ])
+    db.commit()
+    service = GamificationService(db)
+    for user_id, source in [(1, "forum_post"), (2, "event_attendance"), (3, "forum_comment")]:
+        service.add_points(user_id, source)
+    service.add_points(99, "course_completion")
+    
+    board = service.get_leaderboard()
+    assert [(entry.user_id, entry.rank) for entry in board] == [(2, 1), (1, 2), (3, 3)]
+    
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM users WHERE id = 2"))
+    assert [(entry.user_id, entry.rank) for entry in service.get_leaderboard()] == [(1, 1), (3, 2)]
+    assert service.get_user_rank(3).rank == 2
+    assert service.get_user_rank(99) is None
+    
+    # The highest user id leaves: seen from the change log, no rebuild needed
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM users WHERE id = 3"))
+    assert service.get_user_rank(1).rank == 1
+    assert leaderboard.rank(3) is None
+    assert not [sql for sql in statements if "GROUP BY" in sql]
+    db.close()
+
+def test_rank_endpoints(client: TestClient):
+    user_ids = [
+        client.post("/api/v1/users/", json={
+            "name": f"Neighbor User {i}",
+            "email": f"neighbor{i}@example.com",
+            "phone": f"1144444444{i}",
+            "user_type": "general"
+        }).json()["id"]
+        for i in range(4)
+    ]
+    for user_id, source in zip(user_ids, ["forum_like", "course_completion", "forum_comment", "community_create"]):
+        client.post(f"/api/v1/gamification/users/{user_id}/points", params={"source": source})
+    
+    rank = client.get(f"/api/v1/gamification/users/{user_ids[2]}/rank")
+    assert rank.status_code == 200
+    assert (rank.json()["rank"], rank.json()["total_points"]) == (3, 5)
+    
+    neighbors = client.get(f"/api/v1/gamification/users/{user_ids[3]}/neighbors", params={"radius": 1}).json()
+    assert [entry["user_id"] for entry in neighbors] == [user_ids[1], user_ids[3], user_ids[2]]
+    
+    missing = client.post("/api/v1/users/", json={
+        "name": "No Points",
+        "email": "nopoints@example.com",
+        "phone": "11333333333",
+        "user_type": "general"
+    }).json()["id"]
+    assert client.get(f"/api/v1/gamification/users/{missing}/rank").status_code == 404
+    assert client.get(f"/api/v1/gamification/users/{missing}/neighbors").json() == []
@@ -0,0 +1,956 @@
+import asyncio
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.application.services.rag_cache import AnswerCache
+from app.application.services.rag_chunker import Chunk, Chunker
+from app.application.services.rag_index import InvertedIndex
+from app.application.services.rag_llm import CircuitBreaker, LLMGateway, LLMUnavailableError
+from app.application.services.rag_memory import ConversationMemory
+from app.application.services.rag_metrics import MetricsRecorder, RequestTrace
+from app.application.services import rag_parsers
+from app.application.services.rag_ingest import IngestedBatch, IngestedFile, ingest_file, ingest_files
+from app.application.services.rag_packer import ContextPacker, estimate_tokens
+from app.application.services.rag_service import RAGService
+from app.application.services.rag_singleflight import SingleFlight
+from app.application.services.rag_store import HEADER, MappedIndex, load_index
+from app.application.services.rag_tabular import parse_csv
+from app.application.services.rag_text import TOKENIZER_VERSION, fold, tokenize
+from app.application.services.rag_vectors import VectorIndex, fuse_rankings
+from app.application.services.rag_watcher import DocumentWatcher
+
+
+class FakeCompletions:
+    def __init__(self, tokens=("Resposta ", "de ", "teste"), delay=0.0):
+        self.tokens = tokens
+        self.delay = delay
+        self.calls = []
+    
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        await asyncio.sleep(self.delay)
+        if kwargs.get("stream"):
+            return self._stream()
+        message = SimpleNamespace(content="".join(self.tokens))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+    
+    async def _stream(self):
+        for token in self.tokens:
+            await asyncio.sleep(self.delay)
+            delta = SimpleNamespace(content=token)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+class FlakyCompletions(FakeCompletions):
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = list(failures)
+        self.active = 0
+        self.max_active = 0
+    
+    async def create(self, **kwargs):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if self.failures:
+                failure = self.failures.pop(0)
+                if failure == "hang":
+                    await asyncio.sleep(10)
+                raise failure
+            return await super().create(**kwargs)
+        finally:
+            self.active -= 1
+
+
+def make_gateway(completions, **kwargs):
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return LLMGateway(client, backoff_base=0.001, **kwargs)
+
+
+@pytest.fixture
+def documents_folder(tmp_path):
+    folder = tmp_path / "documents"
+    folder.mkdir()
+    (folder / "cartoes.md").write_text(
+        "# Cartões\n\nO cartão de crédito tem anuidade grátis no primeiro ano.",
+        encoding="utf-8"
+    )
+    (folder / "pix.txt").write_text(
+        "O PIX é sempre gratuito para cooperados.",
+        encoding="utf-8"
+    )
+    (folder / "taxas.csv").write_text(
+        "Produto,Taxa_Mensal\nEmpréstimo Pessoal,1.99\nTED Outros Bancos,8.50\n",
+        encoding="utf-8"
+    )
+    return folder
+
+
+@pytest.fixture
+def rag_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("RAG_SYSTEM_PROMPT", "Você é um assistente de testes.")
+    monkeypatch.setenv("RAG_INDEX_PATH", str(tmp_path / "rag_index.bin"))
+
+
+def make_service(documents_folder):
+    service = RAGService()
+    service.data_folder = str(documents_folder)
+    completions = FakeCompletions()
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    service.llm.client = service.client
+    return service
+
+
+@pytest.fixture
+def rag_service(rag_env, documents_folder):
+    return make_service(documents_folder)
+
+
+def test_inverted_index_ranks_by_bm25():
+    index = InvertedIndex()
+    index.add(0, tokenize("taxa do cartão de crédito"))
+    index.add(1, tokenize("taxa taxa taxa do empréstimo pessoal"))
+    index.add(2, tokenize("pix gratuito"))
+    
+    results = index.search(tokenize("empréstimo taxa"), k=2)
+    
+    assert [doc_id for doc_id, _ in results] == [1, 0]
+    assert index.search(tokenize("inexistente"), k=2) == []
+
+
+def test_tokenize_folds_accents_drops_stopwords_and_stems():
+    assert fold("Crédito Consórcio AÇÃO") == "credito consorcio acao"
+    assert tokenize("Qual é a taxa dos cartões de crédito?") == tokenize("taxa cartao credito")
+    assert tokenize("imóveis gratuitas") == tokenize("imovel gratuito")
+    assert tokenize("o de para com") == []
+
+
+def test_persisted_index_from_another_tokenizer_is_rebuilt(rag_service, documents_folder, monkeypatch):
+    rag_service.process_files()
+    monkeypatch.setattr("app.application.services.rag_store.TOKENIZER_VERSION", TOKENIZER_VERSION + "-old")
+    
+    stale = make_service(documents_folder)
+    
+    assert not stale.manifest
+    assert sorted(stale.process_files()["processed_files"]) == ["cartoes.md", "pix.txt", "taxas.csv"]
+
+
+def test_vector_index_matches_inflected_forms():
+    vectors = VectorIndex(dim=256)
+    vectors.add(10, tokenize("As taxas dos cartões de crédito"))
+    vectors.add(11, tokenize("Consórcio de imóveis e veículos"))
+    vectors.add(12, tokenize("Previdência privada"))
+    vectors.remove(12)
+    
+    results = vectors.search_batch([tokenize("taxa do cartão"), tokenize("imóvel")], k=2, min_score=0.1)
+    
+    assert results[0][0][0] == 10
+    assert results[1][0][0] == 11
+    assert all(chunk_id != 12 for ranking in results for chunk_id, _ in ranking)
+    assert vectors.matrix.dtype.name == "float32"
+
+
+def test_fuse_rankings_rewards_agreement():
+    fused = fuse_rankings([[(1, 9.0), (2, 5.0)], [(2, 0.9), (3, 0.8)]], k=3)
+    
+    assert [doc_id for doc_id, _ in fused] == [2, 1, 3]
+
+
+def test_markdown_chunks_follow_headings():
+    content = "# Guia\n\nIntro.\n\n## Cartões\n\nAnuidade grátis.\n\n## Pix\n\nSempre gratuito.\n"
+    chunks = Chunker().chunk("guia.md", content)
+    
+    assert [chunk.title for chunk in chunks] == ["Guia", "Guia > Cartões", "Guia > Pix"]
+    for chunk in chunks:
+        assert content[chunk.start:chunk.end] == chunk.text
+
+
+def test_text_chunks_overlap_within_size():
+    content = "\n\n".join(f"Parágrafo número {i} sobre crédito." for i in range(40))
+    chunks = Chunker(chunk_size=200, overlap=60).chunk("longo.txt", content)
+    
+    assert len(chunks) > 1
+    assert all(len(chunk.text) <= 200 for chunk in chunks)
+    assert all(b.start < a.end for a, b in zip(chunks, chunks[1:]))
+
+
+def test_csv_chunks_one_row_each_with_column_names():
+    content = "Produto,Taxa\n" + "".join(f"Produto {i},{i}.00\n" for i in range(25))
+    chunks = Chunker().chunk("taxas.csv", content)
+    
+    assert len(chunks) == 25
+    assert chunks[3].text == "Produto: Produto 3 | Taxa: 3.00"
+    assert content[chunks[3].start:chunks[3].end] == "Produto 3,3.00\n"
+
+
+def test_parse_csv_types_columns_and_filters_rows():
+    table = parse_csv(
+        "Produto;Taxa;Obs\n"
+        "\"Cartão; Nacional\";8,90;Anuidade\n"
+        "PIX;0;\n"
+        "\n"
+        "Empréstimo;1.234,50;Taxa mínima\n"
+    )
+    
+    assert table.types == {"Produto": "text", "Taxa": "number", "Obs": "text"}
+    assert table.values["Taxa"] == [8.9, 0.0, 1234.5]
+    assert table.row(0)["Produto"] == "Cartão; Nacional"
+    assert table.select({"taxa": {"lte": "10"}}) == [0, 1]
+    assert table.select({"Produto": "pix"}) == [1]
+    assert table.select({"Inexistente": 1}) is None
+    assert table.match(frozenset(tokenize("qual a taxa do pix?"))) == [1]
+    with pytest.raises(ValueError):
+        table.select({"Taxa": {"between": 1}})
+
+
+def test_streaming_parsers_survive_block_boundaries(tmp_path, monkeypatch):
+    # Tiny blocks so every record, tag and number straddles a boundary
+    monkeypatch.setattr(rag_parsers, "BLOCK_CHARS", 7)
+    chunker = Chunker(chunk_size=200, overlap=20)
+    files = {
+        "taxas.json": json.dumps([{"produto": "Cartão", "taxa": 12345.5}, {"produto": "TED", "detalhe": {"limite": 500}}]),
+        "eventos.ndjson": '{"evento": "login"}\nlinha quebrada\n\n{"evento": "pix"}\n',
+        "ajuda.html": "<html><head><title>Ajuda</title><style>p {}</style></head><body><h1>Cartões</h1>"
+                      "<p>Anuidade &amp; zero.</p><script>track()</script><h2>Taxas</h2><p>Sem tarifa.</p></body></html>",
+        "api.log": "".join(f"2024-01-01 requisição {i}\n" for i in range(30)),
+    }
+    parsed = {}
+    for filename, content in files.items():
+        (tmp_path / filename).write_text(content, encoding="utf-8")
+        document = rag_parsers.parse_file(filename, str(tmp_path / filename), chunker)
+        parsed[filename] = list(document)
+        assert document.content_hash == hashlib.sha256(content.encode("utf-8")).hexdigest()
+    
+    assert [c.text for c in parsed["taxas.json"]] == ["produto: Cartão\ntaxa: 12345.5", "produto: TED\ndetalhe.limite: 500"]
+    assert [c.text for c in parsed["eventos.ndjson"]] == ["evento: login", "evento: pix"]
+    assert [(c.title, c.text) for c in parsed["ajuda.html"]] == [
+        ("Cartões", "Anuidade & zero."),
+        ("Cartões > Taxas", "Sem tarifa.")
+    ]
+    assert all(len(c.text) <= 200 for c in parsed["api.log"])
+    assert "".join(c.text + "\n" for c in parsed["api.log"]) == files["api.log"]
+    assert ".html" in rag_parsers.supported_extensions()
+
+
+def test_parsers_yield_chunks_while_reading(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_parsers, "BLOCK_CHARS", 64)
+    content = "\n\n".join(f"Parágrafo {i} sobre crédito rural." for i in range(200))
+    (tmp_path / "longo.txt").write_text(content, encoding="utf-8")
+    
+    document = rag_parsers.parse_file("longo.txt", str(tmp_path / "longo.txt"), Chunker(chunk_size=100, overlap=0))
+    chunks = iter(document)
+    first = next(chunks)
+    assert first.start == 0 and document.content_hash is None
+    assert len([first, *chunks]) > 50
+    assert document.content_hash == hashlib.sha256(content.encode("utf-8")).hexdigest()
+    with pytest.raises(TypeError):
+        rag_parsers.DocumentParser()
+
+
+def test_ingest_file_sends_bounded_batches(tmp_path):
+    content = "".join(f"2024-01-01 requisição {i} concluída\n" for i in range(100))
+    (tmp_path / "api.log").write_text(content, encoding="utf-8")
+    
+    events = list(ingest_file("api.log", str(tmp_path / "api.log"), chunk_size=80, overlap=0, dim=64, batch_chunks=8))
+    
+    batches, done = events[:-1], events[-1]
+    assert len(batches) > 1 and all(isinstance(batch, IngestedBatch) for batch in batches)
+    assert all(len(batch.chunks) <= 8 and batch.vectors.shape == (len(batch.chunks), 64) for batch in batches)
+    assert isinstance(done, IngestedFile) and done.error is None
+    assert done.content_hash == hashlib.sha256(content.encode("utf-8")).hexdigest()
+    assert isinstance(list(ingest_file("nada.log", str(tmp_path / "nada.log")))[-1].error, str)
+
+
+def test_parallel_ingestion_streams_bounded_batches(tmp_path):
+    files = []
+    for i in range(3):
+        (tmp_path / f"api{i}.log").write_text(
+            "".join(f"2024-01-0{i + 1} requisição {j} concluída\n" for j in range(60)), encoding="utf-8"
+        )
+        files.append((f"api{i}.log", str(tmp_path / f"api{i}.log")))
+    files.append(("perdido.log", str(tmp_path / "perdido.log")))
+    
+    events = list(ingest_files(files, Chunker(chunk_size=80, overlap=0), dim=32, workers=2, batch_chunks=5))
+    
+    done = {event.filename: position for position, event in enumerate(events) if isinstance(event, IngestedFile)}
+    assert sorted(done) == ["api0.log", "api1.log", "api2.log", "perdido.log"]
+    assert events[done["perdido.log"]].error
+    batches = [(position, event) for position, event in enumerate(events) if isinstance(event, IngestedBatch)]
+    assert all(len(batch.chunks) <= 5 for _, batch in batches)
+    assert all(position < done[batch.filename] for position, batch in batches)
+    assert sum(len(batch.chunks) for _, batch in batches) == 3 * len(
+        list(rag_parsers.parse_file("api0.log", files[0][1], Chunker(chunk_size=80, overlap=0)))
+    )
+
+
+def test_windows_line_endings_keep_sections_and_rows(tmp_path):
+    files = {
+        "guia.md": "# Guia\r\n\r\nIntro.\r\n\r\n## Pix\r\n\r\nSempre gratuito.\r\n",
+        "taxas.csv": "Produto,Obs\r\nPIX,\"Linha um\r\nLinha dois\"\r\nTED,Tarifa\r\n",
+    }
+    parsed = {}
+    for filename, content in files.items():
+        (tmp_path / filename).write_bytes(content.encode("utf-8"))
+        parsed[filename] = rag_parsers.parse_file(filename, str(tmp_path / filename), Chunker())
+    
+    guide = list(parsed["guia.md"])
+    assert [c.title for c in guide] == ["Guia", "Guia > Pix"]
+    assert not any("\r" in c.text for c in guide)
+    assert len(list(parsed["taxas.csv"])) == 2
+    assert parsed["taxas.csv"].table.row(0)["Obs"] == "Linha um\r\nLinha dois"
+
+
+def test_context_packer_respects_budget_and_drops_duplicates():
+    ranked = [
+        Chunk("b.txt", "O PIX é gratuito para pessoas físicas em qualquer horário.", 100, 160),
+        Chunk("a.txt", "Cartões sem anuidade no primeiro ano.", 0, 40),
+        Chunk("b.txt", "O PIX é gratuito para pessoas físicas em qualquer horário!", 300, 360),
+        Chunk("b.txt", "Transferências agendadas também são aceitas.", 0, 50),
+        Chunk("c.txt", "Consórcio " * 200, 0, 2000)
+    ]
+    packed = ContextPacker(token_budget=80).pack(ranked)
+    
+    assert packed.tokens <= 80
+    assert packed.dropped_duplicates == 1
+    assert packed.sources == ["b.txt", "a.txt"]
+    assert [(chunk.source, chunk.start) for chunk in packed.chunks] == [("b.txt", 0), ("b.txt", 100), ("a.txt", 0)]
+    assert packed.tokens == estimate_tokens(packed.text)
+
+
+def test_chat_reports_prompt_tokens(rag_service):
+    result = asyncio.run(rag_service.chat("Quais as taxas do cartão?"))
+    
+    assert 0 < result["prompt_tokens"] <= rag_service.packer.token_budget + 100
+
+
+def test_status_reports_stage_histograms(rag_service):
+    asyncio.run(rag_service.chat("Quais as taxas do cartão?"))
+    asyncio.run(rag_service.chat("Quais as taxas do cartão?"))
+    
+    async def consume():
+        return [event async for event in rag_service.chat_stream("O pix é gratuito?")]
+    
+    asyncio.run(consume())
+    
+    metrics = rag_service.get_status()["metrics"]
+    assert metrics["window"] == metrics["recorded"] == 3
+    assert metrics["streamed"] == 1
+    assert metrics["cache_hit_ratio"] == round(1 / 3, 4)
+    stages = metrics["stages_ms"]
+    assert stages["total"]["count"] == stages["retrieval"]["count"] == stages["packing"]["count"] == 3
+    assert stages["llm"]["count"] == 2
+    assert stages["llm_first_token"]["count"] == 1
+    assert sum(stages["total"]["buckets"].values()) == 3
+    assert metrics["prompt_tokens"]["count"] == 3
+    assert metrics["top_score"]["count"] == 3
+    assert metrics["dominant_stage"] in {"reload_check", "retrieval", "packing", "llm_first_token", "llm"}
+
+
+def test_metrics_ring_buffer_keeps_the_latest_requests():
+    recorder = MetricsRecorder(capacity=2)
+    for prompt_tokens in (100, 200, 300):
+        trace = RequestTrace(prompt_tokens=prompt_tokens)
+        with trace.stage("retrieval"):
+            pass
+        recorder.record(trace)
+    
+    summary = recorder.summary()
+    assert summary["recorded"] == 3
+    assert summary["window"] == 2
+    assert summary["prompt_tokens"]["p50"] == 300
+    assert summary["prompt_tokens"]["buckets"]["<=200"] == 1
+    assert summary["stages_ms"]["llm"] == {"count": 0}
+
+
+def test_chat_uses_only_matching_documents(rag_service):
+    result = asyncio.run(rag_service.chat("O pix é gratuito?"))
+    
+    assert result["response"] == "Resposta de teste"
+    assert result["sources"] == ["pix.txt"]
+    prompt = rag_service.client.chat.completions.calls[0]["messages"][1]["content"]
+    assert "PIX" in prompt
+    assert "anuidade" not in prompt
+
+
+def test_chat_matches_unaccented_and_inflected_questions(rag_service):
+    result = asyncio.run(rag_service.chat("Os cartoes tem anuidade gratis?"))
+    
+    assert result["sources"] == ["cartoes.md"]
+    prompt = rag_service.client.chat.completions.calls[0]["messages"][1]["content"]
+    assert "anuidade grátis" in prompt
+
+
+def test_chat_falls_back_to_all_documents(rag_service):
+    result = asyncio.run(rag_service.chat("xyz"))
+    
+    assert len(result["sources"]) == 3
+
+
+def test_chat_stream_yields_sources_then_tokens(rag_service):
+    async def collect():
+        return [event async for event in rag_service.chat_stream("O pix é gratuito?")]
+    
+    events = asyncio.run(collect())
+    
+    assert events[0] == {"event": "sources", "data": ["pix.txt"]}
+    assert [e["data"] for e in events if e["event"] == "token"] == ["Resposta ", "de ", "teste"]
+    assert events[-1]["event"] == "done"
+    assert rag_service.client.chat.completions.calls[0]["stream"] is True
+
+
+def test_chat_stream_endpoint_emits_server_sent_events(client, rag_service, monkeypatch):
+    from app.interface import app
+    from app.interface.routes.rag import get_rag_service
+    monkeypatch.setitem(app.dependency_overrides, get_rag_service, lambda: rag_service)
+    
+    response = client.post("/api/v1/rag/chat/stream", json={"message": "O pix é gratuito?"})
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in response.text.strip().split("\n\n")
+    ]
+    assert events[0] == ("sources", ["pix.txt"])
+    assert "".join(data for name, data in events if name == "token") == "Resposta de teste"
+    assert events[-1][0] == "done"
+    assert events[-1][1]["prompt_tokens"] > 0
+
+
+def test_answer_cache_evicts_by_entries_bytes_and_ttl(monkeypatch):
+    cache = AnswerCache(max_entries=2, max_bytes=20, ttl_seconds=10)
+    cache.set("a", {"response": "aaaa", "sources": []})
+    cache.set("b", {"response": "bbbb", "sources": []})
+    assert cache.get("a") is not None
+    cache.set("c", {"response": "cccc", "sources": []})
+    
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    
+    cache.set("d", {"response": "d" * 17, "sources": []})
+    assert len(cache) == 1
+    assert cache.total_bytes <= 20
+    
+    now = time.monotonic()
+    monkeypatch.setattr("app.application.services.rag_cache.time.monotonic", lambda: now + 11)
+    assert cache.get("d") is None
+    assert cache.stats()["hits"] == 2
+
+
+def test_chat_answers_repeated_questions_from_cache(rag_service, documents_folder):
+    calls = rag_service.client.chat.completions.calls
+    
+    first = asyncio.run(rag_service.chat("O pix é gratuito?"))
+    second = asyncio.run(rag_service.chat("o PIX é gratuito"))
+    
+    assert first["response"] == second["response"]
+    assert first["sources"] == second["sources"]
+    assert len(calls) == 1
+    assert rag_service.get_status()["answer_cache"]["hits"] == 1
+    
+    (documents_folder / "pix.txt").write_text("O PIX é gratuito e instantâneo.", encoding="utf-8")
+    asyncio.run(rag_service.chat("O pix é gratuito?"))
+    
+    assert len(calls) == 2
+
+
+def test_concurrent_identical_questions_share_one_completion(rag_service):
+    completions = rag_service.client.chat.completions
+    completions.delay = 0.05
+    
+    async def ask_many():
+        return await asyncio.gather(*[rag_service.chat("O pix é gratuito?") for _ in range(5)])
+    
+    results = asyncio.run(ask_many())
+    
+    assert len(completions.calls) == 1
+    assert all(result == results[0] for result in results)
+    assert rag_service.get_status()["single_flight"]["shared"] == 4
+
+
+def test_concurrent_streams_fan_out_one_upstream_stream(rag_service):
+    completions = rag_service.client.chat.completions
+    completions.delay = 0.02
+    
+    async def collect():
+        return [event async for event in rag_service.chat_stream("O pix é gratuito?")]
+    
+    async def stream_many():
+        first = asyncio.ensure_future(collect())
+        await asyncio.sleep(0.03)
+        return [await first] + list(await asyncio.gather(collect(), collect()))
+    
+    streams = asyncio.run(stream_many())
+    
+    assert len(completions.calls) == 1
+    for events in streams:
+        assert "".join(e["data"] for e in events if e["event"] == "token") == "Resposta de teste"
+        assert events[-1]["event"] == "done"
+
+
+def test_single_flight_survives_leader_cancellation():
+    flights = SingleFlight()
+    
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "ok"
+    
+    async def scenario():
+        leader = asyncio.ensure_future(flights.do("key", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("key", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+    
+    assert asyncio.run(scenario()) == "ok"
+    assert flights.stats() == {"in_flight": 0, "leaders": 1, "shared": 1}
+
+
+def test_llm_gateway_retries_transient_failures():
+    completions = FlakyCompletions([ConnectionError("reset")])
+    gateway = make_gateway(completions, max_retries=2)
+    
+    response = asyncio.run(gateway.complete(model="m", messages=[]))
+    
+    assert response.choices[0].message.content == "Resposta de teste"
+    assert gateway.stats()["retries"] == 1
+    assert gateway.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_llm_gateway_does_not_retry_client_errors():
+    error = ValueError("bad request")
+    gateway = make_gateway(FlakyCompletions([error]), max_retries=2)
+    
+    with pytest.raises(ValueError):
+        asyncio.run(gateway.complete(model="m", messages=[]))
+    assert gateway.stats()["retries"] == 0
+
+
+def test_llm_gateway_limits_concurrency():
+    completions = FlakyCompletions([], delay=0.02)
+    gateway = make_gateway(completions, max_concurrency=2)
+    
+    async def run_many():
+        await asyncio.gather(*[gateway.complete(model="m", messages=[]) for _ in range(6)])
+    
+    asyncio.run(run_many())
+    
+    assert completions.max_active == 2
+
+
+def test_llm_gateway_rejects_calls_while_the_breaker_is_open():
+    completions = FlakyCompletions([ConnectionError("reset")])
+    gateway = make_gateway(
+        completions,
+        max_retries=0,
+        breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    )
+    
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(gateway.complete(model="m", messages=[]))
+    with pytest.raises(LLMUnavailableError, match="circuit breaker is open"):
+        asyncio.run(gateway.complete(model="m", messages=[]))
+    
+    # The second call never reached the client
+    assert not completions.failures and completions.calls == []
+    assert gateway.stats()["rejected"] == 1
+
+
+def test_circuit_breaker_opens_and_recovers(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=5)
+    now = time.monotonic()
+    monkeypatch.setattr("app.application.services.rag_llm.time.monotonic", lambda: now)
+    
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    
+    monkeypatch.setattr("app.application.services.rag_llm.time.monotonic", lambda: now + 6)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_chat_falls_back_to_retrieved_chunks_when_llm_is_down(rag_service):
+    completions = FlakyCompletions(["hang", "hang"])
+    rag_service.llm = make_gateway(
+        completions,
+        timeout=0.05,
+        max_retries=0,
+        breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    )
+    
+    first = asyncio.run(rag_service.chat("O pix é gratuito?"))
+    second = asyncio.run(rag_service.chat("Qual a anuidade do cartão?"))
+    
+    assert first["response"].startswith(RAGService.FALLBACK_MESSAGE)
+    assert "O PIX é sempre gratuito" in first["response"]
+    assert first["sources"] == ["pix.txt"]
+    assert "anuidade grátis" in second["response"]
+    assert len(completions.failures) == 1
+    llm_status = rag_service.get_status()["llm"]
+    assert llm_status["circuit_breaker"]["state"] == "open"
+    assert llm_status["rejected"] == 1
+    assert rag_service.answer_cache.stats()["entries"] == 0
+
+
+def test_process_files_reindexes_only_changed_files(rag_service, documents_folder):
+    first = rag_service.process_files()
+    assert sorted(first["processed_files"]) == ["cartoes.md", "pix.txt", "taxas.csv"]
+    version = rag_service.index_version
+    
+    unchanged = rag_service.process_files()
+    assert unchanged["processed_files"] == []
+    assert rag_service.index_version == version
+    
+    (documents_folder / "pix.txt").write_text("O boleto custa pouco.", encoding="utf-8")
+    (documents_folder / "taxas.csv").unlink()
+    (documents_folder / "novo.txt").write_text("Consórcio de imóveis.", encoding="utf-8")
+    
+    updated = rag_service.process_files()
+    
+    assert sorted(updated["processed_files"]) == ["novo.txt", "pix.txt"]
+    assert updated["removed_files"] == ["taxas.csv"]
+    assert rag_service.index_version == version + 1
+    assert rag_service.index.search(tokenize("pix"), k=5) == []
+    assert rag_service.index.search(tokenize("empréstimo"), k=5) == []
+    assert len(rag_service.index.search(tokenize("boleto consórcio"), k=5)) == 2
+    assert set(rag_service.index.doc_lengths) == set(rag_service.chunks)
+
+
+def test_unreadable_files_are_retried_only_once_changed(rag_service, documents_folder, monkeypatch):
+    broken = documents_folder / "tarifas.txt"
+    broken.write_bytes(b"Tarifa do boleto: \xff\xfe")
+    process_files = rag_service.process_files
+    results = []
+    monkeypatch.setattr(rag_service, "process_files", lambda: results.append(process_files()) or results[-1])
+    
+    for question in ["O pix é gratuito?", "Qual a anuidade do cartão?", "Quanto custa o boleto?"]:
+        asyncio.run(rag_service.chat(question))
+    
+    assert len(results) == 1
+    assert [error.split(":")[0] for error in results[0]["errors"]] == ["tarifas.txt"]
+    assert sorted(rag_service.manifest) == ["cartoes.md", "pix.txt", "taxas.csv"]
+    # Rereported, not reread, by an explicit run
+    assert process_files()["errors"] == results[0]["errors"]
+    
+    broken.write_text("Tarifa do boleto: isenta.", encoding="utf-8")
+    asyncio.run(rag_service.chat("Quanto custa o boleto?"))
+    assert results[-1]["processed_files"] == ["tarifas.txt"]
+    assert rag_service.failed_files == {}
+    
+    # Broken, then back to the indexed text: nothing left to retry
+    broken.write_bytes(b"Tarifa do boleto: \xff\xfe")
+    asyncio.run(rag_service.chat("Quanto custa o boleto?"))
+    broken.write_text("Tarifa do boleto: isenta.", encoding="utf-8")
+    asyncio.run(rag_service.chat("Quanto custa o boleto?"))
+    assert rag_service.failed_files == {}
+    assert not rag_service._has_new_files()
+
+
+def test_files_become_searchable_only_once_fully_read(rag_service, documents_folder, monkeypatch):
+    rag_service.process_files()
+    (documents_folder / "boleto.txt").write_text(
+        "\n\n".join(f"O boleto número {i} vence amanhã." for i in range(30)), encoding="utf-8"
+    )
+    rag_service.chunker = Chunker(chunk_size=60, overlap=0)
+    rag_service.ingest_batch_chunks = 4
+    ingest = rag_service._ingest_files
+    hits = []
+    
+    def observed(files):
+        for event in ingest(files):
+            yield event
+            hits.append((type(event), rag_service._retrieve("boleto")))
+    
+    monkeypatch.setattr(rag_service, "_ingest_files", observed)
+    assert rag_service.process_files()["processed_files"] == ["boleto.txt"]
+    
+    assert [kind for kind, _ in hits].count(IngestedBatch) > 1
+    assert all(not found for kind, found in hits if kind is IngestedBatch)
+    assert hits[-1][0] is IngestedFile and hits[-1][1]
+    assert not rag_service._staged
+    assert set(rag_service.index.doc_lengths) == set(rag_service.chunks)
+
+
+def test_process_files_indexes_registered_formats(rag_service, documents_folder):
+    (documents_folder / "consorcio.html").write_text(
+        "<h1>Consórcio</h1><p>Carta de crédito para imóveis.</p>", encoding="utf-8"
+    )
+    (documents_folder / "atendimentos.ndjson").write_text(
+        '{"canal": "app", "assunto": "seguro residencial"}\n', encoding="utf-8"
+    )
+    (documents_folder / "ignorado.bin").write_bytes(b"\x00\x01")
+    
+    result = rag_service.process_files()
+    
+    assert {"consorcio.html", "atendimentos.ndjson"} <= set(result["processed_files"])
+    assert "ignorado.bin" not in rag_service.manifest
+    sources = {rag_service.chunks[chunk_id].source for chunk_id, _ in rag_service._retrieve("seguro residencial")}
+    assert "atendimentos.ndjson" in sources
+
+
+def test_parallel_ingestion_builds_the_same_index(rag_env, documents_folder, monkeypatch):
+    for i in range(4):
+        (documents_folder / f"extra_{i}.txt").write_text(f"Documento extra {i} sobre consórcio.", encoding="utf-8")
+    
+    serial = make_service(documents_folder)
+    serial.index_path = str(documents_folder.parent / "serial.bin")
+    serial.ingest_workers = 1
+    serial.process_files()
+    
+    parallel = make_service(documents_folder)
+    parallel.index_path = str(documents_folder.parent / "parallel.bin")
+    parallel.ingest_workers = 2
+    parallel.ingest_parallel_min_files = 1
+    result = parallel.process_files()
+    
+    assert result["errors"] == []
+    assert parallel.manifest.keys() == serial.manifest.keys()
+    assert {c.text for c in parallel.chunks.values()} == {c.text for c in serial.chunks.values()}
+    assert sorted(parallel.tables) == ["taxas.csv"]
+    question = tokenize("consórcio de imóveis")
+    assert [round(s, 4) for _, s in parallel.index.search(question, k=5)] == \
+        [round(s, 4) for _, s in serial.index.search(question, k=5)]
+    assert [round(s, 4) for _, s in parallel.vectors.search(question, k=5)] == \
+        [round(s, 4) for _, s in serial.vectors.search(question, k=5)]
+
+
+def test_persisted_index_is_memory_mapped_on_startup(rag_service, documents_folder, monkeypatch):
+    rag_service.process_files()
+    expected = rag_service.index.search(tokenize("cartão crédito anuidade"), k=3)
+    
+    warm = make_service(documents_folder)
+    monkeypatch.setattr(warm, "_ingest_files", lambda files: pytest.fail("file re-read") if files else [])
+    
+    assert isinstance(warm.index, MappedIndex)
+    assert warm.process_files()["processed_files"] == []
+    assert warm.index.search(tokenize("cartão crédito anuidade"), k=3) == expected
+    assert warm.vectors.search(tokenize("cartões"), k=3) == rag_service.vectors.search(tokenize("cartões"), k=3)
+    assert {i: warm.chunks[i] for i in warm.chunks} == rag_service.chunks
+    assert warm.manifest == rag_service.manifest
+    assert warm.tables == rag_service.tables
+
+
+def test_corrupt_persisted_index_falls_back_to_a_rebuild(rag_service, documents_folder):
+    rag_service.process_files()
+    path = rag_service.index_path
+    with open(path, "rb") as file:
+        data = file.read()
+    meta_offset = HEADER.unpack_from(data)[3]
+    
+    with open(path, "wb") as file:
+        file.write(data[:meta_offset] + b"\xff" + data[meta_offset + 1:])
+    assert load_index(path) is None
+    with open(path, "wb") as file:
+        file.write(data[:len(data) // 2])
+    assert load_index(path) is None
+    
+    rebuilt = make_service(documents_folder)
+    assert not isinstance(rebuilt.index, MappedIndex)
+    assert rebuilt.process_files()["processed_files"]
+    assert isinstance(load_index(path), MappedIndex)
+
+
+def test_persisted_index_picks_up_changes_from_other_workers(rag_service, documents_folder):
+    rag_service.process_files()
+    other = make_service(documents_folder)
+    
+    (documents_folder / "pix.txt").write_text("Consórcio de imóveis.", encoding="utf-8")
+    rag_service.process_files()
+    
+    other.process_files()
+    
+    assert isinstance(other.index, MappedIndex)
+    assert other.index_version == rag_service.index_version
+    assert len(other.index.search(tokenize("consórcio"), k=3)) == 1
+
+
+def test_app_imports_without_openai_or_credentials():
+    code = (
+        "import sys\n"
+        "from app.interface import app\n"
+        "assert 'openai' not in sys.modules\n"
+    )
+    env = {key: value for key, value in os.environ.items() if key != "OPENAI_API_KEY"}
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+    
+    assert result.returncode == 0, result.stderr
+
+
+def test_rag_routes_report_unavailable_without_credentials(client, monkeypatch):
+    from app.interface.routes import rag
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(rag, "_rag_service", None)
+    
+    assert client.get("/api/v1/rag/status").status_code == 503
+    assert client.get("/health").status_code == 200
+
+
+def test_warm_up_builds_the_index_in_the_background(rag_env, documents_folder, monkeypatch):
+    from app.interface.routes import rag
+    monkeypatch.setenv("RAG_WATCH", "false")
+    monkeypatch.setattr(rag, "_rag_service", make_service(documents_folder))
+    
+    rag.start_rag_warm_up().join(timeout=10)
+    
+    assert rag.get_rag_service().get_status()["files_count"] == 3
+
+
+def test_warm_up_failures_are_logged_with_traceback(rag_env, documents_folder, monkeypatch, caplog):
+    from app.interface.routes import rag
+    monkeypatch.setenv("RAG_WATCH", "false")
+    service = make_service(documents_folder)
+    monkeypatch.setattr(service, "warm_up", lambda: 1 / 0)
+    monkeypatch.setattr(rag, "_rag_service", service)
+    
+    rag.start_rag_warm_up().join(timeout=10)
+    
+    record = next(r for r in caplog.records if r.name == rag.__name__)
+    assert record.levelname == "ERROR" and record.exc_info[0] is ZeroDivisionError
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_polling_watcher_debounces_bursts(tmp_path):
+    calls = []
+    watcher = DocumentWatcher(
+        str(tmp_path), lambda: calls.append(time.monotonic()),
+        debounce_seconds=0.1, poll_interval=0.02, backend="polling"
+    )
+    watcher.start()
+    try:
+        assert watcher.wait_ready(5)
+        for i in range(5):
+            (tmp_path / f"doc{i}.txt").write_text("conteúdo", encoding="utf-8")
+            time.sleep(0.01)
+        (tmp_path / "ignored.bin").write_bytes(b"x")
+        
+        wait_for(lambda: len(calls) == 2)
+        time.sleep(0.3)
+        assert len(calls) == 2
+        assert watcher.stats()["backend"] == "polling"
+    finally:
+        watcher.stop()
+    
+    assert not watcher.running
+
+
+def test_watched_chat_does_no_filesystem_calls(rag_service, documents_folder, monkeypatch):
+    monkeypatch.setenv("RAG_WATCH_BACKEND", "polling")
+    monkeypatch.setenv("RAG_WATCH_POLL_SECONDS", "0.02")
+    monkeypatch.setenv("RAG_WATCH_DEBOUNCE_SECONDS", "0.05")
+    watcher = rag_service.start_watching()
+    try:
+        assert watcher.wait_ready(5)
+        version = rag_service.index_version
+        
+        from app.application.services import rag_service as module
+        touched = []
+        def recording(function):
+            def wrapper(*args, **kwargs):
+                if threading.current_thread().name != "rag-watcher":
+                    touched.append(function.__name__)
+                return function(*args, **kwargs)
+            return wrapper
+        
+        with pytest.MonkeyPatch.context() as patch:
+            for target, name in ((module.os, "stat"), (module.os.path, "exists"), (module.glob, "glob")):
+                patch.setattr(target, name, recording(getattr(target, name)))
+            result = asyncio.run(rag_service.chat("O pix é gratuito?"))
+        
+        assert result["sources"] == ["pix.txt"]
+        assert touched == []
+        
+        (documents_folder / "consorcio.txt").write_text("Consórcio de imóveis sem juros.", encoding="utf-8")
+        wait_for(lambda: rag_service.index_version > version)
+        
+        result = asyncio.run(rag_service.chat("Como funciona o consórcio de imóveis?"))
+        assert result["sources"][0] == "consorcio.txt"
+    finally:
+        rag_service.stop_watching()
+
+
+def test_chat_about_one_product_injects_only_its_row(rag_service):
+    result = asyncio.run(rag_service.chat("Qual a taxa do TED para outros bancos?"))
+    prompt = rag_service.client.chat.completions.calls[0]["messages"][1]["content"]
+    
+    assert result["sources"][0] == "taxas.csv"
+    assert "TED Outros Bancos" in prompt
+    assert "Empréstimo Pessoal" not in prompt
+    assert rag_service.get_status()["tables"]["taxas.csv"]["columns"]["Taxa_Mensal"] == "number"
+
+
+def test_chat_filters_csv_rows_by_column(rag_service):
+    asyncio.run(rag_service.chat("Quais taxas?", filters={"Taxa_Mensal": {"lt": 5}}))
+    prompt = rag_service.client.chat.completions.calls[0]["messages"][1]["content"]
+    
+    assert "Empréstimo Pessoal" in prompt
+    assert "TED Outros Bancos" not in prompt
+
+
+def test_conversation_memory_caps_turns_and_rolls_a_summary():
+    memory = ConversationMemory(max_turns=2, token_budget=1000)
+    for i in range(4):
+        memory.append("s1", f"Pergunta {i}?", f"Resposta {i}. Detalhes que não entram no resumo.")
+    
+    messages = memory.messages("s1")
+    
+    assert messages[0]["role"] == "system"
+    assert "- Pergunta 0? -> Resposta 0." in messages[0]["content"]
+    assert "Detalhes" not in messages[0]["content"]
+    assert [m["content"] for m in messages[1:] if m["role"] == "user"] == ["Pergunta 2?", "Pergunta 3?"]
+    assert memory.messages("outra") == []
+
+
+def test_conversation_memory_evicts_idle_and_least_recent_sessions(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.application.services.rag_memory.time.monotonic", lambda: now[0])
+    memory = ConversationMemory(max_sessions=2, idle_seconds=60)
+    
+    memory.append("a", "q", "r")
+    memory.append("b", "q", "r")
+    memory.messages("a")
+    memory.append("c", "q", "r")
+    
+    assert memory.messages("b") == []
+    assert memory.messages("a") != []
+    
+    now[0] += 61
+    assert memory.stats()["sessions"] == 0
+    assert memory.stats()["evicted_idle"] == 2
+    assert memory.stats()["evicted_lru"] == 1
+
+
+def test_chat_feeds_previous_turns_of_the_same_session(rag_service):
+    calls = rag_service.client.chat.completions.calls
+    
+    asyncio.run(rag_service.chat("O pix é gratuito?", session_id="cliente-1"))
+    asyncio.run(rag_service.chat("E para empresas?", session_id="cliente-1"))
+    asyncio.run(rag_service.chat("E para empresas?", session_id="cliente-2"))
+    
+    follow_up = calls[1]["messages"]
+    assert [m["role"] for m in follow_up] == ["system", "user", "assistant", "user"]
+    assert follow_up[1]["content"] == "O pix é gratuito?"
+    assert follow_up[2]["content"] == "Resposta de teste"
+    assert len(calls[2]["messages"]) == 2
+    assert rag_service.get_status()["memory"]["sessions"] == 2